@@ -5,20 +5,79 @@ Auditor Raw v5.9.1 – O Filtro de Pureza
 - Verificação de Cobertura de Timestamps
 - Validação de Sequência Temporal (Garante que o tempo não volta atrás)
 - Prevenção de desperdício de tokens em transcrições ruins
+- Uma leitura e uma varredura: todas as métricas saem do mesmo fluxo de tokens
 """
-import re
 import json
 from pathlib import Path
 from src.utils.io import read_json, write_json
 from src.utils.time import parse_timestamp
+from src.utils.tokens import TS, Token, WordCounter, tokenize
 
 # Caminhos de Trabalho
 RAW_PATH = Path("work/transcripts/raw_transcript.txt")
 META_PATH = Path("work/transcripts/.meta/transcription_stats.json")
 AUDIT_PATH = Path("work/audit/auditoria_raw.json")
 
-# Regex aprimorada: Captura [H:MM:SS] ou [HH:MM:SS]
-TS_REGEX = re.compile(r"\[(\d{1,2}:\d{2}:\d{2})\]")
+class RawAudit:
+    """
+    Transformação de auditoria: consome cada token uma vez e acumula palavras,
+    timestamps e a checagem de cronologia (nada de findall/sub sobre o texto inteiro).
+    """
+    def __init__(self):
+        self.words = WordCounter()
+        self.ts_count = 0
+        self.sequential = True
+        self._last_seconds = None
+
+    def feed(self, tok: Token):
+        if tok.kind != TS:
+            # Os timestamps não entram na contagem: só as palavras faladas
+            self.words.feed(tok.text)
+            return
+
+        self.ts_count += 1
+        secs = parse_timestamp(tok.value)
+        if secs is None:
+            return
+        # Garante que um erro no Whisper não fez o tempo 'saltar' para trás
+        if self._last_seconds is not None and self._last_seconds > secs:
+            self.sequential = False
+        self._last_seconds = secs
+
+    def report(self, meta: dict, min_wpm: float = 25.0, min_ts_per_minute: float = 0.5) -> dict:
+        """Aplica os critérios de qualidade às métricas acumuladas."""
+        word_count = self.words.count
+        duration_min = max(1, meta.get("coverage_seconds", 1) / 60.0)
+        wpm = word_count / duration_min
+        ts_density = self.ts_count / duration_min
+
+        ok_density = wpm >= min_wpm
+        ok_timestamps = ts_density >= min_ts_per_minute
+        ok_sequence = self.sequential
+
+        result = {
+            "ok": ok_density and ok_timestamps and ok_sequence,
+            "metrics": {
+                "wpm": round(wpm, 2),
+                "ts_per_minute": round(ts_density, 2),
+                "word_count": word_count,
+                "duration_minutes": round(duration_min, 2)
+            },
+            "checks": {
+                "density_pass": ok_density,
+                "timestamps_pass": ok_timestamps,
+                "sequence_pass": ok_sequence
+            }
+        }
+
+        # Registro de motivos de reprovação
+        if not result["ok"]:
+            reasons = []
+            if not ok_density: reasons.append(f"Densidade de fala muito baixa ({wpm:.1f} WPM)")
+            if not ok_timestamps: reasons.append(f"Faltam marcadores de tempo ({ts_density:.2f}/min)")
+            if not ok_sequence: reasons.append("Erro de cronologia (timestamps fora de ordem)")
+            result["reasons"] = reasons
+        return result
 
 def audit_or_fix(min_wpm: float = 25.0, min_ts_per_minute: float = 0.5) -> dict:
     """
@@ -35,59 +94,13 @@ def audit_or_fix(min_wpm: float = 25.0, min_ts_per_minute: float = 0.5) -> dict:
     # 1. Carregamento dos dados
     text = RAW_PATH.read_text(encoding="utf-8")
     meta = read_json(META_PATH, {})
-    
-    # 2. Extração e Validação de Timestamps
-    timestamps = TS_REGEX.findall(text)
-    ts_seconds = [parse_timestamp(t) for t in timestamps]
-    # Remove eventuais Nones de falha de parse
-    ts_seconds = [t for t in ts_seconds if t is not None]
-
-    # 3. Cálculo de Densidade de Palavras
-    # Remove os timestamps para contar apenas as palavras faladas
-    clean_text = TS_REGEX.sub("", text)
-    word_count = len(clean_text.split())
-    
-    duration_min = max(1, meta.get("coverage_seconds", 1) / 60.0)
-    wpm = word_count / duration_min
-    ts_density = len(timestamps) / duration_min
-
-    # 4. Checagem de Sequência Temporal (Crítico!)
-    # Garante que um erro no Whisper não fez o tempo 'saltar' para trás
-    is_sequential = True
-    if len(ts_seconds) > 1:
-        for i in range(len(ts_seconds) - 1):
-            if ts_seconds[i] > ts_seconds[i + 1]:
-                is_sequential = False
-                break
-
-    # 5. Verificação de Critérios de Qualidade
-    ok_density = wpm >= min_wpm
-    ok_timestamps = ts_density >= min_ts_per_minute
-    ok_sequence = is_sequential
-
-    result = {
-        "ok": ok_density and ok_timestamps and ok_sequence,
-        "metrics": {
-            "wpm": round(wpm, 2),
-            "ts_per_minute": round(ts_density, 2),
-            "word_count": word_count,
-            "duration_minutes": round(duration_min, 2)
-        },
-        "checks": {
-            "density_pass": ok_density,
-            "timestamps_pass": ok_timestamps,
-            "sequence_pass": ok_sequence
-        }
-    }
 
-    # Registro de motivos de reprovação
-    if not result["ok"]:
-        reasons = []
-        if not ok_density: reasons.append(f"Densidade de fala muito baixa ({wpm:.1f} WPM)")
-        if not ok_timestamps: reasons.append(f"Faltam marcadores de tempo ({ts_density:.2f}/min)")
-        if not ok_sequence: reasons.append("Erro de cronologia (timestamps fora de ordem)")
-        result["reasons"] = reasons
+    # 2. Varredura única: densidade, cobertura e sequência temporal de uma vez
+    audit = RawAudit()
+    for tok in tokenize(text):
+        audit.feed(tok)
 
+    result = audit.report(meta, min_wpm, min_ts_per_minute)
     write_json(AUDIT_PATH, result)
     return result
 
@@ -5,50 +5,61 @@ Auditor Reparador v5.9.1 – O Cirurgião de Acabamento
 - Normalização de timestamps para o padrão canônico
 - Limpeza de resíduos de Markdown (Code Blocks)
 - Saneamento de Shortcodes WordPress ([note], [hk_passage])
+- Transformação em fluxo sobre o tokenizer compartilhado: uma varredura em vez de um re.sub por regra
 """
-import re
 import json
 from pathlib import Path
 from src.utils.io import write_json
 from src.utils.time import normalize_timestamp
+from src.utils.tokens import FENCE, SHORTCODE, TS, TS_GUARDED, Token, tokenize
 
 # Caminhos de Entrada e Saída
 INP_PATH = Path("work/edited/edited.txt")
 OUT_PATH = Path("work/edited/edited_repaired.txt")
 REPORT_PATH = Path("work/audit/repair_report.json")
 
-# Regex para detectar timestamps blindados e normais
-GUARDED_TS = re.compile(r"⟦(\d{1,2}:\d{2}:\d{2})⟧")
-NORMAL_TS = re.compile(r"\[(\d{1,2}:\d{2}:\d{2})\]")
-
-def _restore_timestamps(text: str) -> tuple[str, int]:
-    """Converte ⟦H:MM:SS⟧ de volta para [H:MM:SS] normalizado."""
-    count = 0
-
-    def replacer(m):
-        nonlocal count
-        count += 1
-        # Normaliza o tempo (ex: 0:5:9 -> 0:05:09) para consistência visual no WP
-        ts = normalize_timestamp(m.group(1))
-        return f"[{ts}]"
-
-    # Substitui a blindagem por colchetes padrão
-    result = GUARDED_TS.sub(replacer, text)
-    return result, count
-
-def _sanitize_markdown_and_shortcodes(text: str) -> str:
-    """Remove ruídos de formatação e corrige espaçamento de shortcodes."""
-    # 1. Remove blocos de código markdown caso a IA tenha incluído (ex: ```text)
-    text = re.sub(r"```[a-z]*", "", text)
-    text = text.replace("```", "")
-
-    # 2. Normaliza Shortcodes (remove espaços internos que quebram o plugin WP)
-    text = re.sub(r"\[\s*note\s*\]", "[note]", text)
-    text = re.sub(r"\[\s*/\s*note\s*\]", "[/note]", text)
-    text = re.sub(r"\[\s*hk_passage\s*\]", "[hk_passage]", text)
-    text = re.sub(r"\[\s*/\s*hk_passage\s*\]", "[/hk_passage]", text)
-    
-    return text.strip()
+# Shortcodes que o plugin WP só reconhece sem espaços internos
+CANONICAL_SHORTCODES = ("note", "hk_passage")
+
+class Repairer:
+    """
+    Reparo token a token: devolve o texto que cada token deve emitir e conta os timestamps.
+    Transformações posteriores da cadeia (REFs, mineração) recebem o que ele emite.
+    """
+    def __init__(self):
+        self.guarded = 0
+        self.restored = 0
+        self.final_ts = 0
+
+    def feed(self, tok: Token, piece: str) -> str:
+        if tok.kind == TS_GUARDED:
+            # Converte ⟦H:MM:SS⟧ de volta para [H:MM:SS] normalizado (ex: 0:5:9 -> 0:05:09)
+            self.guarded += 1
+            self.restored += 1
+            self.final_ts += 1
+            return f"[{normalize_timestamp(tok.value)}]"
+        if tok.kind == TS:
+            self.final_ts += 1
+            return piece
+        if tok.kind == FENCE:
+            # Blocos de código markdown caso a IA tenha incluído (ex: ```text)
+            return ""
+        if tok.kind == SHORTCODE and tok.name in CANONICAL_SHORTCODES and not tok.attrs:
+            # Remove espaços internos que quebram o plugin WP
+            return f"[/{tok.name}]" if tok.closing else f"[{tok.name}]"
+        return piece
+
+    def report(self, output_file: Path) -> dict:
+        return {
+            "ok": True,
+            "timestamps": {
+                "found_guarded": self.guarded,
+                "restored_to_brackets": self.restored,
+                "final_count": self.final_ts
+            },
+            "integrity": "EXCELENTE" if self.guarded == self.restored else "DIVERGENTE",
+            "output_file": str(output_file)
+        }
 
 def run_repair() -> dict:
     """Executa a rotina de reparo e gera relatório de integridade."""
@@ -60,32 +71,14 @@ def run_repair() -> dict:
 
     content = INP_PATH.read_text(encoding="utf-8")
 
-    # 1. Auditoria inicial de tags
-    guarded_count = len(GUARDED_TS.findall(content))
-    
-    # 2. Restauração e Normalização
-    text, restored_count = _restore_timestamps(content)
-    
-    # 3. Limpeza Final
-    final_text = _sanitize_markdown_and_shortcodes(text)
-
-    # 4. Auditoria Final
-    final_ts_count = len(NORMAL_TS.findall(final_text))
+    # Restauração, normalização e limpeza numa única varredura
+    repairer = Repairer()
+    final_text = "".join(repairer.feed(tok, tok.text) for tok in tokenize(content)).strip()
 
     # Salva o arquivo pronto para o Merger ou para o WordPress
     OUT_PATH.write_text(final_text, encoding="utf-8")
 
-    report = {
-        "ok": True,
-        "timestamps": {
-            "found_guarded": guarded_count,
-            "restored_to_brackets": restored_count,
-            "final_count": final_ts_count
-        },
-        "integrity": "EXCELENTE" if guarded_count == restored_count else "DIVERGENTE",
-        "output_file": str(OUT_PATH)
-    }
-
+    report = repairer.report(OUT_PATH)
     write_json(REPORT_PATH, report)
     return report
 
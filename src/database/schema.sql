@@ -37,13 +37,18 @@ CREATE TABLE vana_passagens (
     hook TEXT,                           -- A frase de impacto para a legenda do Reel
     content TEXT NOT NULL,               -- O conteúdo do fragmento
     timestamp_start TEXT,                -- O tempo exato ⟦HH:MM:SS⟧ no vídeo
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    content_hash TEXT GENERATED ALWAYS AS (md5(content)) STORED, -- Identidade do fragmento
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    -- Reprocessar a aula atualiza a passagem em vez de duplicá-la
+    CONSTRAINT uq_passagens_aula_hash UNIQUE (aula_id, content_hash)
 );
 
 -- 5. ÍNDICES PARA PERFORMANCE
 CREATE INDEX idx_passagens_reel ON vana_passagens(is_reel) WHERE is_reel = TRUE;
 CREATE INDEX idx_passagens_type ON vana_passagens(type);
 CREATE INDEX idx_conceitos_slug ON vana_conceitos(slug);
+-- Sincronização incremental do vocabulário (marca d'água em updated_at)
+CREATE INDEX idx_conceitos_updated_at ON vana_conceitos(updated_at);
 
 -- 6. TRIGGER PARA ATUALIZAR O updated_at AUTOMATICAMENTE
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -59,7 +64,74 @@ CREATE TRIGGER update_vana_conceitos_updated_at
     FOR EACH ROW
     EXECUTE PROCEDURE update_updated_at_column();
 
--- 7. POLÍTICAS DE SEGURANÇA (RLS)
+-- 7. PERSISTÊNCIA TRANSACIONAL (RPC)
+-- Aula + passagens numa única chamada e numa única transação (supabase.rpc("vana_save_aula")).
+-- Campos presentes em p_aula sobrescrevem; ausentes preservam o valor salvo.
+-- Passagens são deduplicadas por (aula_id, content_hash): reprocessar não cria linhas novas.
+-- p_replace: p_passagens é o conjunto completo da aula; as que não vieram (ex.: após uma
+-- reedição pela IA) são removidas na mesma transação.
+CREATE OR REPLACE FUNCTION vana_save_aula(p_aula JSONB, p_passagens JSONB DEFAULT '[]'::jsonb,
+                                          p_replace BOOLEAN DEFAULT FALSE)
+RETURNS JSONB AS $$
+DECLARE
+    v_aula_id UUID;
+    v_saved INTEGER;
+BEGIN
+    IF p_aula->>'wp_post_id' IS NULL THEN
+        RAISE EXCEPTION 'vana_save_aula: wp_post_id é obrigatório';
+    END IF;
+
+    INSERT INTO vana_aulas (wp_post_id, title, video_url_original, archive_url,
+                            gdrive_folder_id, status, transcription_raw)
+    VALUES ((p_aula->>'wp_post_id')::INTEGER, p_aula->>'title', p_aula->>'video_url_original',
+            p_aula->>'archive_url', p_aula->>'gdrive_folder_id',
+            COALESCE(p_aula->>'status', 'draft'), p_aula->>'transcription_raw')
+    ON CONFLICT (wp_post_id) DO UPDATE SET
+        title = CASE WHEN p_aula ? 'title' THEN EXCLUDED.title ELSE vana_aulas.title END,
+        video_url_original = CASE WHEN p_aula ? 'video_url_original' THEN EXCLUDED.video_url_original ELSE vana_aulas.video_url_original END,
+        archive_url = CASE WHEN p_aula ? 'archive_url' THEN EXCLUDED.archive_url ELSE vana_aulas.archive_url END,
+        gdrive_folder_id = CASE WHEN p_aula ? 'gdrive_folder_id' THEN EXCLUDED.gdrive_folder_id ELSE vana_aulas.gdrive_folder_id END,
+        status = CASE WHEN p_aula ? 'status' THEN EXCLUDED.status ELSE vana_aulas.status END,
+        transcription_raw = CASE WHEN p_aula ? 'transcription_raw' THEN EXCLUDED.transcription_raw ELSE vana_aulas.transcription_raw END
+    RETURNING id INTO v_aula_id;
+
+    IF p_replace THEN
+        DELETE FROM vana_passagens
+        WHERE aula_id = v_aula_id
+          AND content_hash NOT IN (
+              SELECT md5(p->>'content') FROM jsonb_array_elements(p_passagens) AS t(p)
+              WHERE COALESCE(p->>'content', '') <> '');
+    END IF;
+
+    -- DISTINCT ON: um mesmo conteúdo repetido no lote fica com a última ocorrência
+    -- (o ON CONFLICT não pode tocar a mesma linha duas vezes no mesmo comando)
+    INSERT INTO vana_passagens (aula_id, type, is_reel, hook, content, timestamp_start)
+    SELECT DISTINCT ON (md5(p->>'content'))
+           v_aula_id, COALESCE(p->>'type', 'tattva'), COALESCE((p->>'is_reel')::BOOLEAN, FALSE),
+           p->>'hook', p->>'content', p->>'timestamp_start'
+    FROM jsonb_array_elements(p_passagens) WITH ORDINALITY AS t(p, ord)
+    WHERE COALESCE(p->>'content', '') <> ''
+    ORDER BY md5(p->>'content'), ord DESC
+    ON CONFLICT (aula_id, content_hash) DO UPDATE SET
+        type = EXCLUDED.type,
+        is_reel = EXCLUDED.is_reel,
+        hook = EXCLUDED.hook,
+        timestamp_start = EXCLUDED.timestamp_start;
+    GET DIAGNOSTICS v_saved = ROW_COUNT;
+
+    RETURN jsonb_build_object('aula_id', v_aula_id, 'passagens', v_saved);
+END;
+$$ language 'plpgsql';
+
+-- Migração de bancos já existentes (remove duplicatas antes de criar a chave única):
+-- ALTER TABLE vana_passagens ADD COLUMN content_hash TEXT GENERATED ALWAYS AS (md5(content)) STORED;
+-- DELETE FROM vana_passagens a USING vana_passagens b
+--     WHERE a.aula_id = b.aula_id AND a.content_hash = b.content_hash AND a.ctid < b.ctid;
+-- ALTER TABLE vana_passagens ADD CONSTRAINT uq_passagens_aula_hash UNIQUE (aula_id, content_hash);
+-- Versão anterior do RPC (sem p_replace): remover para não deixar a chamada ambígua
+-- DROP FUNCTION IF EXISTS vana_save_aula(JSONB, JSONB);
+
+-- 8. POLÍTICAS DE SEGURANÇA (RLS)
 -- Como o GitHub Actions e o WordPress usarão a Service Role, 
 -- habilitamos acesso total para a nossa API privada.
 ALTER TABLE vana_conceitos ENABLE ROW LEVEL SECURITY;
@@ -5,14 +5,52 @@ Editor Vaishnava v6.3 Diamond – O Escriba de Shortcodes
 - Vocabulário Dinâmico: Sincronizado via Supabase.
 - Fábrica de Reels: Identificação de trechos virais.
 - Taxonomia Universal: Uso do container [hk_passage].
+- Map-Reduce: aulas longas são editadas em janelas paralelas e costuradas.
+- Prompt Caching: prefixo estático memoizado localmente e marcado para cache no provedor
+  quando atinge o tamanho mínimo cacheável.
+- Vocabulário Podado: só os conceitos presentes no trecho entram no prompt (Aho-Corasick).
+- Streaming: texto salvo em work/edited/ enquanto chega; geração abortada assim que
+  um timestamp falta ou sai de ordem.
 """
 
 import os
 import re
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple
 import anthropic
+from src.utils.io import merge_stats
+from src.utils.ledger import BudgetExceeded, BudgetLedger, Usage, estimate_cost
+from src.utils.matcher import get_matcher
+from src.utils.vocabulary import VocabularyStore
+from src.utils.stream_guard import TimestampTracker, TimestampIntegrityError, StreamWriter, partial_usage
+
+# Timestamp protegido ⟦HH:MM:SS⟧ (fronteira natural de parágrafo)
+GUARDED_TS = re.compile(r"⟦\d{1,2}:\d{2}:\d{2}⟧")
+# Fronteira de frase (ou de linha) para partir parágrafos maiores que a janela.
+# O grupo captura o separador: os pedaços são recosturados com ele, não com linha em branco
+SENTENCE_BREAK = re.compile(r"((?<=[.!?…])\s+|\s*\n\s*)")
+WORD_BREAK = re.compile(r"(\s+)")
+# Separador entre parágrafos (fronteiras ⟦HH:MM:SS⟧ ou linhas em branco)
+PARAGRAPH_SEP = "\n\n"
+
+# Edição em janelas: acima deste tamanho (tokens estimados) o texto é fatiado
+WINDOW_TOKENS = int(os.getenv("VANA_EDITOR_WINDOW_TOKENS", "2000"))
+WINDOW_OVERLAP = int(os.getenv("VANA_EDITOR_WINDOW_OVERLAP", "1"))  # parágrafos de contexto de cada lado
+EDITOR_CONCURRENCY = int(os.getenv("VANA_EDITOR_CONCURRENCY", "4"))
+EDITOR_MAX_TOKENS = 4000
+EDITOR_ATTEMPTS = 2  # gerações por trecho antes de entregar à auditoria final
+# Streaming: persistência incremental e aborto precoce por integridade de timestamps
+EDITOR_STREAM = os.getenv("VANA_EDITOR_STREAM", "false").lower() == "true"
+
+# O provedor ignora o cache_control de prefixos abaixo deste tamanho (1024 tokens no
+# Sonnet/Opus, 2048 no Haiku): sem atingi-lo, marcar o bloco e aquecer o cache não rende nada
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("VANA_PROMPT_CACHE_MIN_TOKENS", "1024"))
+
+# Memo do prefixo estático do system prompt: idioma -> prompt (o vocabulário fica fora dele)
+_PROMPT_MEMO: Dict[str, str] = {}
 
 class VanaEditor:
     def __init__(self, dicionario: Optional[Dict] = None):
@@ -29,8 +67,20 @@ class VanaEditor:
             raise EnvironmentError("❌ ANTHROPIC_API_KEY não configurada no ambiente.")
         self.client = anthropic.Anthropic(api_key=api_key)
 
-        # 3. Vocabulário da Sangha (Vindo do Supabase)
-        self.dicionario = dicionario or {}
+        # 3. Vocabulário da Sangha (snapshot local do Supabase) + autômato de busca (um por versão)
+        self.dicionario = dicionario if dicionario is not None else VocabularyStore().concepts()
+        self.matcher = get_matcher(self.dicionario)
+
+        # 4. Contabilidade de tokens (janelas concorrentes somam aqui)
+        self._usage_lock = threading.Lock()
+        self.usage = {"calls": 0, "input_tokens": 0, "output_tokens": 0,
+                      "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0,
+                      "aborted_generations": 0}
+        # Gasto real (pelo usage) no livro-caixa compartilhado, atribuído ao estágio de edição.
+        # Os mesmos tetos do SmartAIWrapper: cada chamada reserva antes e acerta depois
+        self.ledger = BudgetLedger()
+        self.budget_day = float(os.getenv("BUDGET_DAY_USD", "5.0"))
+        self.budget_month = float(os.getenv("BUDGET_MONTH_USD", "100.0"))
 
     def _get_idioma_legivel(self, lang_code: str) -> str:
         """Busca o nome do idioma em um config externo ou env."""
@@ -43,19 +93,43 @@ class VanaEditor:
             return "Português"
 
     def _build_system_prompt(self, target_lang: str) -> str:
+        """Devolve o prefixo estático, renderizando apenas na primeira vez por idioma."""
+        if target_lang not in _PROMPT_MEMO:
+            _PROMPT_MEMO[target_lang] = self._render_system_prompt(target_lang)
+        return _PROMPT_MEMO[target_lang]
+
+    def _prefix_cacheable(self, target_lang: str) -> bool:
+        """O prefixo estático atinge o mínimo do provedor para o cache de prompt?"""
+        return self._estimate_tokens(self._build_system_prompt(target_lang)) >= PROMPT_CACHE_MIN_TOKENS
+
+    def _vocabulary_block(self, text: str) -> str:
+        """Injeção do Vocabulário IAST Dinâmico, restrito aos conceitos que ocorrem no texto."""
+        selected = self.matcher.select(text)
+        if not selected:
+            return ""
+        vocab_str = "\n".join([f"- {slug}: Usar termo '{iast}'" for slug, iast in selected.items()])
+        return f"### 📖 VOCABULÁRIO DA SANGHA (termos presentes neste trecho)\n{vocab_str}"
+
+    def _system_blocks(self, target_lang: str, text: str) -> List[Dict]:
+        """Prefixo estático (cacheável no provedor, se grande o bastante) seguido do vocabulário do trecho."""
+        blocks = [{"type": "text", "text": self._build_system_prompt(target_lang)}]
+        if self._prefix_cacheable(target_lang):
+            blocks[0]["cache_control"] = {"type": "ephemeral"}
+        vocab = self._vocabulary_block(text)
+        if vocab:
+            blocks.append({"type": "text", "text": vocab})
+        return blocks
+
+    def _render_system_prompt(self, target_lang: str) -> str:
         """Constrói o cérebro teológico da IA."""
         idioma = self._get_idioma_legivel(target_lang)
-        
-        # Injeção do Vocabulário IAST Dinâmico
-        vocab_str = "\n".join([f"- {slug}: Usar termo '{iast}'" for slug, iast in self.dicionario.items()])
 
         return f"""
 Você é o Editor-Chefe do Projeto Vana, especialista na preservação da Hari-kathā.
 Sua missão é refinar a transcrição para {idioma}, garantindo a pureza (Vāṇī-Śuddha).
 
 ### 🛡️ 1. CLÁUSULA DE AUTORIDADE E IAST
-Use estritamente estes termos oficiais da nossa Sangha:
-{vocab_str}
+Use estritamente os termos oficiais da nossa Sangha listados na seção VOCABULÁRIO DA SANGHA.
 
 ### 💎 2. TAXONOMIA DIAMOND [hk_passage]
 Encapsule "pérolas" no shortcode universal. Não use shortcodes antigos.
@@ -84,6 +158,233 @@ Tipos Permitidos:
         pattern = r"\[(\d{1,2}:\d{2}:\d{2})\]"
         return re.sub(pattern, r"⟦\1⟧", text)
 
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """Estimativa grosseira (~3 chars/token), suficiente para dimensionar janelas."""
+        return len(text) // 3
+
+    @staticmethod
+    def _split_paragraphs(guarded_text: str) -> List[str]:
+        """Divide o texto nas fronteiras ⟦HH:MM:SS⟧ (cada parágrafo começa com o seu)."""
+        if not GUARDED_TS.search(guarded_text):
+            # Sem timestamps, a linha em branco é a única fronteira confiável
+            return [p.strip() for p in re.split(r"\n\s*\n", guarded_text) if p.strip()]
+        cuts = [m.start() for m in GUARDED_TS.finditer(guarded_text)]
+        if not cuts or cuts[0] != 0:
+            cuts = [0] + cuts
+        bounds = cuts + [len(guarded_text)]
+        parts = [guarded_text[a:b].strip() for a, b in zip(bounds, bounds[1:])]
+        return [p for p in parts if p]
+
+    @classmethod
+    def _split_oversized(cls, paragraph: str, limit: int = WINDOW_TOKENS) -> List[Tuple[str, str]]:
+        """
+        Parte um parágrafo maior que a janela em frases (ou linhas) reagrupadas até o limite.
+        Sem pontuação (ex: um chunk inteiro do STT em texto corrido), corta entre palavras.
+        Devolve pares (pedaço, separador original que o segue; "" no último): concatenados,
+        reproduzem o parágrafo exatamente, quebras de linha internas incluídas.
+        """
+        if cls._estimate_tokens(paragraph) <= limit:
+            return [(paragraph, "")]
+        max_chars = limit * 3
+
+        units = []
+        parts = SENTENCE_BREAK.split(paragraph)
+        for sentence, sep in zip(parts[0::2], parts[1::2] + [""]):
+            if len(sentence) <= max_chars:
+                units.append((sentence, sep))
+                continue
+            words = WORD_BREAK.split(sentence)
+            units.extend(zip(words[0::2], words[1::2] + [sep]))
+
+        pieces, current, sep = [], "", ""
+        for unit, unit_sep in units:
+            if current and len(current) + len(sep) + len(unit) > max_chars:
+                pieces.append((current, sep))
+                current = ""
+            current = f"{current}{sep}{unit}" if current else unit
+            sep = unit_sep
+        pieces.append((current, sep))
+        return pieces
+
+    @staticmethod
+    def _join(pieces: List[Tuple[str, str]]) -> str:
+        """Recostura pedaços com os separadores originais (o do último fica de fora)."""
+        if not pieces:
+            return ""
+        return "".join(text + sep for text, sep in pieces[:-1]) + pieces[-1][0]
+
+    def _build_windows(self, paragraphs: List[str]) -> List[Dict]:
+        """
+        Agrupa parágrafos em janelas limitadas por WINDOW_TOKENS. Cada janela leva
+        WINDOW_OVERLAP parágrafos vizinhos como contexto somente-leitura.
+        Parágrafos maiores que a janela são partidos antes, para nenhuma janela estourar
+        EDITOR_MAX_TOKENS na saída; cada pedaço guarda o separador que o segue, e a janela
+        guarda em "sep" o que a liga à próxima (linha em branco só entre parágrafos).
+        """
+        pieces = []
+        for p in paragraphs:
+            split = self._split_oversized(p)
+            split[-1] = (split[-1][0], PARAGRAPH_SEP)
+            pieces.extend(split)
+        paragraphs = pieces
+        windows, start = [], 0
+        while start < len(paragraphs):
+            end, size = start, 0
+            while end < len(paragraphs) and (end == start or size + self._estimate_tokens(paragraphs[end][0]) <= WINDOW_TOKENS):
+                size += self._estimate_tokens(paragraphs[end][0])
+                end += 1
+            windows.append({
+                "before": paragraphs[max(0, start - WINDOW_OVERLAP):start],
+                "core": paragraphs[start:end],
+                "after": paragraphs[end:end + WINDOW_OVERLAP],
+                "sep": paragraphs[end - 1][1],
+            })
+            start = end
+        return windows
+
+    @staticmethod
+    def _prompt_chars(system_blocks: List[Dict], user_input: str) -> int:
+        return sum(len(b.get("text", "")) for b in system_blocks) + len(user_input)
+
+    def _reserve(self, system_blocks: List[Dict], user_input: str) -> int:
+        """
+        Reserva no ledger o pior caso da chamada (saída no teto EDITOR_MAX_TOKENS), checando o
+        hard-stop diário/mensal de forma atômica. Levanta BudgetExceeded se não couber.
+        """
+        amount = estimate_cost(self.model, self._prompt_chars(system_blocks, user_input), EDITOR_MAX_TOKENS * 3)
+        return self.ledger.reserve(amount, self.budget_day, self.budget_month)
+
+    def _track_usage(self, usage, reservation: Optional[int] = None):
+        """Acumula tokens de entrada/saída e de leitura/escrita do cache do provedor."""
+        with self._usage_lock:
+            self.usage["calls"] += 1
+            for field in ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens"):
+                self.usage[field] += getattr(usage, field, 0) or 0
+        # Troca a reserva pelo custo real
+        self.ledger.settle(reservation, "claude", self.model, Usage.from_response(usage), stage="editing")
+
+    def _call_model(self, system_blocks: List[Dict], user_input: str) -> str:
+        reservation = self._reserve(system_blocks, user_input)
+        try:
+            response = self.client.messages.create(
+                model=self.model,
+                max_tokens=EDITOR_MAX_TOKENS,
+                temperature=self.temperature,
+                # Prefixo estático marcado para cache: janelas e execuções seguintes pagam só a leitura
+                system=system_blocks,
+                messages=[{"role": "user", "content": user_input}]
+            )
+        except BaseException:
+            # A chamada não aconteceu: só libera a reserva
+            self.ledger.settle(reservation)
+            raise
+        self._track_usage(response.usage, reservation)
+        return response.content[0].text
+
+    def _call_model_streaming(self, system_blocks: List[Dict], user_input: str, source: str,
+                              label: str, strict: bool = True) -> str:
+        """
+        Versão em streaming: cada pedaço vai para work/edited/<label>.partial.txt e
+        passa pelo TimestampTracker. Em modo estrito, o primeiro marcador faltante
+        ou fora de ordem encerra a conexão (não pagamos o resto da geração).
+        """
+        tracker = TimestampTracker(source, strict=strict)
+        reservation = self._reserve(system_blocks, user_input)
+        settled = False
+        try:
+            with StreamWriter(label) as out, self.client.messages.stream(
+                model=self.model,
+                max_tokens=EDITOR_MAX_TOKENS,
+                temperature=self.temperature,
+                system=system_blocks,
+                messages=[{"role": "user", "content": user_input}]
+            ) as stream:
+                try:
+                    for piece in stream.text_stream:
+                        out.write(piece)
+                        tracker.feed(piece)
+                except BaseException:
+                    # Aborto (ou queda) no meio do stream: o que já foi gerado é cobrado
+                    snapshot = getattr(stream, "current_message_snapshot", None)
+                    usage = partial_usage(getattr(snapshot, "usage", None), out.text,
+                                          self._prompt_chars(system_blocks, user_input))
+                    settled = True
+                    self._track_usage(usage, reservation)
+                    raise
+                final = stream.get_final_message()
+        except BaseException:
+            if not settled:
+                self.ledger.settle(reservation)
+            raise
+        self._track_usage(final.usage, reservation)
+        tracker.finish()
+        return out.text
+
+    def _generate(self, system_blocks: List[Dict], user_input: str, source: str, label: str) -> str:
+        """
+        Gera o trecho preservando a sequência de timestamps de `source`.
+        A última tentativa é sempre entregue; a auditoria final decide o status.
+        """
+        for attempt in range(1, EDITOR_ATTEMPTS + 1):
+            last = attempt == EDITOR_ATTEMPTS
+            if EDITOR_STREAM:
+                try:
+                    return self._call_model_streaming(system_blocks, user_input, source, label, strict=not last)
+                except TimestampIntegrityError as e:
+                    with self._usage_lock:
+                        self.usage["aborted_generations"] += 1
+                    print(f"   ✋ [{label}] Geração abortada cedo ({e}). Repetindo...")
+                    continue
+
+            edited = self._call_model(system_blocks, user_input)
+            if last or GUARDED_TS.findall(edited) == GUARDED_TS.findall(source):
+                return edited
+            # Uma nova tentativa isolada antes de deixar a auditoria final sinalizar
+            print(f"   🔁 [{label}] perdeu timestamps. Repetindo...")
+
+    def _edit_window(self, target_lang: str, window: Dict, index: int, total: int, archive_url: str) -> str:
+        """Edita o núcleo de uma janela; o contexto vizinho só orienta a continuidade."""
+        core = self._join(window["core"])
+        before = self._join(window["before"]) or "(início da aula)"
+        after = self._join(window["after"]) or "(fim da aula)"
+        user_input = (
+            f"Edite a transcrição abaixo para o Padrão V19 (parte {index + 1} de {total}).\n"
+            f"Link de Preservação: {archive_url}\n"
+            "Devolva SOMENTE o TRECHO A EDITAR, mantendo todos os seus timestamps ⟦HH:MM:SS⟧ na mesma ordem. "
+            "Os contextos servem apenas de referência e não devem ser reproduzidos. "
+            "Não abra shortcodes que não fechem dentro do trecho.\n\n"
+            f"### CONTEXTO ANTERIOR\n{before}\n\n"
+            f"### TRECHO A EDITAR\n{core}\n\n"
+            f"### CONTEXTO POSTERIOR\n{after}"
+        )
+        # O vocabulário cobre também o contexto vizinho que o modelo enxerga
+        system_blocks = self._system_blocks(target_lang, f"{before}\n{core}\n{after}")
+        edited = self._generate(system_blocks, user_input, core, f"window_{index + 1:03d}")
+        return edited.strip()
+
+    def _refine_windowed(self, guarded_text: str, target_lang: str, archive_url: str) -> str:
+        """Map-Reduce: edita as janelas em paralelo e costura na ordem original."""
+        windows = self._build_windows(self._split_paragraphs(guarded_text))
+        print(f"   🪟 Texto longo: {len(windows)} janelas editadas em paralelo ({EDITOR_CONCURRENCY} simultâneas)...")
+        # Com prefixo cacheável, a primeira janela roda sozinha para gravá-lo no cache do
+        # provedor e as demais já o leem; abaixo do mínimo, esperar por ela só somaria latência
+        warm = 1 if self._prefix_cacheable(target_lang) else 0
+        edited = [self._edit_window(target_lang, w, i, len(windows), archive_url)
+                  for i, w in enumerate(windows[:warm])]
+        with ThreadPoolExecutor(max_workers=max(1, EDITOR_CONCURRENCY)) as pool:
+            futures = [
+                pool.submit(self._edit_window, target_lang, w, i, len(windows), archive_url)
+                for i, w in enumerate(windows) if i >= warm
+            ]
+            edited += [f.result() for f in futures]
+        # Costura com o separador original de cada fronteira: um parágrafo partido entre
+        # janelas volta inteiro, sem linha em branco no meio
+        stitched = edited[0]
+        for window, text in zip(windows, edited[1:]):
+            stitched += window["sep"] + text
+        return stitched
+
     def refine(self, raw_text: str, target_lang: str = "pt", metadata: Optional[Dict] = None) -> Dict:
         """Executa o refino editorial completo."""
         print(f"✨ [VanaEditor] Processando em {target_lang} com o modelo {self.model}...")
@@ -92,23 +393,26 @@ Tipos Permitidos:
         guarded_text = self._apply_timestamp_guard(raw_text)
         archive_url = metadata.get("archive_url", "#") if metadata else "#"
 
-        # 2. Preparação do Prompt
-        sys_prompt = self._build_system_prompt(target_lang)
-        user_input = f"Edite a transcrição abaixo para o Padrão V19.\nLink de Preservação: {archive_url}\n\n{guarded_text}"
-
-        # 3. Chamada à IA
+        # 2. Chamada à IA (janela única ou Map-Reduce para aulas longas)
+        #    O prompt de cada chamada leva só o vocabulário do trecho que ela edita
         try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=4000,
-                temperature=self.temperature,
-                system=sys_prompt,
-                messages=[{"role": "user", "content": user_input}]
-            )
-            
-            final_text = response.content[0].text
-            return self._audit_and_package(final_text, guarded_text)
+            if self._estimate_tokens(guarded_text) > WINDOW_TOKENS:
+                final_text = self._refine_windowed(guarded_text, target_lang, archive_url)
+            else:
+                user_input = f"Edite a transcrição abaixo para o Padrão V19.\nLink de Preservação: {archive_url}\n\n{guarded_text}"
+                final_text = self._generate(self._system_blocks(target_lang, guarded_text), user_input,
+                                            guarded_text, "edited_stream")
+
+            # 3. Auditoria do resultado costurado
+            result = self._audit_and_package(final_text, guarded_text)
+            merge_stats("editor", result["usage"])
+            print(f"   📊 Cache de prompt: {self.usage['cache_read_input_tokens']} tokens lidos / "
+                  f"{self.usage['cache_creation_input_tokens']} gravados")
+            return result
             
+        except BudgetExceeded:
+            # Hard-stop: a execução para aqui (não publica o texto bruto como se fosse editado)
+            raise
         except Exception as e:
             print(f"❌ Erro crítico no Editor: {e}")
             return {"text": raw_text, "status": "erro", "error": str(e)}
@@ -128,5 +432,6 @@ Tipos Permitidos:
             "status": "verificado" if (flags == 0 and ts_final == ts_original) else "revisao_pendente",
             "ts_integrity": ts_final == ts_original,
             "flags_count": flags,
-            "model_used": self.model
+            "model_used": self.model,
+            "usage": dict(self.usage)
         }
\ No newline at end of file
@@ -2,49 +2,72 @@
 """
 Merger v5.9.1 – O Teólogo
 - Resolução de referências [[REF: ...]] via Google Sheets
-- Cache persistente de 24h para performance e economia de API
+- Glossário no snapshot local compartilhado: a planilha só é baixada quando o modifiedTime muda
 - Sanitização HTML (Proteção contra XSS e quebra de layout)
 - Fallback automático para cache offline
+- Resolução em fluxo (RefResolver) sobre o tokenizer compartilhado, encadeável ao reparo
 """
 import os
-import re
 import json
 import html
 from pathlib import Path
 
-import gspread
-from google.oauth2.service_account import Credentials
 from tenacity import retry, stop_after_attempt, wait_exponential
 
-from src.utils.cache import PersistentCache
 from src.utils.io import write_json
+from src.utils.tokens import REF, Token, tokenize
+from src.utils.vocabulary import VocabularyStore
 
 # Caminhos de Arquivo
 INP_PATH = Path("work/edited/edited_repaired.txt")
 OUT_PATH = Path("work/final/POST_WORDPRESS_PRONTO.txt")
 REPORT_PATH = Path("work/audit/merger_report.json")
 
-# Regex para capturar [[REF: chave]]
-REF_REGEX = re.compile(r"\[\[REF:\s*(.+?)\s*\]\]", re.IGNORECASE)
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files"
 
 class GlossaryLoader:
-    def __init__(self):
-        # Cache de 24h para o glossário
-        self._cache = PersistentCache("glossario", ttl_seconds=24 * 3600)
+    def __init__(self, store: VocabularyStore = None):
+        # Snapshot compartilhado com Editor e Orquestrador
+        self.store = store or VocabularyStore()
+        self.sheet_id = os.getenv("GLOSSARIO_SHEET_ID")
+
+    def _credentials(self):
+        # Imports tardios: o orquestrador carrega este módulo (cadeia fundida) mesmo quando o
+        # glossário vem só do snapshot local
+        from google.oauth2.service_account import Credentials
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=10))
-    def _fetch_from_sheets(self) -> dict:
-        """Conecta ao Google Sheets e extrai o mapeamento chave -> conteúdo."""
         creds_json = os.getenv("GOOGLE_CREDS")
         if not creds_json:
             raise ValueError("Secret GOOGLE_CREDS não configurada no GitHub.")
 
         creds_info = json.loads(creds_json)
-        scopes = ["https://www.googleapis.com/auth/spreadsheets.readonly"]
-        creds = Credentials.from_service_account_info(creds_info, scopes=scopes)
+        scopes = [
+            "https://www.googleapis.com/auth/spreadsheets.readonly",
+            # Só metadados: basta para ler o modifiedTime da planilha
+            "https://www.googleapis.com/auth/drive.metadata.readonly",
+        ]
+        return Credentials.from_service_account_info(creds_info, scopes=scopes)
+
+    def _sheet_revision(self) -> str:
+        """modifiedTime da planilha no Drive (uma requisição leve, sem baixar as linhas)."""
+        from google.auth.transport.requests import AuthorizedSession
+
+        session = AuthorizedSession(self._credentials())
+        resp = session.get(
+            f"{DRIVE_FILES_URL}/{self.sheet_id}",
+            params={"fields": "modifiedTime", "supportsAllDrives": "true"},
+            timeout=30,
+        )
+        resp.raise_for_status()
+        return resp.json()["modifiedTime"]
 
-        gc = gspread.authorize(creds)
-        sheet_id = os.getenv("GLOSSARIO_SHEET_ID")
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=10))
+    def _fetch_from_sheets(self) -> dict:
+        """Conecta ao Google Sheets e extrai o mapeamento chave -> conteúdo."""
+        import gspread
+
+        gc = gspread.authorize(self._credentials())
+        sheet_id = self.sheet_id
         tab_name = os.getenv("GLOSSARIO_SHEET_TAB", "Glossario")
 
         sh = gc.open_by_key(sheet_id)
@@ -63,44 +86,55 @@ class GlossaryLoader:
         return mapping
 
     def load(self) -> dict:
-        """Carrega o glossário priorizando o cache persistente."""
-        cached = self._cache.get("mapping")
-        if cached:
-            return cached
-
+        """Carrega o glossário do snapshot; a planilha só é baixada se tiver mudado."""
         try:
-            mapping = self._fetch_from_sheets()
-            self._cache.set("mapping", mapping)
-            return mapping
+            return self.store.glossary(self._sheet_revision, self._fetch_from_sheets)
         except Exception as e:
-            # Fallback: Se a API falhar, tenta usar o cache mesmo que expirado
-            stale = self._cache.get("mapping")
-            if stale:
-                print(f"   ⚠️ Falha na API Google Sheets. Usando cache offline.")
-                return stale
             raise RuntimeError(f"Erro fatal ao carregar glossário: {e}")
 
-def _apply_refs(text: str, mapping: dict) -> tuple[str, dict]:
-    """Substitui as marcações [[REF]] pelos shortcodes [note] sanitizados."""
-    stats = {"found": 0, "resolved": 0, "unresolved": []}
+class RefResolver:
+    """Transformação de REFs: troca cada token [[REF]] pelo shortcode [note] sanitizado."""
+    def __init__(self, mapping: dict):
+        self.mapping = mapping
+        self.stats = {"found": 0, "resolved": 0, "unresolved": []}
+
+    def feed(self, tok: Token, piece: str) -> str:
+        if tok.kind != REF:
+            return piece
 
-    def replacer(m):
-        key = m.group(1).strip().lower()
-        stats["found"] += 1
-        
-        val = mapping.get(key)
+        key = tok.value.strip().lower()
+        self.stats["found"] += 1
+
+        val = self.mapping.get(key)
         if val:
-            stats["resolved"] += 1
+            self.stats["resolved"] += 1
             # Sanitização Crítica: impede que caracteres especiais quebrem o shortcode
-            sanitized_val = html.escape(val)
-            return f"[note]{sanitized_val}[/note]"
-        else:
-            stats["unresolved"].append(key)
-            # Mantém a tag original se não houver tradução no glossário
-            return m.group(0)
+            return f"[note]{html.escape(val)}[/note]"
+        self.stats["unresolved"].append(key)
+        # Mantém a tag original se não houver tradução no glossário
+        return piece
 
-    result = REF_REGEX.sub(replacer, text)
-    return result, stats
+def _apply_refs(text: str, mapping: dict) -> tuple[str, dict]:
+    """Substitui as marcações [[REF]] pelos shortcodes [note] sanitizados."""
+    resolver = RefResolver(mapping)
+    result = "".join(resolver.feed(tok, tok.text) for tok in tokenize(text))
+    return result, resolver.stats
+
+def load_glossary() -> tuple[dict, bool]:
+    """Glossário {chave: conteúdo} e se a carga deu certo (vazio quando offline e sem snapshot)."""
+    try:
+        return GlossaryLoader().load(), True
+    except Exception:
+        return {}, False
+
+def _report(mapping: dict, glossary_ok: bool, ref_stats: dict) -> dict:
+    return {
+        "ok": True,
+        "glossary_status": "ONLINE" if glossary_ok else "OFFLINE/EMPTY",
+        "glossary_entries": len(mapping),
+        "refs": ref_stats,
+        "output_file": str(OUT_PATH)
+    }
 
 def run_merger() -> dict:
     """Orquestra o processo de injeção teológica."""
@@ -113,13 +147,7 @@ def run_merger() -> dict:
     content = INP_PATH.read_text(encoding="utf-8")
 
     # 1. Carregar Glossário
-    loader = GlossaryLoader()
-    try:
-        mapping = loader.load()
-        glossary_ok = True
-    except Exception:
-        mapping = {}
-        glossary_ok = False
+    mapping, glossary_ok = load_glossary()
 
     # 2. Aplicar Substituições
     final_text, ref_stats = _apply_refs(content, mapping)
@@ -127,13 +155,6 @@ def run_merger() -> dict:
     # 3. Salvar Output Final
     OUT_PATH.write_text(final_text, encoding="utf-8")
 
-    report = {
-        "ok": True,
-        "glossary_status": "ONLINE" if glossary_ok else "OFFLINE/EMPTY",
-        "glossary_entries": len(mapping),
-        "refs": ref_stats,
-        "output_file": str(OUT_PATH)
-    }
-
+    report = _report(mapping, glossary_ok, ref_stats)
     write_json(REPORT_PATH, report)
     return report
\ No newline at end of file
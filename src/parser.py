@@ -4,21 +4,126 @@ Parser Vaishnava v6.3 Diamond – O Minerador de Dados
 - Extração de Atributos: type, reel, hook.
 - Identificação de Timestamps: Vincula o tempo ao bloco.
 - Prontidão para Supabase: Formata os dados para a Fábrica de Reels.
+- Timestamps: varridos junto com as passagens (dois ponteiros, custo linear no tamanho do post).
+- Streaming: iter_passages sobre texto, bytes, mmap ou caminho de arquivo, com registros
+  compactos (offsets na fonte) e texto materializado só quando pedido.
+- PassageMiner: mineração como transformação do fluxo de tokens compartilhado (cadeia fundida).
 """
 
+import mmap
+import os
 import re
-from typing import List, Dict, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from src.utils.tokens import SHORTCODE, TS, TS_GUARDED, Token
+
+# Versões em bytes das regexes, para varrer arquivos mapeados em memória sem decodificá-los
+_PASSAGE_BYTES = re.compile(rb'\[hk_passage\s+([^\]]+)\](.*?)\[/hk_passage\]', re.DOTALL)
+_ATTR_BYTES = re.compile(rb'(\w+)="([^"]*)"')
+_TIMESTAMP_BYTES = re.compile('⟦(\\d{1,2}:\\d{2}:\\d{2})⟧'.encode("utf-8"))
+INTERNAL_SHORTCODES = re.compile(r'\[/?(?:original|explicacao)\]')
+_ATTR = re.compile(r'(\w+)="([^"]*)"', re.ASCII)
+
+class PassageRecord:
+    """
+    Passagem minerada sem cópia do texto: guarda a fonte e os offsets do conteúdo.
+    content_raw / clean_content são decodificados apenas quando acessados.
+    """
+    __slots__ = ("source", "start", "end", "content_start", "content_end", "attrs", "timestamp_start", "post_id")
+
+    def __init__(self, source, start: int, end: int, content_start: int, content_end: int,
+                 attrs: Dict[str, str], timestamp_start: str, post_id: Optional[int]):
+        self.source = source
+        self.start = start
+        self.end = end
+        self.content_start = content_start
+        self.content_end = content_end
+        self.attrs = attrs
+        self.timestamp_start = timestamp_start
+        self.post_id = post_id
+
+    @property
+    def type(self) -> str:
+        return self.attrs.get("type", "tattva")
+
+    @property
+    def is_reel(self) -> bool:
+        return self.attrs.get("reel", "false").lower() == "true"
+
+    @property
+    def hook(self) -> str:
+        return self.attrs.get("hook", "")
+
+    @property
+    def content_raw(self) -> str:
+        raw = self.source[self.content_start:self.content_end]
+        return (raw if isinstance(raw, str) else raw.decode("utf-8")).strip()
+
+    @property
+    def clean_content(self) -> str:
+        return INTERNAL_SHORTCODES.sub('', self.content_raw).strip()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Formato histórico do parse_aula (pronto para o Supabase)."""
+        content = self.content_raw
+        return {
+            "wp_post_id": self.post_id,
+            "type": self.type,
+            "is_reel": self.is_reel,
+            "hook": self.hook,
+            "content_raw": content,
+            "timestamp_start": self.timestamp_start,
+            "clean_content": INTERNAL_SHORTCODES.sub('', content).strip()
+        }
+
+class PassageMiner:
+    """
+    Mineração em fluxo: observa os pedaços já emitidos pela cadeia (reparo, REFs) e fecha
+    cada passagem no primeiro [/hk_passage] após a abertura com atributos.
+    O timestamp é o último marcador (⟦ ⟧ ou [ ]) visto antes da abertura.
+    """
+    def __init__(self, post_id: Optional[int] = None):
+        self.post_id = post_id
+        self.passages: List[PassageRecord] = []
+        self.timestamp = "00:00:00"
+        self.pos = 0  # offset no texto emitido
+        self._open: Optional[Tuple[int, Dict[str, str], str]] = None
+        self._parts: List[str] = []
+
+    def feed(self, tok: Token, piece: str) -> str:
+        start = self.pos
+        self.pos += len(piece)
+        is_passage = tok.kind == SHORTCODE and tok.name == "hk_passage"
+
+        if self._open is None:
+            if is_passage and not tok.closing and tok.attrs:
+                self._open = (start, dict(_ATTR.findall(tok.attrs)), self.timestamp)
+                self._parts = []
+        elif is_passage and tok.closing and not tok.attrs:
+            opened_at, attrs, timestamp = self._open
+            content = "".join(self._parts)
+            # O próprio conteúdo vira a fonte do registro: sem guardar o post inteiro
+            self.passages.append(PassageRecord(content, opened_at, self.pos, 0, len(content),
+                                               attrs, timestamp, self.post_id))
+            self._open = None
+        else:
+            self._parts.append(piece)
+
+        if tok.kind in (TS, TS_GUARDED):
+            self.timestamp = tok.value
+        return piece
 
 class VanaParser:
     def __init__(self):
-        # Regex Diamond: Captura a abertura [hk_passage ...], o conteúdo interno e o fechamento
-        self.passage_regex = re.compile(r'\[hk_passage\s+([^\]]+)\](.*?)\[/hk_passage\]', re.DOTALL)
+        # Regex Diamond: Captura a abertura [hk_passage ...], o conteúdo interno e o fechamento.
+        # re.ASCII em todas: \s, \w e \d casam o mesmo que nas versões em bytes (texto e arquivo concordam)
+        self.passage_regex = re.compile(r'\[hk_passage\s+([^\]]+)\](.*?)\[/hk_passage\]', re.DOTALL | re.ASCII)
         
         # Regex para extrair atributos no formato chave="valor"
-        self.attr_regex = re.compile(r'(\w+)="([^"]*)"')
+        self.attr_regex = _ATTR
         
         # Regex para encontrar o timestamp protegido ⟦HH:MM:SS⟧
-        self.timestamp_regex = re.compile(r'⟦(\d{1,2}:\d{2}:\d{2})⟧')
+        self.timestamp_regex = re.compile(r'⟦(\d{1,2}:\d{2}:\d{2})⟧', re.ASCII)
 
     def parse_aula(self, text: str, post_id: int) -> List[Dict]:
         """
@@ -26,57 +131,45 @@ class VanaParser:
         Retorna uma lista de dicionários prontos para o Supabase.
         """
         print(f"🔍 [VanaParser] Minerando pérolas no post {post_id}...")
-        
-        extracted_data = []
-        matches = self.passage_regex.finditer(text)
-
-        for match in matches:
-            attr_raw = match.group(1)
-            content = match.group(2).strip()
-            
-            # 1. Extração de Atributos
-            attrs = dict(self.attr_regex.findall(attr_raw))
-            
-            # 2. Detecção de Contexto (Timestamps)
-            # Buscamos o timestamp mais próximo ANTES do início deste bloco
-            timestamp = self._find_nearest_timestamp(text, match.start())
-
-            # 3. Construção do Objeto Diamond
-            passage_obj = {
-                "wp_post_id": post_id,
-                "type": attrs.get("type", "tattva"), # lila, biografia, etc.
-                "is_reel": attrs.get("reel", "false").lower() == "true",
-                "hook": attrs.get("hook", ""),
-                "content_raw": content,
-                "timestamp_start": timestamp,
-                "clean_content": self._remove_internal_shortcodes(content)
-            }
-            
-            extracted_data.append(passage_obj)
-
+        extracted_data = [record.to_dict() for record in self.iter_passages(text, post_id)]
         print(f"✅ [VanaParser] {len(extracted_data)} passagens mineradas com sucesso.")
         return extracted_data
 
-    def _find_nearest_timestamp(self, text: str, position: int) -> str:
+    def iter_passages(self, source: Union[str, bytes, mmap.mmap, "os.PathLike"],
+                      post_id: Optional[int] = None) -> Iterator[PassageRecord]:
         """
-        Busca reversa pelo timestamp ⟦HH:MM:SS⟧ mais próximo da posição atual.
+        Gera as passagens uma a uma, sem montar a lista nem copiar os conteúdos.
+        :param source: Texto do post, bytes/mmap em UTF-8 ou caminho de arquivo (mapeado em memória)
+        Os registros de arquivo mantêm o mmap vivo enquanto existirem; a memória por post
+        fica constante na re-mineração em massa do acervo.
         """
-        # Pega todo o texto até o início do bloco
-        lookback_text = text[:position]
-        timestamps = self.timestamp_regex.findall(lookback_text)
-        
-        if timestamps:
-            return timestamps[-1] # Retorna o último encontrado antes do bloco
-        return "00:00:00"
+        if isinstance(source, os.PathLike):
+            with open(source, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return
+                # O mmap duplica o descritor: o arquivo pode ser fechado logo em seguida
+                source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
 
-    def _remove_internal_shortcodes(self, text: str) -> str:
-        """
-        Limpa shortcodes internos como [original] e [explicacao] 
-        para que o Reel/Legenda tenha apenas o texto limpo.
-        """
-        clean = re.sub(r'\[/?original\]', '', text)
-        clean = re.sub(r'\[/?explicacao\]', '', clean)
-        return clean.strip()
+        if isinstance(source, str):
+            passage_re, attr_re, ts_re, decode = self.passage_regex, self.attr_regex, self.timestamp_regex, str
+        else:
+            passage_re, attr_re, ts_re = _PASSAGE_BYTES, _ATTR_BYTES, _TIMESTAMP_BYTES
+            decode = lambda b: b.decode("utf-8")
+
+        # Timestamps e passagens avançam juntos (dois ponteiros): nada de índice nem de prefixos
+        timestamps = ts_re.finditer(source)
+        pending = next(timestamps, None)
+        current = "00:00:00"
+
+        for match in passage_re.finditer(source):
+            # O último marcador que termina antes do início do bloco
+            while pending is not None and pending.end() <= match.start():
+                current = decode(pending.group(1))
+                pending = next(timestamps, None)
+
+            attrs = {decode(k): decode(v) for k, v in attr_re.findall(match.group(1))}
+            yield PassageRecord(source, match.start(), match.end(), match.start(2), match.end(2),
+                                attrs, current, post_id)
 
     def get_summary(self, passages: List[Dict]) -> str:
         """Gera um resumo rápido para log/auditoria."""
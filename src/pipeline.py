@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline Fundido v1.0 – A Linha Única
+- Reparo → Merger → Parser como transformações sobre um único fluxo de tokens
+- Uma leitura (edited.txt), uma varredura e uma escrita do post final
+- Emite os mesmos relatórios das etapas isoladas, mais as passagens mineradas
+- Estágio "finishing" do orquestrador: recebe o texto editado em memória (sem ler edited.txt)
+"""
+import json
+from pathlib import Path
+from typing import Optional
+
+from src import auditor_reparador, merger
+from src.auditor_reparador import Repairer
+from src.merger import RefResolver, load_glossary
+from src.parser import PassageMiner
+from src.utils.io import write_json
+from src.utils.tokens import tokenize
+
+PASSAGES_PATH = Path("work/final/passages.json")
+
+def run_chain(post_id: Optional[int] = None, content: Optional[str] = None) -> dict:
+    """
+    Executa a cadeia pós-edição inteira numa só passada sobre o texto editado.
+    :param content: Texto editado já em memória (orquestrador); sem ele, lê work/edited/edited.txt
+    """
+    if content is None:
+        if not auditor_reparador.INP_PATH.exists():
+            return {"ok": False, "reason": "Ficheiro edited.txt não encontrado para reparo."}
+        content = auditor_reparador.INP_PATH.read_text(encoding="utf-8")
+    mapping, glossary_ok = load_glossary()
+
+    # A ordem importa: cada transformação recebe o que a anterior emitiu
+    repairer = Repairer()
+    resolver = RefResolver(mapping)
+    miner = PassageMiner(post_id)
+    chain = (repairer, resolver, miner)
+
+    pieces = []
+    for tok in tokenize(content):
+        piece = tok.text
+        for step in chain:
+            piece = step.feed(tok, piece)
+        pieces.append(piece)
+
+    joined = "".join(pieces)
+    final_text = joined.strip()
+    # Offsets das passagens passam a valer no texto final (sem o espaço inicial removido)
+    lead = len(joined) - len(joined.lstrip())
+    for record in miner.passages:
+        record.start -= lead
+        record.end -= lead
+
+    merger.OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    merger.OUT_PATH.write_text(final_text, encoding="utf-8")
+
+    repair_report = repairer.report(merger.OUT_PATH)
+    merger_report = merger._report(mapping, glossary_ok, resolver.stats)
+    passages = [record.to_dict() for record in miner.passages]
+    write_json(auditor_reparador.REPORT_PATH, repair_report)
+    write_json(merger.REPORT_PATH, merger_report)
+    write_json(PASSAGES_PATH, passages)
+
+    print(f"✅ [Pipeline] Post final: {len(final_text)} caracteres | "
+          f"{resolver.stats['resolved']}/{resolver.stats['found']} REFs | {len(passages)} passagens")
+    return {
+        "ok": True,
+        "repair": repair_report,
+        "merger": merger_report,
+        "passages": len(passages),
+        "output_file": str(merger.OUT_PATH),
+        "passages_file": str(PASSAGES_PATH)
+    }
+
+if __name__ == "__main__":
+    print(json.dumps(run_chain(), indent=2, ensure_ascii=False))
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark do VanaParser – parse_aula atual contra o algoritmo original (quadrático)
+- Post sintético de ~500 KB com ⟦H:MM:SS⟧ por parágrafo e passagens [hk_passage]
+- Melhor de N execuções; confere que as duas saídas são idênticas (SHA-256 do JSON)
+Uso: python -m src.scripts.bench_parser [tamanho_kb] [repeticoes]
+"""
+import contextlib
+import hashlib
+import io
+import json
+import re
+import sys
+import time
+
+from src.parser import VanaParser
+
+_PASSAGE = re.compile(r'\[hk_passage\s+([^\]]+)\](.*?)\[/hk_passage\]', re.DOTALL)
+_ATTR = re.compile(r'(\w+)="([^"]*)"')
+_TIMESTAMP = re.compile(r'⟦(\d{1,2}:\d{2}:\d{2})⟧')
+
+def baseline_parse(text: str, post_id: int) -> list:
+    """parse_aula de antes do índice: refaz a busca de timestamps sobre text[:posição] a cada passagem."""
+    out = []
+    for match in _PASSAGE.finditer(text):
+        content = match.group(2).strip()
+        attrs = dict(_ATTR.findall(match.group(1)))
+        found = _TIMESTAMP.findall(text[:match.start()])
+        clean = re.sub(r'\[/?explicacao\]', '', re.sub(r'\[/?original\]', '', content)).strip()
+        out.append({
+            "wp_post_id": post_id,
+            "type": attrs.get("type", "tattva"),
+            "is_reel": attrs.get("reel", "false").lower() == "true",
+            "hook": attrs.get("hook", ""),
+            "content_raw": content,
+            "timestamp_start": found[-1] if found else "00:00:00",
+            "clean_content": clean,
+        })
+    return out
+
+def synthetic_post(size_kb: int) -> str:
+    """Parágrafos com timestamp; um em cada três vira passagem (alguns com [original]/[explicacao])."""
+    parts, i = [], 0
+    while sum(map(len, parts)) < size_kb * 1024:
+        h, m, s = i // 3600, i // 60 % 60, i % 60
+        body = f"Gurudeva explica o tattva número {i}. " * 12
+        if i % 3 == 0:
+            inner = f"[original]verso {i}[/original] [explicacao]{body}[/explicacao]" if i % 2 else body
+            body = f'[hk_passage type="lila" reel="{"true" if i % 9 == 0 else "false"}" hook="Gancho {i}"]{inner}[/hk_passage]'
+        parts.append(f"⟦{h}:{m:02d}:{s:02d}⟧ {body}\n\n")
+        i += 7
+    return "".join(parts)
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        # Os prints do parser não entram na medição
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def digest(passages: list) -> str:
+    return hashlib.sha256(json.dumps(passages, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def main() -> int:
+    size_kb = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    text = synthetic_post(size_kb)
+    parser = VanaParser()
+    mb = len(text.encode("utf-8")) / 1e6
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        current = parser.parse_aula(text, 1)
+    same = digest(current) == digest(baseline_parse(text, 1))
+
+    before = best_of(lambda: baseline_parse(text, 1), repeat)
+    after = best_of(lambda: parser.parse_aula(text, 1), repeat)
+    print(f"Post sintético: {mb * 1000:.0f} KB, {len(current)} passagens (melhor de {repeat})")
+    print(f"  antes:  {before * 1000:8.1f} ms ({mb / before:6.2f} MB/s)")
+    print(f"  depois: {after * 1000:8.1f} ms ({mb / after:6.2f} MB/s)")
+    print(f"  saídas idênticas: {'sim' if same else 'NÃO'}")
+    return 0 if same else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,18 +3,36 @@
 SmartAIWrapper v5.9.1 – O Guardião de Lakṣmī
 - Multi-provedor com Fallback Automático (Claude/Gemini/OpenAI)
 - Cache persistente para evitar reprocessamento (Deduplicação)
-- Controle de orçamento Diário e Mensal com Hard-Stop
+- Controle de orçamento Diário e Mensal com Hard-Stop (ledger SQLite compartilhado entre processos)
+- Custo pelo `usage` real de cada resposta, com preço de input / output / cache por modelo
 - Chunking inteligente para textos longos
+- Prompt Caching: a instrução (prefixo estático) é marcada para cache no Claude
+- Streaming opcional com persistência incremental e aborto por integridade de timestamps
+- Lote concorrente (edit_many / aedit_many) com teto de concorrência e TPM por provedor
+- Circuit breaker por provedor (provedor degradado é pulado na hora) e hedge opcional após o p95
+- Chaves de cache canônicas (espaços e tempos relativos): recortes deslocados reaproveitam
+  edições já pagas, inteiras ou parágrafo a parágrafo
 """
+import asyncio
 import hashlib
 import os
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
 from dataclasses import dataclass
-from datetime import date
-from typing import Callable, Optional, Dict, Any, Tuple
+from typing import Callable, Optional, Dict, Any, List, Sequence, Tuple
 
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_exponential
 from src.utils.cache import PersistentCache
+from src.utils.stream_guard import TimestampTracker, TimestampIntegrityError, StreamWriter, partial_usage
+from src.utils.ratelimit import ProviderLimiter, wait_retry_after
+from src.utils.circuit import CircuitBreaker, CircuitOpenError
+from src.utils.ledger import BudgetLedger, BudgetExceeded, PRICING, Usage, estimate_cost
+from src.utils.canonical import (
+    canonicalize, canonical_paragraph, split_paragraphs, segment_output,
+    relativize, rehydrate, base_offset, hour_width,
+)
 
 # Imports robustos com tratamento de ausência de libs
 try:
@@ -41,26 +59,39 @@ class AIResult:
     cached: bool = False
 
 class ProviderError(Exception): pass
-class BudgetExceeded(Exception): pass
-
-# Tabela de Preços (Referência para estimativa de custo)
-# Valores aproximados por 1M de tokens (Input + Output médio)
-PRICING = {
-    "claude-3-5-sonnet-latest": 3.0,
-    "claude-3-5-haiku-latest": 0.80,
-    "gemini-1.5-pro": 1.25,
-    "gemini-1.5-flash": 0.15,
-    "gpt-4o-mini": 0.15,
-    "gpt-4o": 5.0,
-}
 
 FALLBACK_ORDER = ["claude", "gemini", "openai"]
 
+# Limites por provedor: chamadas simultâneas e tokens por minuto (0 = sem balde)
+# Sobrescrevíveis via AI_CONCURRENCY_<PROVEDOR> / AI_TPM_<PROVEDOR>
+PROVIDER_LIMITS = {
+    "claude": {"concurrency": 4, "tpm": 40_000},
+    "gemini": {"concurrency": 4, "tpm": 1_000_000},
+    "openai": {"concurrency": 4, "tpm": 200_000},
+}
+
+# Espera entre tentativas: retry-after do provedor quando houver, senão backoff exponencial
+_RETRY_WAIT = wait_retry_after(wait_exponential(min=2, max=10))
+# Provedor ausente ou com circuito aberto não merece novas tentativas
+_RETRY_IF = retry_if_not_exception_type((ProviderError, CircuitOpenError))
+# No streaming, falha de integridade também não: cada nova geração paga sai em _attempt,
+# com reserva própria, em vez de se repetir dentro da mesma reserva
+_STREAM_RETRY_IF = retry_if_not_exception_type((ProviderError, CircuitOpenError, TimestampIntegrityError))
+# Gerações por chamada quando o stream é abortado por integridade de timestamps
+INTEGRITY_ATTEMPTS = 3
+
 class SmartAIWrapper:
     def __init__(self):
         self.primary = os.getenv("AI_PROVIDER", "claude").lower()
         self.budget_day = float(os.getenv("BUDGET_DAY_USD", "5.0"))
         self.budget_month = float(os.getenv("BUDGET_MONTH_USD", "100.0"))
+        self.stream = os.getenv("AI_STREAM", "false").lower() == "true"
+        self.batch_workers = int(os.getenv("AI_BATCH_WORKERS", "8"))
+        # Estágio ao qual os gastos são atribuídos quando a chamada não informa um
+        self.stage = os.getenv("VANA_STAGE", "ai")
+        # Hedge: dispara o próximo provedor se o primário passar do próprio p95
+        self.hedge = os.getenv("AI_HEDGE", "false").lower() == "true"
+        self.hedge_delay_s = float(os.getenv("AI_HEDGE_DELAY_S", "20"))
 
         self.models = {
             "claude": os.getenv("CLAUDE_MODEL", "claude-3-5-sonnet-latest"),
@@ -69,8 +100,39 @@ class SmartAIWrapper:
         }
 
         # Caches Persistentes (Garantem a memória da Forja entre execuções GHA)
-        self._cache = PersistentCache("ai_responses", ttl_seconds=7 * 86400) # 7 dias
-        self._cost_cache = PersistentCache("ai_costs", ttl_seconds=30 * 86400) # 30 dias
+        # Respostas comprimidas e com teto (AI_CACHE_MAX_MB): evicção LRU mantém o actions/cache enxuto
+        self._cache = PersistentCache(
+            "ai_responses", ttl_seconds=7 * 86400, # 7 dias
+            max_bytes=int(float(os.getenv("AI_CACHE_MAX_MB", "200")) * 1024 * 1024),
+            compress=True,
+        )
+        # Livro-caixa de gastos (SQLite WAL): o Hard-Stop vale para todos os jobs simultâneos
+        self.ledger = BudgetLedger()
+
+        # Tokens lidos/gravados no cache de prompt do provedor (mensurável no resumo)
+        self._usage_lock = threading.Lock()
+        self._usage = {"input_tokens": 0, "output_tokens": 0,
+                       "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+
+        self._limiters = {
+            name: ProviderLimiter(
+                name,
+                int(os.getenv(f"AI_CONCURRENCY_{name.upper()}", str(cfg["concurrency"]))),
+                int(os.getenv(f"AI_TPM_{name.upper()}", str(cfg["tpm"]))),
+            )
+            for name, cfg in PROVIDER_LIMITS.items()
+        }
+        self._breakers = {
+            name: CircuitBreaker(
+                name,
+                window=int(os.getenv("AI_BREAKER_WINDOW", "20")),
+                error_rate=float(os.getenv("AI_BREAKER_ERROR_RATE", "0.5")),
+                slow_call_s=float(os.getenv("AI_BREAKER_SLOW_S", "90")),
+                cooldown_s=float(os.getenv("AI_BREAKER_COOLDOWN_S", "60")),
+            )
+            for name in FALLBACK_ORDER
+        }
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
 
         self._init_clients()
 
@@ -95,94 +157,402 @@ class SmartAIWrapper:
         h.update(text.encode("utf-8"))
         return h.hexdigest()[:24]
 
+    def _paragraph_key(self, prompt: str, paragraph: str) -> str:
+        """Chave de um parágrafo isolado (forma canônica, tempos relativos ao próprio início)."""
+        return self._generate_hash(prompt, "¶" + canonical_paragraph(paragraph))
+
     def _estimate_cost(self, provider: str, prompt: str, text: str) -> float:
-        """Calcula o custo estimado com base no tamanho do texto (~3 chars/token)."""
-        model = self.models.get(provider, "")
-        price_per_1M = PRICING.get(model, 1.0)
-        tokens = (len(prompt) + len(text)) / 3
-        return (tokens / 1_000_000) * price_per_1M * 1.5 # Margem de segurança para output
+        """Custo estimado antes da chamada (a saída tem ~o tamanho do texto); só serve para reservar."""
+        return estimate_cost(self.models.get(provider, ""), len(prompt) + len(text), len(text))
+
+    @staticmethod
+    def _estimate_tokens(prompt: str, text: str) -> int:
+        """Tokens de entrada + saída esperada (a saída tem ~o tamanho do texto)."""
+        return int((len(prompt) + 2 * len(text)) / 3)
 
     def _check_budget(self, estimated: float):
         """Bloqueia a execução se os limites financeiros forem atingidos."""
-        day_key = f"cost_day_{date.today().isoformat()}"
-        month_key = f"cost_month_{date.today().strftime('%Y-%m')}"
-        
-        today_cost = self._cost_cache.get(day_key) or 0.0
-        month_cost = self._cost_cache.get(month_key) or 0.0
-
-        if today_cost + estimated > self.budget_day:
-            raise BudgetExceeded(f"Hard-Stop Diário atingido: ${today_cost:.2f}")
-        if month_cost + estimated > self.budget_month:
-            raise BudgetExceeded(f"Hard-Stop Mensal atingido: ${month_cost:.2f}")
-
-    def _record_cost(self, amount: float):
-        """Registra o gasto real no cache persistente."""
-        day_key = f"cost_day_{date.today().isoformat()}"
-        month_key = f"cost_month_{date.today().strftime('%Y-%m')}"
-        
-        self._cost_cache.set(day_key, (self._cost_cache.get(day_key) or 0.0) + amount)
-        self._cost_cache.set(month_key, (self._cost_cache.get(month_key) or 0.0) + amount)
+        spent = self.ledger.spent()
+        # Chamadas ainda em voo (de qualquer processo) contam como gasto
+        if spent["day_usd"] + spent["in_flight_usd"] + estimated > self.budget_day:
+            raise BudgetExceeded(f"Hard-Stop Diário atingido: ${spent['day_usd']:.2f}")
+        if spent["month_usd"] + spent["in_flight_usd"] + estimated > self.budget_month:
+            raise BudgetExceeded(f"Hard-Stop Mensal atingido: ${spent['month_usd']:.2f}")
+
+    def _track_usage(self, usage: Usage):
+        """Soma tokens de entrada/saída e de cache reportados pelo provedor."""
+        with self._usage_lock:
+            self._usage["input_tokens"] += usage.input_tokens
+            self._usage["output_tokens"] += usage.output_tokens
+            self._usage["cache_read_input_tokens"] += usage.cache_read_tokens
+            self._usage["cache_creation_input_tokens"] += usage.cache_write_tokens
+
+    @contextmanager
+    def _guard(self, provider: str, prompt: str, text: str):
+        """
+        Envolve cada tentativa: circuito aberto falha na hora; senão ocupa uma vaga do
+        limitador e registra sucesso/erro e latência na janela do circuit breaker.
+        """
+        breaker = self._breakers[provider]
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuito de {provider} aberto")
+        with self._limiters[provider].slot(self._estimate_tokens(prompt, text)):
+            start = time.perf_counter()
+            try:
+                yield
+            except TimestampIntegrityError:
+                # O provedor respondeu; o problema é o conteúdo, não a saúde do serviço
+                breaker.record(True, time.perf_counter() - start)
+                raise
+            except Exception:
+                breaker.record(False, time.perf_counter() - start)
+                raise
+            breaker.record(True, time.perf_counter() - start)
+
+    @staticmethod
+    def _claude_messages(prompt: str, text: str) -> list:
+        return [{"role": "user", "content": [
+            # Prefixo idêntico entre chamadas -> leitura barata do cache do provedor
+            {"type": "text", "text": prompt, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": f"Texto:\n{text}"},
+        ]}]
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=2, max=10))
-    def _call_claude(self, prompt: str, text: str) -> Tuple[str, str]:
+    @retry(stop=stop_after_attempt(3), wait=_RETRY_WAIT, retry=_RETRY_IF)
+    def _call_claude(self, prompt: str, text: str) -> Tuple[str, str, Usage]:
         if "claude" not in self._clients: raise ProviderError("Claude indisponível")
         model = self.models["claude"]
-        resp = self._clients["claude"].messages.create(
-            model=model, max_tokens=8192, temperature=0.2,
-            messages=[{"role": "user", "content": f"{prompt}\n\nTexto:\n{text}"}]
-        )
-        return "".join(b.text for b in resp.content if b.type == "text"), model
+        with self._guard("claude", prompt, text):
+            resp = self._clients["claude"].messages.create(
+                model=model, max_tokens=8192, temperature=0.2,
+                messages=self._claude_messages(prompt, text)
+            )
+        usage = Usage.from_response(resp.usage)
+        self._track_usage(usage)
+        return "".join(b.text for b in resp.content if b.type == "text"), model, usage
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=2, max=10))
-    def _call_gemini(self, prompt: str, text: str) -> Tuple[str, str]:
+    @retry(stop=stop_after_attempt(3), wait=_RETRY_WAIT, retry=_STREAM_RETRY_IF)
+    def _call_claude_stream(self, prompt: str, text: str, spent: List[Usage]) -> Tuple[str, str, Usage]:
+        """
+        Streaming: grava em work/edited/ enquanto chega e aborta (TimestampIntegrityError)
+        assim que um timestamp do texto falta ou sai de ordem.
+        :param spent: Recebe o consumo de cada geração que não chega ao fim (aborto, queda
+                      de conexão, finish() reprovado), para o ledger cobrar o que foi gerado
+        """
+        if "claude" not in self._clients: raise ProviderError("Claude indisponível")
+        model = self.models["claude"]
+        tracker = TimestampTracker(text)
+        label = f"ai_{self._generate_hash(prompt, text)}"
+        usage = None
+        try:
+            with self._guard("claude", prompt, text), \
+                    StreamWriter(label) as out, self._clients["claude"].messages.stream(
+                model=model, max_tokens=8192, temperature=0.2,
+                messages=self._claude_messages(prompt, text)
+            ) as stream:
+                try:
+                    for piece in stream.text_stream:
+                        out.write(piece)
+                        tracker.feed(piece)
+                    usage = Usage.from_response(stream.get_final_message().usage)
+                except BaseException:
+                    # Aborto no meio do stream: o message_delta final nunca chega
+                    snapshot = getattr(stream, "current_message_snapshot", None)
+                    usage = Usage.from_response(partial_usage(getattr(snapshot, "usage", None), out.text,
+                                                              len(prompt) + len(text)))
+                    raise
+            tracker.finish()
+        except BaseException:
+            if usage is not None:
+                self._track_usage(usage)
+                spent.append(usage)
+            raise
+        self._track_usage(usage)
+        return out.text, model, usage
+
+    @retry(stop=stop_after_attempt(3), wait=_RETRY_WAIT, retry=_RETRY_IF)
+    def _call_gemini(self, prompt: str, text: str) -> Tuple[str, str, Usage]:
         if "gemini" not in self._clients: raise ProviderError("Gemini indisponível")
         model_name = self.models["gemini"]
         model = genai.GenerativeModel(model_name)
-        resp = model.generate_content(f"{prompt}\n\nTexto:\n{text}")
-        return resp.text, model_name
+        with self._guard("gemini", prompt, text):
+            resp = model.generate_content(f"{prompt}\n\nTexto:\n{text}")
+        usage = Usage.from_response(getattr(resp, "usage_metadata", None))
+        self._track_usage(usage)
+        return resp.text, model_name, usage
+
+    @retry(stop=stop_after_attempt(3), wait=_RETRY_WAIT, retry=_RETRY_IF)
+    def _call_openai(self, prompt: str, text: str) -> Tuple[str, str, Usage]:
+        if "openai" not in self._clients: raise ProviderError("OpenAI indisponível")
+        model = self.models["openai"]
+        with self._guard("openai", prompt, text):
+            resp = self._clients["openai"].chat.completions.create(
+                model=model, max_tokens=8192, temperature=0.2,
+                messages=[
+                    # Instrução como system: prefixo estável aproveita o cache automático da OpenAI
+                    {"role": "system", "content": prompt},
+                    {"role": "user", "content": f"Texto:\n{text}"},
+                ]
+            )
+        usage = Usage.from_response(resp.usage)
+        self._track_usage(usage)
+        return resp.choices[0].message.content or "", model, usage
 
-    def edit_text(self, prompt: str, text: str) -> AIResult:
+    def _call_provider(self, provider: str, prompt: str, text: str, stream: bool,
+                       spent: List[Usage]) -> Tuple[str, str, Usage]:
+        if provider == "claude":
+            if stream:
+                return self._call_claude_stream(prompt, text, spent)
+            return self._call_claude(prompt, text)
+        if provider == "gemini":
+            return self._call_gemini(prompt, text)
+        if provider == "openai":
+            return self._call_openai(prompt, text)
+        raise ProviderError(f"Provedor desconhecido: {provider}")
+
+    def _attempt(self, provider: str, prompt: str, text: str, stream: bool, stage: str) -> AIResult:
         """
-        Função principal para refino de texto.
-        Tenta o cache primeiro, depois fallback entre provedores.
+        Chamada a um provedor; uma geração abortada por integridade de timestamps é repetida
+        (até INTEGRITY_ATTEMPTS), cada uma com a própria reserva.
         """
-        request_hash = self._generate_hash(prompt, text)
-        
-        # 1. Tentar Cache
-        cached = self._cache.get(request_hash)
-        if cached:
-            return AIResult(cached['text'], cached['provider'], cached['model'], 0.0, True)
+        for attempt in range(1, INTEGRITY_ATTEMPTS + 1):
+            try:
+                return self._attempt_once(provider, prompt, text, stream, stage)
+            except TimestampIntegrityError as e:
+                if attempt == INTEGRITY_ATTEMPTS:
+                    raise
+                print(f"   ✋ [{provider}] Geração abortada ({e}). Repetindo...")
 
-        # 2. Verificar Orçamento
-        est_cost = self._estimate_cost(self.primary, prompt, text)
-        self._check_budget(est_cost)
+    def _attempt_once(self, provider: str, prompt: str, text: str, stream: bool, stage: str) -> AIResult:
+        """
+        Uma geração completa: reserva a estimativa no ledger (checando o teto de forma
+        atômica) e, ao final, troca a reserva pelo custo do usage real. Gerações interrompidas
+        (inclusive as repetidas pelo @retry por queda de conexão) são cobradas pelo parcial.
+        """
+        reservation = self.ledger.reserve(self._estimate_cost(provider, prompt, text),
+                                          self.budget_day, self.budget_month)
+        model = self.models.get(provider, "")
+        spent: List[Usage] = []
+        try:
+            out, model, usage = self._call_provider(provider, prompt, text, stream, spent)
+        except BaseException:
+            self._settle_aborted(reservation, provider, model, spent, stage)
+            raise
+        self._settle_aborted(None, provider, model, spent, stage)
+        cost = self.ledger.settle(reservation, provider, model, usage, stage)
+        return AIResult(out, provider, model, cost)
+
+    def _settle_aborted(self, reservation: Optional[int], provider: str, model: str,
+                        spent: List[Usage], stage: str):
+        """Lança no ledger cada geração interrompida; a primeira libera a reserva, se houver."""
+        if not spent:
+            if reservation is not None:
+                self.ledger.settle(reservation)
+            return
+        for usage in spent:
+            self.ledger.settle(reservation, provider, model, usage, stage)
+            reservation = None
+
+    def _hedged(self, primary: str, backup: str, prompt: str, text: str, stream: bool, stage: str) -> AIResult:
+        """
+        Dispara o primário; se ele passar do p95 (ou falhar), dispara o reserva e fica com
+        a primeira resposta boa. O perdedor termina em segundo plano (custo contabilizado).
+        """
+        if self._hedge_pool is None:
+            self._hedge_pool = ThreadPoolExecutor(max_workers=max(4, self.batch_workers * 2))
+        delay = self._breakers[primary].p95() or self.hedge_delay_s
 
-        # 3. Ciclo de Fallback
-        providers = [self.primary] + [p for p in FALLBACK_ORDER if p != self.primary]
         last_error = None
+        first = self._hedge_pool.submit(self._attempt, primary, prompt, text, stream, stage)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            try:
+                return first.result()
+            except BudgetExceeded:
+                raise
+            except Exception as e:
+                # Primário falhou antes do p95: o reserva segue sozinho
+                last_error = e
+            running = {}
+        else:
+            print(f"🪁 [Hedge] {primary} passou de {delay:.1f}s: disparando {backup}")
+            running = {first: primary}
+        running[self._hedge_pool.submit(self._attempt, backup, prompt, text, stream, stage)] = backup
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                running.pop(future)
+                try:
+                    return future.result()
+                except BudgetExceeded:
+                    raise
+                except Exception as e:
+                    last_error = e
+        raise last_error
+
+    def _generate(self, prompt: str, text: str, stream: bool, stage: str) -> AIResult:
+        """Chamada nova (sem cache): orçamento + ciclo de fallback entre provedores."""
+        # Verificar Orçamento (cada tentativa reserva o próprio custo estimado)
+        self._check_budget(self._estimate_cost(self.primary, prompt, text))
 
-        for provider in providers:
+        # Ciclo de Fallback (circuitos abertos e provedores sem chave são pulados na hora)
+        providers = [
+            p for p in [self.primary] + [p for p in FALLBACK_ORDER if p != self.primary]
+            if p in self._clients and self._breakers[p].available()
+        ]
+        if not providers:
+            raise ProviderError("Nenhum provedor disponível (sem chave ou com circuito aberto).")
+
+        last_error = None
+        i = 0
+        while i < len(providers):
+            provider = providers[i]
+            backup = providers[i + 1] if self.hedge and i + 1 < len(providers) else None
             try:
-                if provider == "claude": out, model = self._call_claude(prompt, text)
-                elif provider == "gemini": out, model = self._call_gemini(prompt, text)
-                else: continue # Adicionar OpenAI se necessário
-
-                actual_cost = self._estimate_cost(provider, prompt, out)
-                self._record_cost(actual_cost)
-                self._cache.set(request_hash, {"text": out, "provider": provider, "model": model})
-                
-                return AIResult(out, provider, model, actual_cost)
+                if backup:
+                    return self._hedged(provider, backup, prompt, text, stream, stage)
+                return self._attempt(provider, prompt, text, stream, stage)
+            except BudgetExceeded:
+                raise
             except Exception as e:
                 last_error = e
-                continue
+            i += 2 if backup else 1
 
         raise ProviderError(f"Todos os provedores falharam. Último erro: {last_error}")
 
+    def _remember(self, prompt: str, key: str, base: Optional[int], paragraphs: List[str], result: AIResult):
+        """Guarda a resposta inteira e, se ela se alinhar à entrada, cada parágrafo (tempos relativos)."""
+        meta = {"provider": result.provider, "model": result.model}
+        self._cache.set(key, {"text": relativize(result.text, base), **meta})
+        for paragraph, segment in zip(paragraphs, segment_output(result.text, paragraphs) or []):
+            self._cache.set(self._paragraph_key(prompt, paragraph),
+                            {"text": relativize(segment, base_offset(paragraph)), **meta})
+
+    def _edit_partial(self, prompt: str, paragraphs: List[str], hits: List[Optional[Dict]],
+                      width: int, stream: bool, stage: str) -> AIResult:
+        """Reaproveita os parágrafos já editados e manda ao modelo só as sequências que faltam."""
+        parts: List[Optional[str]] = [
+            rehydrate(hit["text"], base_offset(p), width) if hit else None
+            for p, hit in zip(paragraphs, hits)
+        ]
+        runs, start = [], None
+        for idx, part in enumerate(parts + ["fim"]):
+            if part is None and start is None:
+                start = idx
+            elif part is not None and start is not None:
+                runs.append((start, idx))
+                start = None
+
+        print(f"   ♻️  [Cache] {len(paragraphs) - sum(b - a for a, b in runs)}/{len(paragraphs)} "
+              f"parágrafos reaproveitados; {len(runs)} trecho(s) novo(s)")
+        fresh = self.edit_many([(prompt, "\n\n".join(paragraphs[a:b])) for a, b in runs],
+                               stream=stream, stage=stage)
+        for (a, b), res in zip(runs, fresh):
+            parts[a] = res.text
+            for idx in range(a + 1, b):
+                parts[idx] = ""
+
+        paid = [r for r in fresh if not r.cached]
+        origin = paid[-1] if paid else next(h for h in hits if h)
+        provider = origin.provider if paid else origin["provider"]
+        model = origin.model if paid else origin["model"]
+        return AIResult("\n\n".join(p for p in parts if p), provider, model,
+                        sum(r.cost_usd for r in fresh), cached=not paid)
+
+    def edit_text(self, prompt: str, text: str, stream: Optional[bool] = None,
+                  stage: Optional[str] = None) -> AIResult:
+        """
+        Função principal para refino de texto.
+        Tenta o cache primeiro (texto inteiro, depois parágrafo a parágrafo), depois
+        fallback entre provedores.
+        Com stream=True (ou AI_STREAM=true), o Claude responde em streaming vigiado.
+        :param stage: Estágio ao qual o gasto é atribuído no ledger (padrão: self.stage)
+        """
+        stream = self.stream if stream is None else stream
+        stage = stage or self.stage
+
+        # 1. Tentar Cache: chave canônica (tempos relativos), depois a chave exata antiga
+        canon, base = canonicalize(text)
+        width = hour_width(text)
+        key = self._generate_hash(prompt, canon)
+        cached = self._cache.get(key)
+        if cached:
+            return AIResult(rehydrate(cached['text'], base, width), cached['provider'], cached['model'], 0.0, True)
+        cached = self._cache.get(self._generate_hash(prompt, text))
+        if cached:
+            return AIResult(cached['text'], cached['provider'], cached['model'], 0.0, True)
+
+        # 2. Reaproveitamento parcial: recortes sobrepostos já pagaram parte dos parágrafos
+        paragraphs = split_paragraphs(text)
+        if len(paragraphs) > 1:
+            hits = [self._cache.get(self._paragraph_key(prompt, p)) for p in paragraphs]
+            if any(hits):
+                result = self._edit_partial(prompt, paragraphs, hits, width, stream, stage)
+                self._cache.set(key, {"text": relativize(result.text, base),
+                                      "provider": result.provider, "model": result.model})
+                return result
+
+        # 3. Chamada nova
+        result = self._generate(prompt, text, stream, stage)
+        self._remember(prompt, key, base, paragraphs, result)
+        return result
+
+    def edit_many(self, items: Sequence[Tuple[str, str]], max_workers: Optional[int] = None,
+                  stream: Optional[bool] = None, return_exceptions: bool = False,
+                  stage: Optional[str] = None) -> List[Any]:
+        """
+        Refina vários (prompt, texto) em paralelo, preservando a ordem de entrada.
+        Os limites por provedor (concorrência, TPM, retry-after) valem para o lote inteiro;
+        pedidos idênticos viram uma única chamada.
+        :param return_exceptions: Se True, falhas voltam na posição do item em vez de abortar
+        """
+        unique: Dict[str, Tuple[str, str]] = {}
+        order = []
+        for prompt, text in items:
+            key = self._generate_hash(prompt, text)
+            unique.setdefault(key, (prompt, text))
+            order.append(key)
+
+        def _one(pair: Tuple[str, str]) -> Any:
+            try:
+                return self.edit_text(pair[0], pair[1], stream=stream, stage=stage)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return e
+
+        workers = max(1, min(max_workers or self.batch_workers, len(unique) or 1))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {key: pool.submit(_one, pair) for key, pair in unique.items()}
+            done = {key: f.result() for key, f in futures.items()}
+
+        return [done[key] for key in order]
+
+    async def aedit_text(self, prompt: str, text: str, stream: Optional[bool] = None,
+                         stage: Optional[str] = None) -> AIResult:
+        """Versão assíncrona de edit_text (a chamada bloqueante roda numa thread)."""
+        return await asyncio.to_thread(self.edit_text, prompt, text, stream, stage)
+
+    async def aedit_many(self, items: Sequence[Tuple[str, str]], max_workers: Optional[int] = None,
+                         stream: Optional[bool] = None, return_exceptions: bool = False,
+                         stage: Optional[str] = None) -> List[Any]:
+        """Versão assíncrona de edit_many, para quem já roda dentro de um event loop."""
+        return await asyncio.to_thread(self.edit_many, items, max_workers, stream, return_exceptions, stage)
+
     def get_cost_summary(self) -> Dict:
         """Retorna o resumo de gastos para o log/Telegram."""
-        day_key = f"cost_day_{date.today().isoformat()}"
+        spent = self.ledger.spent()
         return {
-            "today_usd": round(self._cost_cache.get(day_key) or 0.0, 4),
+            "today_usd": round(spent["day_usd"], 4),
+            "month_usd": round(spent["month_usd"], 4),
             "limit_day": self.budget_day,
-            "provider": self.primary
+            "limit_month": self.budget_month,
+            "provider": self.primary,
+            "circuits": {name: b.snapshot() for name, b in self._breakers.items()},
+            "prompt_cache": {
+                "read_tokens": self._usage["cache_read_input_tokens"],
+                "write_tokens": self._usage["cache_creation_input_tokens"],
+            },
+            "run": self.ledger.breakdown(),
+            "response_cache": self._cache.stats(),
         }
\ No newline at end of file
@@ -3,19 +3,71 @@
 Transcritor HariKatha v6.3 - Diamond Edition
 - Suporte a YouTube e Facebook via yt-dlp.
 - Fingerprinting SHA-256 para evitar duplicidade.
-- Chunking de 10 minutos para estabilidade na Groq.
+- Preparo STT: chunks Opus 16 kHz mono, com duração derivada do limite de upload.
+  O MP3 HQ serve apenas ao arquivamento.
+- Cortes alinhados a pausas (silencedetect) para não partir palavras nas emendas.
+- Transcrição concorrente com pool limitado e remontagem na ordem dos chunks.
+- Cache endereçado por conteúdo: só chunks inéditos vão para a Groq.
+- Modo Streaming: yt-dlp -> ffmpeg segment, cada chunk vai à Groq assim que fecha.
 - Cortes cirúrgicos (start/end) nativos.
 """
 
 import os
+import re
+import time
+import signal
+import bisect
 import hashlib
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
 from groq import Groq
+from tenacity import retry, stop_after_attempt, wait_exponential
+from src.utils.cache import PersistentCache, ContentStore
+from src.utils.io import sha256_file, sha256_text, merge_stats
 
 # Configurações de Trabalho
 WORK_DIR = Path("work/audio")
-CHUNK_LENGTH = 600  # 10 minutos em segundos
+
+# Preparo STT: o Whisper trabalha a 16 kHz mono, então o upload não precisa do MP3 HQ
+STT_SAMPLE_RATE = 16000
+STT_BITRATE_KBPS = int(os.getenv("VANA_STT_BITRATE_KBPS", "24"))
+STT_MAX_UPLOAD_MB = float(os.getenv("VANA_STT_MAX_UPLOAD_MB", "25"))  # limite do provedor por arquivo
+STT_CODEC_ARGS = [
+    "-vn", "-ac", "1", "-ar", str(STT_SAMPLE_RATE),
+    "-c:a", "libopus", "-b:a", f"{STT_BITRATE_KBPS}k", "-application", "voip"
+]
+STT_CHUNK_EXT = "ogg"
+# Duração-alvo por chunk: 10 min mantém o fan-out paralelo do STT numa aula comum.
+# O limite de upload é só o teto (a 24 kbps ele permitiria ~2,2 h num único chunk).
+CHUNK_SECONDS_CAP = int(os.getenv("VANA_CHUNK_SECONDS", "600"))
+
+def stt_chunk_length(max_upload_mb: float = STT_MAX_UPLOAD_MB, bitrate_kbps: int = STT_BITRATE_KBPS,
+                     cap: int = CHUNK_SECONDS_CAP, safety: float = 0.9) -> int:
+    """Duração de chunk: o teto configurado, limitado ao que cabe no upload do provedor (com folga)."""
+    by_size = int(max_upload_mb * 1024 * 1024 * 8 * safety / (bitrate_kbps * 1000))
+    return min(by_size, cap) if cap > 0 else by_size
+
+CHUNK_LENGTH = stt_chunk_length()  # segundos por chunk
+STT_MODEL = "whisper-large-v3"
+STT_LANGUAGE = "en"  # Whisper detecta automaticamente, mas 'en' ajuda na base
+# Requisições simultâneas à Groq (o tempo total escala com este limite, não com a aula)
+STT_CONCURRENCY = int(os.getenv("VANA_STT_CONCURRENCY", "4"))
+# Modo streaming: elimina o source_audio.mp3 intermediário e as releituras completas
+STT_STREAMING = os.getenv("VANA_STT_STREAMING", "false").lower() == "true"
+STREAM_BLOCK = 1 << 20  # 1MB por leitura do pipe do yt-dlp
+
+# Planejador de cortes: cada corte é puxado para a pausa mais próxima dentro da janela
+SILENCE_SPLIT = os.getenv("VANA_SILENCE_SPLIT", "true").lower() == "true"
+SILENCE_NOISE = os.getenv("VANA_SILENCE_NOISE", "-35dB")
+SILENCE_MIN_DURATION = 0.4  # segundos de silêncio para contar como pausa
+SNAP_TOLERANCE = int(os.getenv("VANA_SNAP_TOLERANCE", "45"))  # segundos para cada lado
+SILENCE_REGEX = re.compile(r"silence_(start|end): (-?\d+(?:\.\d+)?)")
+DURATION_REGEX = re.compile(r"Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+# Teto do cache local de transcrições por chunk (re-execuções não pagam o Whisper de novo)
+STT_CACHE_MAX_MB = int(os.getenv("VANA_STT_CACHE_MAX_MB", "256"))
 
 def get_video_duration(url: str) -> int:
     """Obtém a duração total do vídeo sem baixá-lo (Pre-flight)."""
@@ -70,57 +122,366 @@ def download_audio(url: str, start=None, end=None) -> Path:
     subprocess.run(cmd, check=True, capture_output=True)
     return output_file
 
-def split_audio(audio_path: Path):
-    """Fatia o áudio em pedaços de 10 min para não estourar a API."""
-    print("   ✂️  Fatiando áudio em blocos de 10 minutos...")
+def detect_silences(audio_path: Path) -> Tuple[List[Tuple[float, float]], float]:
+    """
+    Passagem única e barata (decodifica sem escrever nada) que lista as pausas.
+    Retorna ([(inicio, fim), ...], duracao_total_em_segundos).
+    """
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats", "-i", str(audio_path),
+        "-af", f"silencedetect=noise={SILENCE_NOISE}:d={SILENCE_MIN_DURATION}",
+        "-f", "null", "-"
+    ]
+    log = subprocess.run(cmd, check=True, capture_output=True, text=True).stderr
+
+    m = DURATION_REGEX.search(log)
+    duration = int(m.group(1)) * 3600 + int(m.group(2)) * 60 + float(m.group(3)) if m else 0.0
+
+    silences, open_start = [], None
+    for kind, value in SILENCE_REGEX.findall(log):
+        if kind == "start":
+            open_start = max(0.0, float(value))
+        elif open_start is not None:
+            silences.append((open_start, float(value)))
+            open_start = None
+    # Silêncio que vai até o fim do arquivo não emite silence_end
+    if open_start is not None:
+        silences.append((open_start, duration))
+    return silences, duration
+
+def plan_boundaries(silences: List[Tuple[float, float]], duration: float,
+                    target: int = CHUNK_LENGTH, tolerance: int = SNAP_TOLERANCE) -> List[float]:
+    """
+    Calcula os pontos de corte: a cada `target` segundos, puxa o corte para o
+    meio da pausa mais próxima dentro de ±tolerance. Sem pausa na janela,
+    mantém o corte fixo.
+    """
+    pauses = sorted((a + b) / 2 for a, b in silences)
+    cuts: List[float] = []
+    last = 0.0
+    while duration - last > target:
+        ideal = last + target
+        i = bisect.bisect_left(pauses, ideal)
+        candidates = [p for p in pauses[max(0, i - 1):i + 1] if last < p < duration]
+        best = min(candidates, key=lambda p: abs(p - ideal), default=None)
+        cut = best if best is not None and abs(best - ideal) <= tolerance else ideal
+        cuts.append(round(cut, 3))
+        last = cut
+    return cuts
+
+def split_audio(audio_path: Path, boundaries: Optional[List[float]] = None):
+    """
+    Estágio de preparo STT: transcodifica o MP3 HQ para Opus 16 kHz mono e fatia
+    para não estourar o limite de upload da API.
+    Com `boundaries`, corta exatamente nesses instantes (ver plan_boundaries);
+    sem eles, usa blocos fixos de CHUNK_LENGTH.
+    """
     chunks_dir = WORK_DIR / "chunks"
     chunks_dir.mkdir(exist_ok=True)
     
     # Limpa chunks antigos
-    for f in chunks_dir.glob("*.mp3"): f.unlink()
+    for f in chunks_dir.glob("chunk_*.*"): f.unlink()
+
+    if boundaries:
+        print(f"   ✂️  Fatiando áudio em {len(boundaries) + 1} blocos alinhados a pausas...")
+        segment_args = ["-segment_times", ",".join(str(b) for b in boundaries)]
+    else:
+        print(f"   ✂️  Fatiando áudio em blocos de {CHUNK_LENGTH // 60} minutos...")
+        segment_args = ["-segment_time", str(CHUNK_LENGTH)]
 
     cmd = [
         "ffmpeg", "-i", str(audio_path),
-        "-f", "segment", "-segment_time", str(CHUNK_LENGTH),
-        "-c", "copy", str(chunks_dir / "chunk_%03d.mp3")
+        *STT_CODEC_ARGS,
+        "-f", "segment", *segment_args, "-reset_timestamps", "1",
+        str(chunks_dir / f"chunk_%03d.{STT_CHUNK_EXT}")
     ]
     subprocess.run(cmd, check=True, capture_output=True)
-    return sorted(list(chunks_dir.glob("*.mp3")))
+    return sorted(list(chunks_dir.glob(f"chunk_*.{STT_CHUNK_EXT}")))
 
-def run_transcription(url: str, start=None, end=None) -> dict:
-    """Fluxo principal de transcrição Diamond."""
-    client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
-    
+class StreamingSegmenter:
+    """
+    Pipeline de passagem única: yt-dlp (stdout) -> SHA-256 -> ffmpeg segment.
+    Iterar sobre o objeto entrega cada chunk no momento em que o ffmpeg o fecha.
+    O fingerprint (self.sha256) fica disponível ao final da iteração: sem corte,
+    cobre o fluxo completo de bytes; com corte, o ffmpeg fecha o pipe num ponto que
+    depende do timing, então a identidade passa a ser URL + corte (estável entre execuções).
+    Como não há análise prévia do arquivo, os cortes aqui são fixos (plan_boundaries
+    vale apenas para o modo batch).
+    """
+
+    def __init__(self, url: str, start=None, end=None, segment_time: int = CHUNK_LENGTH):
+        self.url = url
+        self.start = start
+        self.end = end
+        self.segment_time = segment_time
+        self.chunks_dir = WORK_DIR / "chunks"
+        self.sha256: Optional[str] = None
+        self.first_segment_s: Optional[float] = None
+        self._hash = hashlib.sha256()
+        self._pump_error: Optional[BaseException] = None
+        self._pipe_closed = False  # ffmpeg fechou o stdin antes do fim do download
+
+    @staticmethod
+    def _cut_seconds(value) -> float:
+        """Aceita a mesma sintaxe de duração do ffmpeg: SS[.ms], MM:SS ou H:MM:SS."""
+        try:
+            parts = [float(p) for p in str(value).strip().split(":")]
+        except ValueError:
+            parts = []
+        if not 1 <= len(parts) <= 3 or any(p < 0 for p in parts):
+            raise ValueError(f"Corte cirúrgico inválido: {value!r} (use SS, MM:SS ou H:MM:SS)")
+        seconds = 0.0
+        for part in parts:
+            seconds = seconds * 60 + part
+        return seconds
+
+    def _cut_args(self) -> List[str]:
+        """Traduz o corte cirúrgico para opções de saída do ffmpeg (entrada é um pipe)."""
+        args = []
+        start_s = self._cut_seconds(self.start) if self.start else None
+        end_s = self._cut_seconds(self.end) if self.end else None
+        if start_s:
+            args += ["-ss", f"{start_s:g}"]
+        if end_s is not None:
+            if end_s <= (start_s or 0):
+                raise ValueError(f"Corte cirúrgico vazio: fim ({self.end}) não é posterior ao início ({self.start}).")
+            # -t evita ambiguidade de -to quando combinado com -ss de saída
+            args += ["-t", f"{end_s - (start_s or 0):g}"]
+        return args
+
+    def _pump(self, src, dst):
+        """Copia o áudio do yt-dlp para o ffmpeg, alimentando o hash no caminho."""
+        try:
+            for block in iter(lambda: src.read(STREAM_BLOCK), b""):
+                self._hash.update(block)
+                dst.write(block)
+        except BrokenPipeError:
+            # ffmpeg encerrou antes (ex: fim do corte cirúrgico); o resto não importa
+            self._pipe_closed = True
+        except BaseException as e:
+            self._pump_error = e
+        finally:
+            try:
+                dst.close()
+            except BrokenPipeError:
+                self._pipe_closed = True
+
+    def __iter__(self) -> Iterator[Path]:
+        self.chunks_dir.mkdir(parents=True, exist_ok=True)
+        for f in self.chunks_dir.glob("chunk_*.*"): f.unlink()
+
+        cut_args = self._cut_args()  # corte inválido falha antes de abrir qualquer processo
+        cmd_dl = ["yt-dlp", "-f", "bestaudio", "--quiet", "--no-playlist", "-o", "-", self.url]
+        cmd_seg = [
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-i", "pipe:0", *cut_args, *STT_CODEC_ARGS,
+            "-f", "segment", "-segment_time", str(self.segment_time),
+            "-reset_timestamps", "1",
+            # A lista de segmentos vai para o stdout: uma linha por chunk já fechado
+            "-segment_list", "pipe:1", "-segment_list_type", "flat",
+            str(self.chunks_dir / f"chunk_%03d.{STT_CHUNK_EXT}")
+        ]
+
+        print(f"   📡 Streaming yt-dlp -> ffmpeg (Surgical Cut: {self.start or 'Início'} -> {self.end or 'Fim'})...")
+        t0 = time.perf_counter()
+        dl = subprocess.Popen(cmd_dl, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        seg = subprocess.Popen(cmd_seg, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        pump = threading.Thread(target=self._pump, args=(dl.stdout, seg.stdin), daemon=True)
+        pump.start()
+
+        completed = False
+        try:
+            for line in seg.stdout:
+                name = line.decode().strip()
+                if not name:
+                    continue
+                if self.first_segment_s is None:
+                    self.first_segment_s = round(time.perf_counter() - t0, 2)
+                yield self.chunks_dir / Path(name).name
+            completed = True
+        finally:
+            if not completed:
+                # Consumidor abortou (ex: falha de STT): não deixa processos órfãos no runner
+                seg.kill()
+                dl.kill()
+            pump.join()
+            # Fecha a leitura para o yt-dlp não bloquear caso o ffmpeg tenha parado antes
+            dl.stdout.close()
+            seg_err = seg.stderr.read().decode(errors="replace")
+            seg_rc, dl_rc = seg.wait(), dl.wait()
+
+        if self._pump_error:
+            raise self._pump_error
+        if seg_rc != 0:
+            raise subprocess.CalledProcessError(seg_rc, cmd_seg, stderr=seg_err)
+        # Com corte final o ffmpeg fecha o pipe cedo e o yt-dlp morre por SIGPIPE (ou sai com 1
+        # ao falhar a escrita): só isso é esperado. Rede, 403, geobloqueio etc. continuam sendo erro.
+        expected_sigpipe = bool(self.end) and self._pipe_closed and dl_rc in (-signal.SIGPIPE, 1)
+        if dl_rc != 0 and not expected_sigpipe:
+            raise subprocess.CalledProcessError(dl_rc, cmd_dl)
+        if self.start or self.end:
+            self.sha256 = sha256_text(f"{self.url}|{self.start or ''}|{self.end or ''}")
+        else:
+            self.sha256 = self._hash.hexdigest()
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(min=2, max=20))
+def _transcribe_chunk(client: Groq, chunk: Path) -> str:
+    """Envia um único chunk para o Whisper (retry isolado por chunk)."""
+    with open(chunk, "rb") as file:
+        return client.audio.transcriptions.create(
+            file=(chunk.name, file.read()),
+            model=STT_MODEL,
+            response_format="text",
+            language=STT_LANGUAGE
+        )
+
+def _chunk_key(chunk: Path) -> str:
+    """Endereço do chunk no cache: bytes do áudio + parâmetros do modelo."""
+    return sha256_text(f"{STT_MODEL}|{STT_LANGUAGE}|{sha256_file(chunk)}")
+
+def _timed_transcription(client: Groq, index: int, chunk: Path, store: Optional[ContentStore] = None) -> Dict:
+    """Transcreve um chunk (ou recupera do cache) e registra a latência (incluindo retries)."""
+    t0 = time.perf_counter()
+    key = _chunk_key(chunk) if store else None
+    text = store.get(key) if store else None
+    cached = text is not None
+    if not cached:
+        text = _transcribe_chunk(client, chunk)
+        if store: store.set(key, text)
+    return {
+        "index": index,
+        "chunk": chunk.name,
+        "key": key,
+        "cached": cached,
+        "bytes": chunk.stat().st_size,
+        "text": text,
+        "latency_s": round(time.perf_counter() - t0, 2),
+    }
+
+def transcribe_chunks(client: Groq, chunks: Iterable[Path], concurrency: int = STT_CONCURRENCY,
+                      store: Optional[ContentStore] = None) -> tuple[List[str], List[Dict]]:
+    """
+    Transcreve os chunks em paralelo (pool limitado) e remonta na ordem original.
+    Aceita uma lista pronta ou um iterador (ex: StreamingSegmenter): cada chunk
+    é submetido assim que é produzido. Com um ContentStore, chunks já vistos
+    não geram requisição.
+    Retorna (textos_em_ordem, estatisticas_por_chunk).
+    """
+    workers = max(1, concurrency)
+    print(f"   🎙️  Iniciando STT via Groq ({workers} em paralelo)...")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_timed_transcription, client, i, c, store) for i, c in enumerate(chunks)]
+        # .result() propaga a falha do chunk após esgotar os próprios retries
+        results = [future.result() for future in futures]
+
+    texts = [r["text"] for r in results]
+    stats = [{k: v for k, v in r.items() if k != "text"} for r in results]
+    return texts, stats
+
+def _cache_stats(chunk_stats: List[Dict]) -> Dict:
+    hits = sum(1 for c in chunk_stats if c.get("cached"))
+    return {"hits": hits, "misses": len(chunk_stats) - hits}
+
+def _run_streaming(client: Groq, url: str, start, end, concurrency: int, store: ContentStore) -> dict:
+    """Download, fingerprint, chunking e STT sobrepostos em uma única passagem."""
+    segmenter = StreamingSegmenter(url, start, end)
+    full_transcript, chunk_stats = transcribe_chunks(client, segmenter, concurrency, store)
+    return {
+        "content": "\n\n".join(full_transcript),
+        "sha256": segmenter.sha256,
+        "chunks_count": len(chunk_stats),
+        "stats": {
+            "mode": "streaming",
+            "first_segment_s": segmenter.first_segment_s,
+            "chunks": chunk_stats
+        }
+    }
+
+def _run_batch(client: Groq, url: str, start, end, concurrency: int, store: ContentStore) -> dict:
+    """Download completo, fingerprint e chunking antes do STT."""
     # 1. Download
     audio_file = download_audio(url, start, end)
-    
-    # 2. Fingerprint (Para o Supabase evitar duplicidade)
+
+    # 2. Fingerprint (Para o Supabase evitar duplicidade e para o cache de STT)
     sha256 = generate_fingerprint(audio_file)
-    
-    # 3. Chunking
-    chunks = split_audio(audio_file)
-    
-    # 4. Transcrição via Groq (Whisper-v3)
-    full_transcript = []
-    print(f"   🎙️  Iniciando STT via Groq ({len(chunks)} chunks)...")
-    
-    for chunk in chunks:
-        with open(chunk, "rb") as file:
-            transcription = client.audio.transcriptions.create(
-                file=(chunk.name, file.read()),
-                model="whisper-large-v3",
-                response_format="text",
-                language="en" # Whisper detecta automaticamente, mas 'en' ajuda na base
-            )
-            full_transcript.append(transcription)
-
-    # 5. Cleanup
-    audio_file.unlink()
-    
-    content = "\n\n".join(full_transcript)
-    
+
+    # Manifesto: fingerprint -> endereços dos chunks. Áudio já conhecido nem é fatiado.
+    manifests = PersistentCache("stt_manifests", ttl_seconds=30 * 86400)
+    manifest_key = (f"{sha256}|{STT_MODEL}|{CHUNK_LENGTH}|{STT_BITRATE_KBPS}k"
+                    f"|{'silence' if SILENCE_SPLIT else 'fixed'}")
+    known_keys = manifests.get(manifest_key) or []
+    known_texts = [store.get(k) for k in known_keys]
+
+    boundaries = None
+    if known_keys and all(t is not None for t in known_texts):
+        print(f"   ♻️  Fingerprint conhecido: {len(known_keys)} chunks recuperados do cache.")
+        full_transcript = known_texts
+        chunk_stats = [
+            {"index": i, "chunk": None, "key": k, "cached": True, "bytes": 0, "latency_s": 0.0}
+            for i, k in enumerate(known_keys)
+        ]
+    else:
+        # 3. Chunking (cortes puxados para as pausas da fala)
+        if SILENCE_SPLIT:
+            silences, duration = detect_silences(audio_file)
+            boundaries = plan_boundaries(silences, duration)
+        chunks = split_audio(audio_file, boundaries)
+
+        # 4. Transcrição via Groq (Whisper-v3) em paralelo, remontada em ordem
+        full_transcript, chunk_stats = transcribe_chunks(client, chunks, concurrency, store)
+        manifests.set(manifest_key, [c["key"] for c in chunk_stats])
+
+    # 5. O MP3 HQ não sobe para o STT: fica apenas para o arquivamento
     return {
-        "content": content,
+        "content": "\n\n".join(full_transcript),
         "sha256": sha256,
-        "chunks_count": len(chunks)
-    }
\ No newline at end of file
+        "audio_hq": str(audio_file),
+        "chunks_count": len(chunk_stats),
+        "stats": {
+            "mode": "batch",
+            "boundaries": boundaries,
+            "chunks": chunk_stats
+        }
+    }
+
+def _finalize_stats(result: dict, concurrency: int, t_start: float) -> dict:
+    """Consolida latência, bytes enviados e cache no result e no work/stats.json."""
+    cache = _cache_stats(result["stats"]["chunks"])
+    result["stats"].update({
+        "concurrency": concurrency,
+        "chunk_length_s": CHUNK_LENGTH,
+        "uploaded_bytes": sum(c["bytes"] for c in result["stats"]["chunks"] if not c["cached"]),
+        "wall_clock_s": round(time.perf_counter() - t_start, 2),
+        "cache": cache
+    })
+    print(f"   📊 Cache STT: {cache['hits']} hits / {cache['misses']} misses")
+    merge_stats("transcription", result["stats"])
+    return result
+
+def _stt_context() -> Tuple[Groq, ContentStore]:
+    client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+    store = ContentStore("stt", max_bytes=STT_CACHE_MAX_MB * 1024 * 1024)
+    return client, store
+
+def transcribe_files(chunks: List[Path], concurrency: int = STT_CONCURRENCY) -> dict:
+    """Transcreve chunks STT já preparados por outro estágio (ex: Stage 0 do Orquestrador)."""
+    client, store = _stt_context()
+    t_start = time.perf_counter()
+    texts, chunk_stats = transcribe_chunks(client, chunks, concurrency, store)
+    result = {
+        "content": "\n\n".join(texts),
+        "chunks_count": len(chunk_stats),
+        "stats": {"mode": "prepared", "chunks": chunk_stats}
+    }
+    return _finalize_stats(result, concurrency, t_start)
+
+def run_transcription(url: str, start=None, end=None, concurrency: int = STT_CONCURRENCY,
+                      streaming: bool = STT_STREAMING) -> dict:
+    """Fluxo principal de transcrição Diamond."""
+    client, store = _stt_context()
+    t_start = time.perf_counter()
+
+    runner = _run_streaming if streaming else _run_batch
+    result = runner(client, url, start, end, concurrency, store)
+    return _finalize_stats(result, concurrency, t_start)
@@ -1,79 +1,312 @@
 # -*- coding: utf-8 -*-
 """
-PersistentCache v2.0
-Cache persistente em disco (JSON) para sobreviver entre jobs do GitHub Actions.
-Implementa expiração baseada em TTL (Time To Live).
+PersistentCache v3.0
+Cache persistente em disco (SQLite, modo WAL) para sobreviver entre jobs do GitHub Actions.
+- get/set/has em O(1) por chave (índice da tabela), sem reescrever o arquivo inteiro
+- Expiração preguiçosa por TTL: entradas vencidas são ignoradas na leitura e removidas em lote
+  na abertura (no máximo uma vez por PURGE_INTERVAL_S), a cada PURGE_EVERY_WRITES gravações
+  e em compact()
+- Vários processos e threads podem ler/gravar ao mesmo tempo
+- Opcional: teto de bytes com evicção LRU (atime com granularidade ATIME_GRANULARITY_S) e
+  compressão zlib transparente dos valores
+- Migra automaticamente o antigo <nome>.json na primeira abertura
+
+ContentStore
+Armazém endereçado por conteúdo (SHA-256) com teto de bytes e evicção LRU.
 """
 import json
+import sqlite3
+import zlib
+import threading
 import time
 import os
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 
 # Diretório onde o cache será persistido (deve ser mapeado no actions/cache do GHA)
 CACHE_DIR = Path("work/.cache")
+# Purga das entradas vencidas: na abertura (se a última foi há mais que isso) e a cada N gravações
+PURGE_INTERVAL_S = 3600
+PURGE_EVERY_WRITES = 500
+# A leitura só regrava o atime (LRU) se ele tiver mais que isso: ler não vira escrita a cada get
+ATIME_GRANULARITY_S = 600
 
 class PersistentCache:
-    def __init__(self, name: str, ttl_seconds: int = 86400):
+    def __init__(self, name: str, ttl_seconds: int = 86400,
+                 max_bytes: Optional[int] = None, compress: bool = False):
         """
         Inicializa o cache.
         :param name: Nome do arquivo de cache (ex: 'ai_responses')
         :param ttl_seconds: Tempo de vida das entradas em segundos (padrão 24h)
+        :param max_bytes: Teto de bytes armazenados; acima disso saem os menos usados (None = sem teto)
+        :param compress: Comprime os valores com zlib (textos longos, como aulas editadas)
         """
-        self.path = CACHE_DIR / f"{name}.json"
+        self.path = CACHE_DIR / f"{name}.sqlite"
+        self.legacy_path = CACHE_DIR / f"{name}.json"
         self.ttl = ttl_seconds
-        self._data: dict = {}
-        self._load()
-
-    def _load(self):
-        """Carrega os dados do disco e limpa entradas expiradas."""
+        self.max_bytes = max_bytes
+        self.compress = compress
+        # Uma conexão por thread (ex: edit_many); o SQLite serializa as escritas entre processos
+        self._local = threading.local()
         CACHE_DIR.mkdir(parents=True, exist_ok=True)
-        if self.path.exists():
-            try:
-                raw = json.loads(self.path.read_text(encoding="utf-8"))
-                now = time.time()
-                # Filtra apenas entradas que ainda estão dentro do TTL
-                self._data = {
-                    k: v for k, v in raw.items() 
-                    if v.get("_ts", 0) + self.ttl > now
-                }
-            except Exception:
-                # Se o arquivo estiver corrompido, reseta o cache
-                self._data = {}
-
-    def _save(self):
-        """Escreve o estado atual do cache no disco de forma atômica."""
-        CACHE_DIR.mkdir(parents=True, exist_ok=True)
-        self.path.write_text(
-            json.dumps(self._data, ensure_ascii=False, indent=2),
-            encoding="utf-8"
+        conn = self._conn()
+        # Páginas liberadas pela evicção voltam ao disco sem VACUUM completo (vale para bancos novos)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, ts REAL NOT NULL)"
         )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+        if "size" not in columns:
+            conn.execute("ALTER TABLE entries ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+            conn.execute("ALTER TABLE entries ADD COLUMN atime REAL NOT NULL DEFAULT 0")
+            conn.execute("UPDATE entries SET size = length(value), atime = ts")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_atime ON entries(atime)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_ts ON entries(ts)")
+        self._init_total(conn)
+        self._import_legacy(conn)
+        self._writes = 0
+        last = conn.execute("SELECT value FROM meta WHERE name = 'last_purge'").fetchone()
+        if not last or time.time() - last[0] > PURGE_INTERVAL_S:
+            self._purge_expired(conn)
+
+    @staticmethod
+    def _init_total(conn: sqlite3.Connection):
+        """
+        Total de bytes mantido numa linha de metadados por triggers, na mesma transação de
+        cada escrita: a checagem do teto é O(1), sem SUM(size) sobre a tabela inteira.
+        """
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR IGNORE INTO meta (name, value) SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM entries"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_size_ins AFTER INSERT ON entries BEGIN "
+                "UPDATE meta SET value = value + NEW.size WHERE name = 'total_bytes'; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_size_del AFTER DELETE ON entries BEGIN "
+                "UPDATE meta SET value = value - OLD.size WHERE name = 'total_bytes'; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_size_upd AFTER UPDATE OF size ON entries BEGIN "
+                "UPDATE meta SET value = value + NEW.size - OLD.size WHERE name = 'total_bytes'; END"
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _total(conn: sqlite3.Connection) -> int:
+        row = conn.execute("SELECT value FROM meta WHERE name = 'total_bytes'").fetchone()
+        return row[0] if row else 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _import_legacy(self, conn: sqlite3.Connection):
+        """Traz as entradas válidas do JSON antigo (se existir) e o aposenta."""
+        if not self.legacy_path.exists():
+            return
+        try:
+            raw = json.loads(self.legacy_path.read_text(encoding="utf-8"))
+        except Exception:
+            # Arquivo corrompido: nada a aproveitar
+            raw = {}
+        now = time.time()
+        rows = []
+        for k, v in raw.items():
+            if isinstance(v, dict) and v.get("_ts", 0) + self.ttl > now:
+                stored = self._encode(v.get("value"))
+                rows.append((k, stored, v.get("_ts", 0), len(stored), v.get("_ts", 0)))
+        conn.execute("BEGIN IMMEDIATE")
+        # INSERT OR IGNORE: se outro processo já migrou/gravou a chave, a versão do SQLite vence
+        conn.executemany(
+            "INSERT OR IGNORE INTO entries (key, value, ts, size, atime) VALUES (?, ?, ?, ?, ?)", rows
+        )
+        conn.execute("COMMIT")
+        if self.max_bytes:
+            self._evict(conn)
+        try:
+            os.replace(self.legacy_path, self.legacy_path.with_suffix(".json.migrated"))
+        except FileNotFoundError:
+            pass
+
+    def _encode(self, value: Any) -> str | bytes:
+        raw = json.dumps(value, ensure_ascii=False)
+        # Comprimido vira BLOB; o tipo da coluna diz na leitura se precisa descomprimir
+        return zlib.compress(raw.encode("utf-8"), 6) if self.compress else raw
+
+    @staticmethod
+    def _decode(stored: str | bytes) -> Any:
+        if isinstance(stored, bytes):
+            stored = zlib.decompress(stored).decode("utf-8")
+        return json.loads(stored)
 
     def set(self, key: str, value: Any):
         """Armazena um valor vinculado a uma chave com o timestamp atual."""
-        self._data[key] = {
-            "value": value,
-            "_ts": time.time()
-        }
-        self._save()
+        stored = self._encode(value)
+        now = time.time()
+        conn = self._conn()
+        # UPSERT em vez de INSERT OR REPLACE: a substituição dispara o trigger de UPDATE (o REPLACE não
+        # dispararia o de DELETE) e o total de bytes fica correto
+        conn.execute(
+            "INSERT INTO entries (key, value, ts, size, atime) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, ts = excluded.ts, "
+            "size = excluded.size, atime = excluded.atime",
+            (key, stored, now, len(stored), now),
+        )
+        if self.max_bytes:
+            self._evict(conn)
+        self._writes += 1
+        if self._writes % PURGE_EVERY_WRITES == 0:
+            self._purge_expired(conn)
 
     def get(self, key: str) -> Any | None:
         """
         Recupera o valor se a chave existir e não estiver expirada.
-        Retorna None se não encontrar ou se expirado.
+        Retorna None se não encontrar ou se expirado (a remoção fica para a purga em lote).
         """
-        entry = self._data.get(key)
-        if not entry:
-            return None
-            
-        # Verificação dupla de expiração na leitura
-        if time.time() > entry.get("_ts", 0) + self.ttl:
-            del self._data[key]
-            self._save()
+        conn = self._conn()
+        row = conn.execute("SELECT value, ts, atime FROM entries WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if not row or now > row[1] + self.ttl:
             return None
-            
-        return entry.get("value")
+        if self.max_bytes and now - row[2] > ATIME_GRANULARITY_S:
+            # Só com teto a ordem de acesso importa (LRU); granularidade grossa basta para ela
+            conn.execute("UPDATE entries SET atime = ? WHERE key = ?", (now, key))
+        return self._decode(row[0])
 
     def has(self, key: str) -> bool:
         """Verifica se existe uma entrada válida no cache."""
-        return self.get(key) is not None
\ No newline at end of file
+        return self.get(key) is not None
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Remove entradas (vencidas primeiro, depois as menos usadas) até caber no teto."""
+        if self._total(conn) <= self.max_bytes:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            total = self._total(conn)
+            victims = []
+            cursor = conn.execute(
+                "SELECT key, size FROM entries ORDER BY (ts + ? < ?) DESC, atime",
+                (self.ttl, time.time()),
+            )
+            for key, size in cursor:
+                if total <= self.max_bytes:
+                    break
+                victims.append((key,))
+                total -= size
+            conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("PRAGMA incremental_vacuum")
+
+    def stats(self) -> dict:
+        """Entradas e bytes armazenados (para o log / work/stats.json)."""
+        conn = self._conn()
+        count = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"entries": count, "bytes": self._total(conn), "max_bytes": self.max_bytes}
+
+    def _purge_expired(self, conn: sqlite3.Connection) -> int:
+        """Apaga as entradas vencidas (pelo índice de ts) e registra quando. Retorna quantas saíram."""
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            removed = conn.execute("DELETE FROM entries WHERE ts < ?", (now - self.ttl,)).rowcount
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('last_purge', ?)", (int(now),))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if removed:
+            conn.execute("PRAGMA incremental_vacuum")
+        return removed
+
+    def compact(self) -> int:
+        """Remove em lote as entradas expiradas e devolve todo o espaço ao disco. Retorna quantas saíram."""
+        conn = self._conn()
+        removed = self._purge_expired(conn)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        return removed
+
+
+class ContentStore:
+    def __init__(self, name: str, max_bytes: int = 256 * 1024 * 1024):
+        """
+        Armazém de textos endereçados pelo hash do conteúdo de origem.
+        :param name: Subdiretório dentro do CACHE_DIR (ex: 'stt')
+        :param max_bytes: Teto de ocupação em disco; acima disso os menos usados saem
+        """
+        self.root = CACHE_DIR / name
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Os workers do STT gravam em paralelo: o contador e a evicção ficam sob o mesmo lock
+        self._lock = threading.Lock()
+        self._size = sum(p.stat().st_size for p in self.root.glob("*/*.txt"))
+
+    def _path(self, key: str) -> Path:
+        # Sharding por prefixo para não acumular milhares de arquivos num só diretório
+        return self.root / key[:2] / f"{key}.txt"
+
+    def get(self, key: str) -> str | None:
+        """Retorna o texto armazenado e marca o acesso (LRU via mtime)."""
+        p = self._path(key)
+        try:
+            text = p.read_text(encoding="utf-8")
+            self._touch(p)
+            return text
+        except FileNotFoundError:
+            return None
+
+    def set(self, key: str, text: str):
+        """Grava o texto de forma atômica e aplica o teto de tamanho."""
+        p = self._path(key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        # Temporário exclusivo por processo e thread: duas threads gravando a mesma chave não colidem
+        tmp = p.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(text, encoding="utf-8")
+        with self._lock:
+            old_size = p.stat().st_size if p.exists() else 0
+            os.replace(tmp, p)
+            self._touch(p)
+            self._size += p.stat().st_size - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    @staticmethod
+    def _touch(p: Path):
+        # Relógio explícito: alguns filesystems têm mtime com granularidade grosseira
+        now = time.time()
+        os.utime(p, (now, now))
+
+    def has(self, key: str) -> bool:
+        """Verifica se o conteúdo já foi armazenado."""
+        return self._path(key).exists()
+
+    def _evict(self):
+        """Remove as entradas menos recentemente usadas até caber no teto (chamar com o lock)."""
+        entries = []
+        for p in self.root.glob("*/*.txt"):
+            st = p.stat()
+            entries.append((st.st_mtime, st.st_size, p))
+        entries.sort()
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, p in entries:
+            if self._size <= self.max_bytes:
+                break
+            p.unlink(missing_ok=True)
+            self._size -= size
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Canonicalização v1.0 – A Chave que Sobrevive ao Corte
+- Forma canônica do texto para chaves de cache: espaços colapsados, parágrafos normalizados
+- Timestamps viram deslocamentos relativos (⟦+42⟧): um recorte --start/--end que desloca
+  todos os tempos gera a mesma chave
+- Reidratação: a resposta guardada em forma relativa recebe de volta os tempos reais
+- Fatiamento por parágrafo para reaproveitar edições já pagas trecho a trecho
+"""
+import re
+from typing import List, Optional, Tuple
+
+from src.utils.time import parse_timestamp
+
+# Timestamp com o delimitador capturado: [HH:MM:SS] ou ⟦HH:MM:SS⟧
+TS_DELIMITED = re.compile(r"([⟦\[])(\d{1,2}):(\d{2}:\d{2})([⟧\]])")
+# Forma relativa guardada no cache
+TS_RELATIVE = re.compile(r"([⟦\[])\+(-?\d+)([⟧\]])")
+# Timestamp no início de linha = início de parágrafo
+_PARA_START = re.compile(r"(?m)^[ \t]*(?=[⟦\[]\d{1,2}:\d{2}:\d{2}[⟧\]])")
+_BLANK_LINES = re.compile(r"\n\s*\n")
+
+def _seconds(m: re.Match) -> int:
+    return parse_timestamp(f"{m.group(2)}:{m.group(3)}")
+
+def base_offset(text: str) -> Optional[int]:
+    """Primeiro timestamp do texto (a origem dos deslocamentos relativos)."""
+    m = TS_DELIMITED.search(text)
+    return _seconds(m) if m else None
+
+def hour_width(text: str) -> int:
+    """Largura das horas no texto de entrada (00:05:09 vs 0:05:09), preservada na reidratação."""
+    m = TS_DELIMITED.search(text)
+    return len(m.group(2)) if m else 2
+
+def split_paragraphs(text: str) -> List[str]:
+    """
+    Parágrafos do texto: com timestamps, cada um começa no seu marcador (o que vier antes
+    do primeiro fica com ele); sem timestamps, a separação é por linha em branco.
+    """
+    starts = [m.start() for m in _PARA_START.finditer(text)]
+    if starts:
+        cuts = [0] + starts[1:] + [len(text)]
+        parts = [text[a:b] for a, b in zip(cuts, cuts[1:])]
+    else:
+        parts = _BLANK_LINES.split(text)
+    return [p.strip() for p in parts if p.strip()]
+
+def relativize(text: str, base: Optional[int]) -> str:
+    """Troca cada timestamp pelo deslocamento em relação a `base`."""
+    if base is None:
+        return text
+    return TS_DELIMITED.sub(lambda m: f"{m.group(1)}+{_seconds(m) - base}{m.group(4)}", text)
+
+def rehydrate(text: str, base: Optional[int], width: int = 2) -> str:
+    """Devolve os tempos reais a um texto em forma relativa."""
+    if base is None:
+        return text
+
+    def _abs(m: re.Match) -> str:
+        secs = max(0, base + int(m.group(2)))
+        h, rest = divmod(secs, 3600)
+        return f"{m.group(1)}{h:0{width}d}:{rest // 60:02d}:{rest % 60:02d}{m.group(3)}"
+
+    return TS_RELATIVE.sub(_abs, text)
+
+def canonical_paragraph(paragraph: str) -> str:
+    """Parágrafo com espaços colapsados e tempos relativos ao seu próprio primeiro marcador."""
+    flat = " ".join(paragraph.split())
+    return relativize(flat, base_offset(flat))
+
+def canonicalize(text: str) -> Tuple[str, Optional[int]]:
+    """
+    Forma canônica do texto inteiro e a origem usada.
+    Diferenças só de espaço/quebra de linha e deslocamentos uniformes de tempo somem.
+    """
+    flat = "\n\n".join(" ".join(p.split()) for p in split_paragraphs(text))
+    base = base_offset(flat)
+    return relativize(flat, base), base
+
+def segment_output(output: str, paragraphs: List[str]) -> Optional[List[str]]:
+    """
+    Fatia a resposta do modelo nos mesmos parágrafos da entrada.
+    Com timestamps, procura em ordem o marcador inicial de cada parágrafo; sem eles,
+    exige o mesmo número de blocos. Retorna None quando o alinhamento não é confiável.
+    """
+    leads = [base_offset(p) for p in paragraphs]
+    if all(lead is not None for lead in leads):
+        cuts, pos = [], 0
+        markers = [(m.start(), _seconds(m)) for m in TS_DELIMITED.finditer(output)]
+        for lead in leads:
+            found = next((start for start, secs in markers if start >= pos and secs == lead), None)
+            if found is None:
+                return None
+            cuts.append(found)
+            pos = found + 1
+        cuts[0] = 0
+        parts = [output[a:b].strip() for a, b in zip(cuts, cuts[1:] + [len(output)])]
+    elif not any(lead is not None for lead in leads):
+        parts = [p.strip() for p in _BLANK_LINES.split(output) if p.strip()]
+    else:
+        return None
+    return parts if len(parts) == len(paragraphs) and all(parts) else None
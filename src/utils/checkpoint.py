@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+JobManifest v1.0 – O Livro de Registro da Forja
+- Um manifesto por job em work/jobs/<hash(url + parâmetros)>/manifest.json
+- Cada estágio concluído grava suas saídas e os hashes SHA-256 dos arquivos
+- Em --resume, estágios cujas saídas ainda conferem são pulados
+"""
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.utils.io import read_json, sha256_file, sha256_text
+
+JOBS_DIR = Path("work/jobs")
+
+def _jsonable(value: Any) -> Any:
+    """Converte Paths e tuplas para algo que o JSON aceita (e que volta igual)."""
+    if isinstance(value, Path):
+        return str(value)
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    return value
+
+def _collect_files(value: Any) -> List[str]:
+    """Encontra, na saída de um estágio, os caminhos de arquivos que ela referencia."""
+    if isinstance(value, Path):
+        return [str(value)] if value.is_file() else []
+    if isinstance(value, str):
+        return [value] if len(value) < 1024 and os.path.isfile(value) else []
+    if isinstance(value, (list, tuple)):
+        return [f for v in value for f in _collect_files(v)]
+    if isinstance(value, dict):
+        return [f for v in value.values() for f in _collect_files(v)]
+    return []
+
+class JobManifest:
+    def __init__(self, source_url: str, params: Optional[Dict[str, Any]] = None, resume: bool = False):
+        """
+        :param source_url: URL da aula (parte da identidade do job)
+        :param params: Demais parâmetros que mudam o resultado (post_id, cortes, idioma...)
+        :param resume: Se False, o manifesto anterior é descartado (execução limpa)
+        """
+        identity = json.dumps({"source_url": source_url, **(params or {})}, sort_keys=True, default=str)
+        self.key = sha256_text(identity)[:16]
+        self.path = JOBS_DIR / self.key / "manifest.json"
+        self.resume = resume
+        self._lock = threading.Lock()
+
+        previous = read_json(self.path, {}) if resume else {}
+        self.data: Dict[str, Any] = previous or {
+            "key": self.key,
+            "source_url": source_url,
+            "params": params or {},
+            "context": {},
+            "stages": {},
+        }
+        self._save()
+
+    def _save(self):
+        """Escrita atômica: um crash no meio não corrompe o manifesto."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.data, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def context(self, name: str, default: Any) -> Any:
+        """Valores fixados na primeira execução (ex: nome da pasta) e reaproveitados no resume."""
+        with self._lock:
+            ctx = self.data.setdefault("context", {})
+            if name not in ctx:
+                ctx[name] = _jsonable(default)
+                self._save()
+            return ctx[name]
+
+    def record(self, stage: str, value: Any):
+        """Registra a saída do estágio e o hash de cada arquivo que ela referencia."""
+        stored = _jsonable(value)
+        entry = {
+            "value": stored,
+            "value_hash": sha256_text(json.dumps(stored, sort_keys=True, ensure_ascii=False)),
+            "files": {f: sha256_file(Path(f)) for f in _collect_files(value)},
+            "completed_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        with self._lock:
+            self.data["stages"][stage] = entry
+            self._save()
+
+    def verified(self, stage: str) -> bool:
+        """True se o estágio concluiu e suas saídas (valor e arquivos) continuam íntegras."""
+        entry = self.data["stages"].get(stage)
+        if not entry:
+            return False
+        if sha256_text(json.dumps(entry["value"], sort_keys=True, ensure_ascii=False)) != entry["value_hash"]:
+            return False
+        return all(sha256_file(Path(f)) == h for f, h in entry["files"].items())
+
+    def get(self, stage: str) -> Any:
+        entry = self.data["stages"].get(stage)
+        return entry["value"] if entry else None
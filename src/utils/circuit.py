@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+CircuitBreaker v1.0 – O Disjuntor dos Provedores
+- Janela móvel das últimas chamadas (sucesso/erro e latência)
+- Abre quando a taxa de erro (ou de chamadas lentas) passa do limite: o provedor é pulado na hora
+- Após o resfriamento, deixa passar uma única chamada de teste (meio-aberto)
+- Expõe o p95 de latência, usado para decidir quando disparar um pedido de reserva (hedge)
+"""
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+class CircuitOpenError(Exception): pass
+
+class CircuitBreaker:
+    def __init__(self, name: str, window: int = 20, min_calls: int = 3,
+                 error_rate: float = 0.5, slow_call_s: float = 90.0, cooldown_s: float = 60.0):
+        """
+        :param window: Quantas chamadas recentes entram na estatística
+        :param min_calls: Mínimo de amostras antes de o circuito poder abrir
+        :param error_rate: Fração de falhas (erros + chamadas lentas) que abre o circuito
+        :param slow_call_s: Chamadas acima disso contam como falha
+        :param cooldown_s: Tempo aberto antes da chamada de teste
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_s = slow_call_s
+        self.cooldown_s = cooldown_s
+        self.state = "closed"  # closed | open | half_open
+        self._calls: deque = deque(maxlen=window)  # (ok, latência)
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """Consulta sem efeito colateral: False enquanto o circuito está aberto e resfriando."""
+        with self._lock:
+            return self.state != "open" or time.monotonic() - self._opened_at >= self.cooldown_s
+
+    def allow(self) -> bool:
+        """True se a chamada pode seguir; no meio-aberto só uma chamada de teste passa."""
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.cooldown_s:
+                    return False
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open":
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record(self, ok: bool, latency: float):
+        with self._lock:
+            failed = not ok or latency > self.slow_call_s
+            if self.state == "half_open":
+                self._probing = False
+                if failed:
+                    self._open()
+                else:
+                    self.state = "closed"
+                    self._calls.clear()
+                    self._calls.append((True, latency))
+                return
+            self._calls.append((not failed, latency))
+            if self.state == "closed" and len(self._calls) >= self.min_calls:
+                failures = sum(1 for good, _ in self._calls if not good)
+                if failures / len(self._calls) >= self.error_rate:
+                    self._open()
+
+    def _open(self):
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        print(f"🔌 [{self.name}] Circuito aberto: provedor pulado por {self.cooldown_s:.0f}s")
+
+    def p95(self) -> Optional[float]:
+        """Latência p95 das chamadas bem-sucedidas da janela (None se poucas amostras)."""
+        with self._lock:
+            latencies = sorted(lat for good, lat in self._calls if good)
+        if len(latencies) < self.min_calls:
+            return None
+        return latencies[min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = len(self._calls)
+            failures = sum(1 for good, _ in self._calls if not good)
+        p95 = self.p95()
+        return {
+            "state": self.state,
+            "calls": total,
+            "error_rate": round(failures / total, 3) if total else 0.0,
+            "p95_s": round(p95, 2) if p95 is not None else None,
+        }
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+StageGraph v1.0 – O Regente dos Estágios
+- Estágios declarados como grafo de dependências (DAG)
+- Execução concorrente de tudo que já está liberado
+- Isolamento de falhas: só os dependentes de um estágio quebrado são pulados
+- Relatório de caminho crítico para saber onde o tempo realmente foi gasto
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+@dataclass
+class Stage:
+    name: str
+    # Recebe {nome_da_dependencia: resultado} e devolve o próprio resultado
+    fn: Callable[[Dict[str, Any]], Any]
+    deps: List[str] = field(default_factory=list)
+    # Estágios não críticos podem falhar sem marcar o job inteiro como falho
+    critical: bool = True
+
+@dataclass
+class StageResult:
+    name: str
+    status: str = "pending"  # ok | failed | skipped
+    value: Any = None
+    error: Optional[str] = None
+    started: float = 0.0
+    finished: float = 0.0
+
+    @property
+    def duration(self) -> float:
+        return max(0.0, self.finished - self.started)
+
+class StageGraph:
+    def __init__(self, stages: List[Stage], max_workers: int = 4):
+        self.stages = {s.name: s for s in stages}
+        self.max_workers = max_workers
+        self.results: Dict[str, StageResult] = {}
+        self._t0 = 0.0
+        self._validate()
+
+    def _validate(self):
+        """Garante dependências conhecidas e ausência de ciclos."""
+        for s in self.stages.values():
+            missing = [d for d in s.deps if d not in self.stages]
+            if missing:
+                raise ValueError(f"Estágio '{s.name}' depende de estágios inexistentes: {missing}")
+        self._order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        indegree = {n: len(s.deps) for n, s in self.stages.items()}
+        ready = [n for n, d in indegree.items() if d == 0]
+        order = []
+        while ready:
+            n = ready.pop(0)
+            order.append(n)
+            for m, s in self.stages.items():
+                if n in s.deps:
+                    indegree[m] -= 1
+                    if indegree[m] == 0:
+                        ready.append(m)
+        if len(order) != len(self.stages):
+            raise ValueError("Ciclo detectado no grafo de estágios.")
+        return order
+
+    def _execute(self, stage: Stage) -> StageResult:
+        result = StageResult(stage.name, started=time.perf_counter())
+        try:
+            inputs = {d: self.results[d].value for d in stage.deps}
+            result.value = stage.fn(inputs)
+            result.status = "ok"
+        except Exception as e:
+            result.status = "failed"
+            result.error = f"{type(e).__name__}: {e}"
+            print(f"❌ [DAG] Estágio '{stage.name}' falhou: {result.error}")
+        result.finished = time.perf_counter()
+        return result
+
+    def _skip_dependents(self, failed: str, pending: Dict[str, Stage]):
+        """Marca como pulados todos os estágios que dependem (transitivamente) do que falhou."""
+        for name in self._order:
+            stage = pending.get(name)
+            if stage and any(self.results.get(d) and self.results[d].status != "ok" for d in stage.deps):
+                now = time.perf_counter()
+                self.results[name] = StageResult(
+                    name, status="skipped", error=f"dependência '{failed}' não concluída",
+                    started=now, finished=now
+                )
+                del pending[name]
+
+    def run(self) -> Dict[str, StageResult]:
+        """Executa o grafo; estágios independentes rodam em paralelo."""
+        self._t0 = time.perf_counter()
+        pending = dict(self.stages)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name in [n for n in self._order if n in pending]:
+                    stage = pending[name]
+                    if all(self.results.get(d) and self.results[d].status == "ok" for d in stage.deps):
+                        print(f"▶️  [DAG] Iniciando estágio '{name}'")
+                        running[pool.submit(self._execute, stage)] = name
+                        del pending[name]
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    result = future.result()
+                    self.results[name] = result
+                    if result.status != "ok":
+                        self._skip_dependents(name, pending)
+
+        return self.results
+
+    @property
+    def failed(self) -> List[str]:
+        """Estágios críticos que não concluíram (falharam ou foram pulados)."""
+        return [
+            n for n, r in self.results.items()
+            if r.status != "ok" and self.stages[n].critical
+        ]
+
+    def critical_path(self) -> Tuple[List[str], float]:
+        """Cadeia de dependências com a maior soma de durações (o que limita o tempo total)."""
+        best: Dict[str, Tuple[float, List[str]]] = {}
+        for name in self._order:
+            r = self.results.get(name)
+            own = r.duration if r else 0.0
+            prev = max((best[d] for d in self.stages[name].deps), key=lambda x: x[0], default=(0.0, []))
+            best[name] = (prev[0] + own, prev[1] + [name])
+        total, path = max(best.values(), key=lambda x: x[0], default=(0.0, []))
+        return path, total
+
+    def report(self) -> Dict[str, Any]:
+        """Relatório de tempos para o log e para o work/stats.json."""
+        path, cp_total = self.critical_path()
+        wall = max((r.finished for r in self.results.values()), default=self._t0) - self._t0
+        return {
+            "wall_clock_s": round(wall, 2),
+            "sum_of_stages_s": round(sum(r.duration for r in self.results.values()), 2),
+            "critical_path": path,
+            "critical_path_s": round(cp_total, 2),
+            "stages": {
+                n: {
+                    "status": r.status,
+                    "start_s": round(r.started - self._t0, 2),
+                    "duration_s": round(r.duration, 2),
+                    "error": r.error,
+                }
+                for n, r in self.results.items()
+            },
+        }
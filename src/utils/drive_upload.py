@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Drive Resumable Upload v1.0 – O Carregador Paciente
+- Protocolo de upload resumível do Google Drive (sessão + Content-Range)
+- Chunks configuráveis e callback de progresso
+- Sessão e offset persistidos em disco: um job reexecutado continua de onde parou
+- Endpoint e token injetáveis (testável contra um servidor HTTP local)
+"""
+import json
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import requests
+
+from src.utils.io import read_json, write_json, sha256_file, sha256_text
+
+DRIVE_UPLOAD_URL = "https://www.googleapis.com/upload/drive/v3/files"
+# Estado das sessões (deve ser mapeado no actions/cache junto com work/.cache)
+UPLOAD_STATE_DIR = Path("work/.uploads")
+# O protocolo exige chunks múltiplos de 256 KiB
+CHUNK_GRANULARITY = 256 * 1024
+DEFAULT_CHUNK_SIZE = 32 * 1024 * 1024
+
+class UploadError(Exception): pass
+class SessionExpired(UploadError): pass
+
+def service_account_token_provider(info: Dict[str, Any], scopes=("https://www.googleapis.com/auth/drive",)) -> Callable[[], str]:
+    """
+    Gera tokens OAuth a partir do JSON da Service Account (renovando quando expira).
+    Escopo completo do Drive, como o build() original: com drive.file a Service Account não
+    enxerga a pasta compartilhada (GDRIVE_FOLDER_ID) que ela não criou.
+    """
+    from google.oauth2 import service_account
+    from google.auth.transport.requests import Request
+
+    creds = service_account.Credentials.from_service_account_info(info, scopes=list(scopes))
+
+    def provider() -> str:
+        if not creds.valid:
+            creds.refresh(Request())
+        return creds.token
+
+    return provider
+
+class ResumableUpload:
+    def __init__(self, file_path: str | Path, metadata: Dict[str, Any],
+                 token_provider: Callable[[], str],
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 on_progress: Optional[Callable[[int, int], None]] = None,
+                 base_url: str = DRIVE_UPLOAD_URL,
+                 mime_type: str = "application/octet-stream",
+                 state_dir: Path = UPLOAD_STATE_DIR,
+                 max_retries: int = 8,
+                 session: Optional[requests.Session] = None,
+                 content_id: Optional[str] = None):
+        """
+        :param metadata: Corpo do files.create (name, parents, ...)
+        :param token_provider: Função que devolve um Bearer token válido
+        :param chunk_size: Tamanho de cada PUT (arredondado para múltiplo de 256 KiB)
+        :param on_progress: Callback (bytes_confirmados, total)
+        :param base_url: Endpoint de upload (substituível por um servidor local em testes)
+        :param content_id: Identidade estável do conteúdo (ex: chave do job); sem ela, o SHA-256 do arquivo
+        """
+        self.path = Path(file_path)
+        self.metadata = metadata
+        self.token_provider = token_provider
+        self.chunk_size = max(CHUNK_GRANULARITY, chunk_size // CHUNK_GRANULARITY * CHUNK_GRANULARITY)
+        self.on_progress = on_progress
+        self.base_url = base_url
+        self.mime_type = mime_type
+        self.max_retries = max_retries
+        self.http = session or requests.Session()
+        self.total = self.path.stat().st_size
+
+        # A chave é a identidade do conteúdo + o destino: nome (com timestamp) e mtime ficam de fora,
+        # senão um job reexecutado (ou um master baixado de novo) nunca reencontra a sessão
+        identity = content_id or sha256_file(self.path)
+        destination = json.dumps(metadata.get("parents") or [], sort_keys=True)
+        fingerprint = f"{identity}|{self.total}|{destination}"
+        self.state_path = Path(state_dir) / f"{sha256_text(fingerprint)[:24]}.json"
+
+    # --- ESTADO EM DISCO ---
+    def _load_state(self) -> Dict[str, Any]:
+        return read_json(self.state_path, {}) or {}
+
+    def _save_state(self, session_uri: str, offset: int):
+        write_json(self.state_path, {
+            "session_uri": session_uri,
+            "offset": offset,
+            "total": self.total,
+            "file": str(self.path),
+            "updated_at": time.time()
+        })
+
+    def _clear_state(self):
+        self.state_path.unlink(missing_ok=True)
+
+    # --- PROTOCOLO ---
+    def _auth(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token_provider()}"}
+
+    def _start_session(self) -> str:
+        """Abre uma sessão resumível e devolve a URI de upload."""
+        resp = self.http.post(
+            self.base_url,
+            params={"uploadType": "resumable", "supportsAllDrives": "true"},
+            headers={
+                **self._auth(),
+                "X-Upload-Content-Type": self.mime_type,
+                "X-Upload-Content-Length": str(self.total),
+            },
+            json=self.metadata,
+            timeout=60,
+        )
+        if resp.status_code not in (200, 201) or "Location" not in resp.headers:
+            raise UploadError(f"Falha ao abrir sessão resumível ({resp.status_code}): {resp.text[:200]}")
+        return resp.headers["Location"]
+
+    @staticmethod
+    def _offset_from(resp: requests.Response) -> int:
+        """Lê o header Range ('bytes=0-N') de uma resposta 308."""
+        rng = resp.headers.get("Range")
+        if not rng:
+            return 0
+        return int(rng.rsplit("-", 1)[-1]) + 1
+
+    def _query_offset(self, session_uri: str) -> tuple[int, Optional[Dict]]:
+        """
+        Pergunta ao servidor quantos bytes já foram confirmados.
+        Retorna (offset, resposta_final) — resposta_final != None se o upload já terminou.
+        """
+        resp = self.http.put(
+            session_uri,
+            headers={**self._auth(), "Content-Length": "0", "Content-Range": f"bytes */{self.total}"},
+            timeout=60,
+        )
+        if resp.status_code in (200, 201):
+            return self.total, resp.json()
+        if resp.status_code == 308:
+            return self._offset_from(resp), None
+        if resp.status_code in (404, 410):
+            raise SessionExpired("Sessão expirada")
+        resp.raise_for_status()
+        raise UploadError(f"Resposta inesperada ao consultar offset: {resp.status_code}")
+
+    def _put_chunk(self, session_uri: str, offset: int) -> tuple[int, Optional[Dict]]:
+        """Envia um chunk a partir de `offset`. Retorna (novo_offset, resposta_final)."""
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            data = f.read(self.chunk_size)
+        end = offset + len(data) - 1
+        resp = self.http.put(
+            session_uri,
+            headers={**self._auth(), "Content-Length": str(len(data)), "Content-Range": f"bytes {offset}-{end}/{self.total}"},
+            data=data,
+            timeout=300,
+        )
+        if resp.status_code in (200, 201):
+            return self.total, resp.json()
+        if resp.status_code == 308:
+            return self._offset_from(resp), None
+        if resp.status_code in (404, 410):
+            raise SessionExpired("Sessão expirada")
+        resp.raise_for_status()
+        raise UploadError(f"Resposta inesperada no upload: {resp.status_code}")
+
+    def upload(self) -> Dict[str, Any]:
+        """Executa (ou retoma) o upload. Retorna o recurso criado no Drive."""
+        state = self._load_state()
+        session_uri, offset = state.get("session_uri"), 0
+
+        if session_uri:
+            try:
+                offset, final = self._query_offset(session_uri)
+                if final is not None:
+                    self._clear_state()
+                    return final
+                print(f"   ↩️  Retomando upload de {self.path.name} a partir de {offset / 1e6:.1f} MB")
+            except (UploadError, requests.RequestException):
+                session_uri, offset = None, 0
+
+        if not session_uri:
+            session_uri = self._start_session()
+            self._save_state(session_uri, 0)
+
+        failures, restarted = 0, False
+        while True:
+            try:
+                try:
+                    offset, final = self._put_chunk(session_uri, offset)
+                    failures = 0
+                except requests.RequestException as e:
+                    failures += 1
+                    if failures > self.max_retries:
+                        raise UploadError(f"Upload interrompido após {failures} falhas: {e}") from e
+                    time.sleep(min(60, 2 ** failures))
+                    try:
+                        # Após um blip de rede, o servidor é a fonte da verdade sobre o offset
+                        offset, final = self._query_offset(session_uri)
+                    except requests.RequestException:
+                        continue
+            except SessionExpired:
+                # Sessão perdida no servidor (no PUT ou na consulta após um blip):
+                # recomeça (uma vez) com uma nova, do byte zero
+                self._clear_state()
+                if restarted:
+                    raise
+                restarted = True
+                print(f"   🔁 Sessão de upload perdida; reiniciando {self.path.name} do início")
+                session_uri, offset = self._start_session(), 0
+                self._save_state(session_uri, 0)
+                continue
+
+            if self.on_progress:
+                self.on_progress(offset, self.total)
+            if final is not None:
+                self._clear_state()
+                return final
+            self._save_state(session_uri, offset)
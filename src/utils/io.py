@@ -8,6 +8,9 @@ import json
 from pathlib import Path
 from typing import Any
 
+# Estatísticas da execução (publicadas como artefato pelo workflow)
+STATS_PATH = Path("work/stats.json")
+
 def sha256_file(p: Path) -> str:
     """Gera o hash SHA-256 de um arquivo (útil para áudios grandes)."""
     h = hashlib.sha256()
@@ -47,4 +50,10 @@ def read_json(path: str | Path, default: Any = None) -> Any:
         return json.loads(p.read_text(encoding="utf-8"))
     except Exception:
         # Retorna o valor padrão em caso de erro no parse do JSON
-        return default
\ No newline at end of file
+        return default
+
+def merge_stats(section: str, data: Any, path: str | Path = STATS_PATH):
+    """Atualiza uma seção do work/stats.json preservando as demais."""
+    stats = read_json(path, {}) or {}
+    stats[section] = data
+    write_json(path, stats)
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+BudgetLedger v1.0 – O Livro-Caixa da Forja
+- Custo calculado a partir do `usage` real (entrada, saída, leitura e escrita de cache)
+- Tabela de preços por modelo, separando input / output / cached
+- SQLite em modo WAL: jobs paralelos e lotes concorrentes compartilham um único Hard-Stop
+- Reservas atômicas (BEGIN IMMEDIATE) para que N chamadas simultâneas não furem o teto
+- Resumo de gastos por execução e por estágio
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from src.utils.cache import CACHE_DIR
+
+LEDGER_PATH = CACHE_DIR / "ledger.sqlite"
+# Reservas de processos que morreram no meio da chamada deixam de contar depois disso
+RESERVATION_TTL_S = 3600
+
+class BudgetExceeded(Exception): pass
+
+# USD por 1M de tokens. cache_read/cache_write valem para tokens servidos/gravados no cache de prompt.
+# Chaves são prefixos de família: 'claude-3-5-sonnet' cobre '-latest' e as versões datadas.
+PRICING = {
+    "claude-3-5-sonnet": {"input": 3.00, "output": 15.00, "cache_read": 0.30, "cache_write": 3.75},
+    "claude-3-5-haiku": {"input": 0.80, "output": 4.00, "cache_read": 0.08, "cache_write": 1.00},
+    "gemini-1.5-pro": {"input": 1.25, "output": 5.00, "cache_read": 0.3125, "cache_write": 1.25},
+    "gemini-1.5-flash": {"input": 0.075, "output": 0.30, "cache_read": 0.01875, "cache_write": 0.075},
+    "gpt-4o-mini": {"input": 0.15, "output": 0.60, "cache_read": 0.075, "cache_write": 0.15},
+    "gpt-4o": {"input": 2.50, "output": 10.00, "cache_read": 1.25, "cache_write": 2.50},
+}
+# Modelo desconhecido: preço conservador (nível Sonnet) para o teto nunca ser subestimado
+DEFAULT_PRICE = PRICING["claude-3-5-sonnet"]
+
+def price_for(model: str) -> Dict[str, float]:
+    """Preço da família mais específica que casa com o nome do modelo."""
+    matches = [k for k in PRICING if model.startswith(k)]
+    return PRICING[max(matches, key=len)] if matches else DEFAULT_PRICE
+
+@dataclass
+class Usage:
+    input_tokens: int = 0        # entrada sem cache
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+
+    @classmethod
+    def from_response(cls, usage: Any) -> "Usage":
+        """Normaliza o `usage` de Anthropic, OpenAI e Gemini (usage_metadata)."""
+        if usage is None:
+            return cls()
+        if hasattr(usage, "prompt_token_count"):  # Gemini: prompt inclui o conteúdo em cache
+            cached = getattr(usage, "cached_content_token_count", 0) or 0
+            return cls((usage.prompt_token_count or 0) - cached,
+                       getattr(usage, "candidates_token_count", 0) or 0, cached, 0)
+        if hasattr(usage, "prompt_tokens"):  # OpenAI: prompt_tokens inclui os tokens em cache
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached = getattr(details, "cached_tokens", 0) or 0
+            return cls((usage.prompt_tokens or 0) - cached, usage.completion_tokens or 0, cached, 0)
+        return cls(  # Anthropic: input_tokens já exclui leitura/escrita de cache
+            getattr(usage, "input_tokens", 0) or 0,
+            getattr(usage, "output_tokens", 0) or 0,
+            getattr(usage, "cache_read_input_tokens", 0) or 0,
+            getattr(usage, "cache_creation_input_tokens", 0) or 0,
+        )
+
+    def cost(self, model: str) -> float:
+        p = price_for(model)
+        return (self.input_tokens * p["input"] + self.output_tokens * p["output"]
+                + self.cache_read_tokens * p["cache_read"] + self.cache_write_tokens * p["cache_write"]) / 1_000_000
+
+def estimate_cost(model: str, input_chars: int, output_chars: int) -> float:
+    """Estimativa pré-chamada (~3 chars/token), usada só para reservar orçamento."""
+    return Usage(int(input_chars / 3), int(output_chars / 3)).cost(model)
+
+_PROCESS_RUN_ID = uuid.uuid4().hex[:12]
+
+def current_run_id() -> str:
+    """Identificador da execução: VANA_RUN_ID, o run do GitHub Actions ou um id do processo."""
+    if os.getenv("VANA_RUN_ID"):
+        return os.environ["VANA_RUN_ID"]
+    if os.getenv("GITHUB_RUN_ID"):
+        return f"gha-{os.environ['GITHUB_RUN_ID']}-{os.getenv('GITHUB_RUN_ATTEMPT', '1')}"
+    return _PROCESS_RUN_ID
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS spend (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    month TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cache_read_tokens INTEGER NOT NULL DEFAULT 0,
+    cache_write_tokens INTEGER NOT NULL DEFAULT 0,
+    cost_usd REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_spend_day ON spend(day);
+CREATE INDEX IF NOT EXISTS idx_spend_month ON spend(month);
+CREATE INDEX IF NOT EXISTS idx_spend_run ON spend(run_id);
+CREATE TABLE IF NOT EXISTS reservations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    run_id TEXT NOT NULL,
+    amount REAL NOT NULL
+);
+"""
+
+class BudgetLedger:
+    def __init__(self, path: Path = LEDGER_PATH, run_id: Optional[str] = None):
+        """
+        :param path: Arquivo SQLite (fica em work/.cache, persistido pelo actions/cache)
+        :param run_id: Execução à qual os gastos são atribuídos (padrão: current_run_id())
+        """
+        self.path = Path(path)
+        self.run_id = run_id or current_run_id()
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        self._import_legacy(conn)
+
+    def _conn(self) -> sqlite3.Connection:
+        """Uma conexão por thread; autocommit com transações explícitas."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _import_legacy(self, conn: sqlite3.Connection):
+        """Traz os totais do antigo ai_costs.json na primeira abertura (o mês corrente não zera)."""
+        legacy = CACHE_DIR / "ai_costs.json"
+        if not legacy.exists() or conn.execute("SELECT 1 FROM spend LIMIT 1").fetchone():
+            return
+        try:
+            raw = json.loads(legacy.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        today, month = date.today().isoformat(), date.today().strftime("%Y-%m")
+        day_cost = (raw.get(f"cost_day_{today}") or {}).get("value") or 0.0
+        month_cost = (raw.get(f"cost_month_{month}") or {}).get("value") or 0.0
+        rows = [(today, day_cost), ("", max(0.0, month_cost - day_cost))]
+        for day, amount in rows:
+            if amount > 0:
+                conn.execute(
+                    "INSERT INTO spend (ts, day, month, run_id, stage, provider, model, cost_usd) "
+                    "VALUES (?, ?, ?, 'legacy', 'legacy', 'legacy', 'legacy', ?)",
+                    (time.time(), day, month, amount),
+                )
+
+    @staticmethod
+    def _totals(conn: sqlite3.Connection) -> tuple[float, float, float]:
+        today, month = date.today().isoformat(), date.today().strftime("%Y-%m")
+        day_cost = conn.execute("SELECT COALESCE(SUM(cost_usd), 0) FROM spend WHERE day = ?", (today,)).fetchone()[0]
+        month_cost = conn.execute("SELECT COALESCE(SUM(cost_usd), 0) FROM spend WHERE month = ?", (month,)).fetchone()[0]
+        reserved = conn.execute("SELECT COALESCE(SUM(amount), 0) FROM reservations").fetchone()[0]
+        return day_cost, month_cost, reserved
+
+    def reserve(self, amount: float, day_limit: float, month_limit: float) -> int:
+        """
+        Checa o teto e reserva `amount` numa única transação de escrita.
+        Chamadas em voo (de qualquer processo) contam como gasto até serem acertadas.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM reservations WHERE ts < ?", (time.time() - RESERVATION_TTL_S,))
+            day_cost, month_cost, reserved = self._totals(conn)
+            if day_cost + reserved + amount > day_limit:
+                raise BudgetExceeded(f"Hard-Stop Diário atingido: ${day_cost:.2f} (+${reserved:.2f} em voo)")
+            if month_cost + reserved + amount > month_limit:
+                raise BudgetExceeded(f"Hard-Stop Mensal atingido: ${month_cost:.2f} (+${reserved:.2f} em voo)")
+            cur = conn.execute("INSERT INTO reservations (ts, run_id, amount) VALUES (?, ?, ?)",
+                               (time.time(), self.run_id, amount))
+            conn.execute("COMMIT")
+            return cur.lastrowid
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _insert_spend(self, conn, provider: str, model: str, usage: Usage, stage: str) -> float:
+        cost = usage.cost(model)
+        today = date.today()
+        conn.execute(
+            "INSERT INTO spend (ts, day, month, run_id, stage, provider, model, input_tokens, output_tokens, "
+            "cache_read_tokens, cache_write_tokens, cost_usd) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (time.time(), today.isoformat(), today.strftime("%Y-%m"), self.run_id, stage, provider, model,
+             usage.input_tokens, usage.output_tokens, usage.cache_read_tokens, usage.cache_write_tokens, cost),
+        )
+        return cost
+
+    def settle(self, reservation_id: Optional[int], provider: Optional[str] = None, model: Optional[str] = None,
+               usage: Optional[Usage] = None, stage: str = "ai") -> float:
+        """Troca a reserva pelo gasto real (sem usage: a chamada falhou, só libera a reserva)."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if reservation_id is not None:
+                conn.execute("DELETE FROM reservations WHERE id = ?", (reservation_id,))
+            cost = self._insert_spend(conn, provider, model, usage, stage) if usage is not None else 0.0
+            conn.execute("COMMIT")
+            return cost
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def record(self, provider: str, model: str, usage: Usage, stage: str = "ai") -> float:
+        """Registra um gasto sem reserva prévia (consumo já ocorrido fora do fluxo reserve/settle)."""
+        return self.settle(None, provider, model, usage, stage)
+
+    def spent(self) -> Dict[str, float]:
+        day_cost, month_cost, reserved = self._totals(self._conn())
+        return {"day_usd": round(day_cost, 6), "month_usd": round(month_cost, 6), "in_flight_usd": round(reserved, 6)}
+
+    def breakdown(self, run_id: Optional[str] = None) -> Dict[str, Any]:
+        """Gasto da execução agrupado por estágio e por modelo."""
+        run_id = run_id or self.run_id
+        conn = self._conn()
+        fields = ("calls", "input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens", "cost_usd")
+        select = ("COUNT(*), SUM(input_tokens), SUM(output_tokens), SUM(cache_read_tokens), "
+                  "SUM(cache_write_tokens), SUM(cost_usd)")
+
+        def _group(column: str) -> Dict[str, Dict[str, float]]:
+            rows = conn.execute(f"SELECT {column}, {select} FROM spend WHERE run_id = ? GROUP BY {column}", (run_id,))
+            return {r[0]: {f: round(v, 6) if f == "cost_usd" else v for f, v in zip(fields, r[1:])} for r in rows}
+
+        by_stage = _group("stage")
+        return {
+            "run_id": run_id,
+            "total_usd": round(sum(s["cost_usd"] for s in by_stage.values()), 6),
+            "by_stage": by_stage,
+            "by_model": _group("model"),
+        }
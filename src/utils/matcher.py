@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Matcher de Vocabulário v1.0 – O Olho do Glossário
+- Autômato Aho-Corasick: todos os termos buscados em uma única varredura do texto
+- Normalização IAST: minúsculas, sem diacríticos, pontuação vira espaço
+- Seleciona apenas os conceitos que realmente aparecem na aula (ou na janela)
+"""
+import hashlib
+import json
+import re
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, Set
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+def strip_diacritics(text: str) -> str:
+    """Remove diacríticos (Kṛṣṇa -> Krsna, līlā -> lila)."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+def normalize(text: str) -> str:
+    """Forma canônica de busca, com espaços nas bordas para casar palavras inteiras."""
+    flat = _NON_ALNUM.sub(" ", strip_diacritics(text).lower()).strip()
+    return f" {flat} " if flat else ""
+
+class AhoCorasick:
+    def __init__(self, patterns: Dict[str, Iterable[str]]):
+        """
+        :param patterns: {padrão_normalizado: [payloads]} — cada payload é devolvido
+                         quando o padrão aparece no texto.
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Set[str]] = [set()]
+        for pattern, payloads in patterns.items():
+            self._add(pattern, payloads)
+        self._build()
+
+    def _add(self, pattern: str, payloads: Iterable[str]):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(set())
+            node = nxt
+        self._out[node].update(payloads)
+
+    def _build(self):
+        """Links de falha em BFS; as saídas dos sufixos são herdadas."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] |= self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> Set[str]:
+        """Varre o texto uma única vez e devolve os payloads encontrados."""
+        found: Set[str] = set()
+        node = 0
+        for ch in text:
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            if self._out[node]:
+                found |= self._out[node]
+        return found
+
+def vocabulary_version(dicionario: Dict[str, str]) -> str:
+    """Hash estável do glossário (muda só quando algum termo muda)."""
+    raw = json.dumps(dicionario, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+class VocabularyMatcher:
+    def __init__(self, dicionario: Dict[str, str]):
+        """Indexa cada conceito pelo slug e pela grafia IAST sem diacríticos."""
+        self.dicionario = dicionario
+        self.version = vocabulary_version(dicionario)
+        patterns: Dict[str, Set[str]] = {}
+        for slug, iast in dicionario.items():
+            for variant in (slug, iast):
+                key = normalize(str(variant))
+                if key:
+                    patterns.setdefault(key, set()).add(slug)
+        self._automaton = AhoCorasick(patterns)
+
+    def select(self, text: str) -> Dict[str, str]:
+        """Subconjunto {slug: tag_iast} dos conceitos que ocorrem no texto."""
+        hits = self._automaton.find(normalize(text))
+        return {slug: self.dicionario[slug] for slug in sorted(hits)}
+
+# Um autômato por versão do glossário (construído uma vez por processo)
+_MATCHERS: Dict[str, VocabularyMatcher] = {}
+
+def get_matcher(dicionario: Dict[str, str]) -> VocabularyMatcher:
+    version = vocabulary_version(dicionario)
+    if version not in _MATCHERS:
+        _MATCHERS[version] = VocabularyMatcher(dicionario)
+    return _MATCHERS[version]
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+RateLimit v1.0 – O Porteiro dos Provedores
+- Teto de requisições simultâneas por provedor (semáforo)
+- Balde de tokens por minuto (TPM) com reposição contínua
+- Respeita o header retry-after: o provedor inteiro entra em pausa, não só a thread que levou 429
+"""
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Extrai o retry-after (segundos ou data HTTP) da resposta anexada à exceção do SDK."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return max(0.0, float(ms) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+def wait_retry_after(fallback: Callable, max_wait: float = 120.0) -> Callable:
+    """Estratégia de espera do tenacity: usa o retry-after quando existe, senão o fallback."""
+    def _wait(retry_state) -> float:
+        exc = retry_state.outcome.exception() if retry_state.outcome else None
+        seconds = retry_after_seconds(exc) if exc else None
+        if seconds is not None:
+            return min(seconds, max_wait)
+        return fallback(retry_state)
+    return _wait
+
+class TokenBucket:
+    def __init__(self, tokens_per_minute: int):
+        """
+        :param tokens_per_minute: Capacidade do balde (0 desativa o limite)
+        """
+        self.capacity = float(tokens_per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: int):
+        """Bloqueia até haver saldo; pedidos maiores que o balde consomem o balde inteiro."""
+        if self.capacity <= 0:
+            return
+        need = min(float(tokens), self.capacity)
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self.tokens >= need:
+                    self.tokens -= need
+                    return
+                wait = (need - self.tokens) / self.rate
+            time.sleep(wait)
+
+class ProviderLimiter:
+    def __init__(self, name: str, concurrency: int, tokens_per_minute: int):
+        self.name = name
+        self.bucket = TokenBucket(tokens_per_minute)
+        self._slots = threading.BoundedSemaphore(max(1, concurrency))
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    def pause(self, seconds: float):
+        """Suspende novas chamadas ao provedor (ex: após um 429 com retry-after)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _wait_pause(self):
+        while True:
+            with self._lock:
+                remaining = self._paused_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    @contextmanager
+    def slot(self, tokens: int):
+        """Ocupa uma vaga de concorrência e debita os tokens estimados da chamada."""
+        with self._slots:
+            self._wait_pause()
+            self.bucket.acquire(tokens)
+            try:
+                yield
+            except Exception as e:
+                seconds = retry_after_seconds(e)
+                if seconds:
+                    print(f"⏳ [{self.name}] retry-after de {seconds:.1f}s: pausando o provedor")
+                    self.pause(seconds)
+                raise
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Stream Guard v1.0 – A Sentinela dos Timestamps
+- Acompanha os marcadores ⟦HH:MM:SS⟧ (ou [HH:MM:SS]) enquanto os tokens chegam
+- Aborta a geração no primeiro marcador faltante, inventado ou fora de ordem
+- Persiste o texto em work/edited/ incrementalmente (nada se perde num crash)
+- Geração abortada ainda é cobrada: partial_usage estima o consumo para o ledger
+"""
+import re
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, List, Optional
+
+from src.utils.time import parse_timestamp
+
+EDITED_DIR = Path("work/edited")
+
+# Aceita tanto a blindagem ⟦ ⟧ quanto os colchetes normais
+TS_ANY = re.compile(r"[⟦\[](\d{1,2}:\d{2}:\d{2})[⟧\]]")
+# Maior marcador possível (⟦HH:MM:SS⟧): o que sobrar além disso não é marcador parcial
+_MAX_MARKER = 10
+
+class TimestampIntegrityError(Exception): pass
+
+def partial_usage(snapshot_usage: Any, streamed_text: str, prompt_chars: int = 0) -> SimpleNamespace:
+    """
+    Consumo de uma geração interrompida, no formato `usage` da Anthropic.
+    A entrada vem do message_start (já cobrada por inteiro); a saída, o maior valor entre o
+    que o stream informou e a estimativa pelo texto recebido (~3 chars/token), já que o
+    message_delta com o total final nunca chega quando a conexão é encerrada.
+    """
+    def field(name: str) -> int:
+        return getattr(snapshot_usage, name, 0) or 0
+
+    return SimpleNamespace(
+        input_tokens=field("input_tokens") or prompt_chars // 3,
+        output_tokens=max(field("output_tokens"), len(streamed_text) // 3),
+        cache_read_input_tokens=field("cache_read_input_tokens"),
+        cache_creation_input_tokens=field("cache_creation_input_tokens"),
+    )
+
+class TimestampTracker:
+    def __init__(self, source_text: str, strict: bool = True):
+        """
+        :param source_text: Texto enviado ao modelo (define a sequência esperada)
+        :param strict: Se False, apenas registra divergências sem abortar
+        """
+        self.expected: List[int] = [parse_timestamp(t) for t in TS_ANY.findall(source_text)]
+        self.strict = strict
+        self.pos = 0
+        self.error: Optional[str] = None
+        self._tail = ""
+
+    def _fail(self, reason: str):
+        self.error = self.error or reason
+        if self.strict:
+            raise TimestampIntegrityError(reason)
+
+    def _check(self, seconds: int):
+        if self.pos < len(self.expected) and seconds == self.expected[self.pos]:
+            self.pos += 1
+        elif seconds in self.expected[self.pos + 1:]:
+            self._fail(f"Marcadores omitidos antes de {seconds}s (esperado {self.expected[self.pos]}s)")
+        else:
+            self._fail(f"Marcador inesperado ou fora de ordem: {seconds}s")
+
+    def feed(self, chunk: str):
+        """Processa um pedaço do stream; marcadores partidos entre pedaços são remontados."""
+        buf = self._tail + chunk
+        last_end = 0
+        for m in TS_ANY.finditer(buf):
+            self._check(parse_timestamp(m.group(1)))
+            last_end = m.end()
+        rest = buf[last_end:]
+        # Guarda só o que ainda pode virar um marcador quando o próximo pedaço chegar
+        cut = max(rest.rfind("⟦"), rest.rfind("["))
+        self._tail = rest[cut:] if cut != -1 and len(rest) - cut < _MAX_MARKER else ""
+
+    def finish(self):
+        """Ao fim do stream, todos os marcadores esperados precisam ter aparecido."""
+        if self.pos < len(self.expected):
+            self._fail(f"Geração terminou com {len(self.expected) - self.pos} marcadores faltando")
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.pos == len(self.expected)
+
+class StreamWriter:
+    def __init__(self, label: str):
+        """Arquivo work/edited/<label>.partial.txt atualizado a cada pedaço recebido."""
+        EDITED_DIR.mkdir(parents=True, exist_ok=True)
+        self.path = EDITED_DIR / f"{label}.partial.txt"
+        self._parts: List[str] = []
+        self._fh = open(self.path, "w", encoding="utf-8")
+
+    def write(self, piece: str):
+        self._parts.append(piece)
+        self._fh.write(piece)
+        self._fh.flush()
+
+    def close(self):
+        self._fh.close()
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -4,12 +4,18 @@ Supabase Client v6.3 Diamond
 - Persistência de Dados: Aulas, Passagens e Conceitos.
 - Vocabulário Dinâmico: Recuperação de termos IAST para a IA.
 - Gestão de UUIDs: Integração segura com o schema PostgreSQL.
+- Persistência transacional: aula + passagens numa chamada RPC (vana_save_aula), idempotente
+  por content_hash e paginada em VANA_RPC_PAGE_SIZE passagens por requisição; numa página
+  só, as passagens que saíram do post são removidas na mesma transação.
 """
 
 import os
-from typing import List, Dict, Optional, Any
+from typing import Iterable, List, Dict, Optional, Any
 from supabase import create_client, Client
 
+# Passagens por requisição (payloads muito grandes são divididos em páginas)
+RPC_PAGE_SIZE = int(os.getenv("VANA_RPC_PAGE_SIZE", "500"))
+
 class VanaSupabase:
     def __init__(self):
         # Configurações de ambiente (Secrets do GitHub ou .env)
@@ -24,16 +30,41 @@ class VanaSupabase:
     # --- GESTÃO DE VOCABULÁRIO ---
     def get_all_concepts(self) -> Dict[str, str]:
         """
-        Busca todos os conceitos e retorna um dicionário {slug: tag_iast}.
-        Usado pelo Editor.py para garantir precisão teológica.
+        Retorna o dicionário {slug: tag_iast} a partir do snapshot local compartilhado.
+        Usado pelo Editor.py para garantir precisão teológica; só vai à rede se algo mudou.
         """
-        try:
-            response = self.client.table("vana_conceitos").select("slug, tag_iast").execute()
-            # Transforma em dicionário para busca rápida O(1)
-            return {item['slug']: item['tag_iast'] for item in response.data}
-        except Exception as e:
-            print(f"⚠️ Erro ao buscar vocabulário no Supabase: {e}")
-            return {}
+        from src.utils.vocabulary import VocabularyStore
+        return VocabularyStore(db=self).concepts()
+
+    def get_concepts_since(self, since: Optional[str] = None, after_slug: Optional[str] = None,
+                           page_size: int = 1000) -> List[Dict[str, Any]]:
+        """
+        Conceitos alterados a partir da marca d'água (updated_at ISO, slug), em ordem de (updated_at, slug).
+        Sem `since`, devolve todos. Paginado para não esbarrar no limite de linhas da API.
+        O slug desempata a ordem: upserts em lote gravam o mesmo NOW() em muitas linhas e,
+        só com updated_at, o range() poderia pular ou repetir linhas entre páginas.
+        """
+        rows: List[Dict[str, Any]] = []
+        start = 0
+        while True:
+            query = self.client.table("vana_conceitos").select("slug, tag_iast, updated_at")
+            if since and after_slug:
+                # Estritamente depois do par: (updated_at > ts) OU (mesmo ts e slug maior)
+                query = query.or_(f'updated_at.gt."{since}",'
+                                  f'and(updated_at.eq."{since}",slug.gt."{after_slug}")')
+            elif since:
+                # Marca d'água antiga (só o instante): gte, reaplicar é idempotente
+                query = query.gte("updated_at", since)
+            response = query.order("updated_at").order("slug").range(start, start + page_size - 1).execute()
+            rows.extend(response.data)
+            if len(response.data) < page_size:
+                return rows
+            start += page_size
+
+    def count_concepts(self) -> Optional[int]:
+        """Total de conceitos no banco (sem trazer as linhas)."""
+        response = self.client.table("vana_conceitos").select("slug", count="exact").limit(1).execute()
+        return response.count
 
     # --- GESTÃO DE AULAS ---
     def upsert_aula(self, aula_data: Dict[str, Any]) -> Optional[str]:
@@ -56,27 +87,89 @@ class VanaSupabase:
             print(f"❌ Erro ao salvar aula no Supabase: {e}")
             return None
 
+    def save_aula_completa(self, aula_data: Dict[str, Any], passagens: Iterable[Dict[str, Any]] = (),
+                           page_size: int = RPC_PAGE_SIZE) -> str:
+        """
+        Salva a aula e suas passagens de forma atômica (uma transação por chamada ao vana_save_aula).
+        Até page_size passagens custam um único round trip e substituem as da aula na mesma
+        transação (passagens que sumiram numa reedição são removidas); acima disso, cada página
+        é atômica e idempotente, então repetir a chamada inteira após uma falha é seguro, mas
+        as passagens antigas são mantidas (nenhuma página isolada conhece o conjunto completo).
+        Retorna o UUID da aula no Supabase. Falhas são propagadas: quem chama (a etapa
+        `register` do orquestrador) precisa falhar para que o --resume tente de novo.
+        """
+        if aula_data.get("wp_post_id") is None:
+            raise ValueError("❌ Erro ao salvar aula no Supabase: wp_post_id ausente.")
+
+        rows = self._passage_rows(passagens)
+        pages = [rows[i:i + page_size] for i in range(0, len(rows), page_size)] or [[]]
+        print(f"💾 Salvando aula {aula_data['wp_post_id']} e {len(rows)} passagens no Supabase...")
+
+        try:
+            for i, page in enumerate(pages):
+                # Só a primeira página leva os dados da aula; as demais apenas a identificam
+                aula = aula_data if i == 0 else {"wp_post_id": aula_data["wp_post_id"]}
+                response = self.client.rpc("vana_save_aula", {
+                    "p_aula": aula, "p_passagens": page, "p_replace": len(pages) == 1
+                }).execute()
+                aula_id = response.data["aula_id"]
+            print("✅ Aula e passagens salvas com sucesso.")
+            return aula_id
+        except Exception as e:
+            print(f"❌ Erro ao salvar aula no Supabase: {e}")
+            raise
+
+    def save_aula_processada(self, wp_post_id: Optional[int], archive_url: Optional[str],
+                             transcription: Optional[str],
+                             passagens: Iterable[Dict[str, Any]] = ()) -> str:
+        """Registro final da Forja: aula publicada, link de preservação, transcrição bruta e passagens."""
+        aula_data = {"wp_post_id": wp_post_id, "archive_url": archive_url, "transcription_raw": transcription}
+        return self.save_aula_completa(aula_data, passagens)
+
     # --- GESTÃO DE PASSAGENS (REELS) ---
-    def save_passagens(self, aula_uuid: str, passagens: List[Dict[str, Any]]):
+    @staticmethod
+    def _passage_rows(passagens: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Converte as passagens do Parser para as colunas de vana_passagens, sem alterar os
+        dicionários recebidos. O texto limpo (sem [original]/[explicacao]) vai para `content`.
+        """
+        rows = []
+        for p in passagens:
+            content = p.get("clean_content") or p.get("content_raw") or p.get("content")
+            if not content:
+                continue
+            rows.append({
+                "type": p.get("type", "tattva"),
+                "is_reel": bool(p.get("is_reel", False)),
+                "hook": p.get("hook", ""),
+                "content": content,
+                "timestamp_start": p.get("timestamp_start"),
+            })
+        return rows
+
+    def save_passagens(self, aula_uuid: str, passagens: List[Dict[str, Any]],
+                       page_size: int = RPC_PAGE_SIZE) -> None:
         """
         Salva todos os fragmentos (Lilas, Tattvas, etc.) extraídos pelo Parser.
+        Upsert paginado por (aula_id, content_hash): reprocessar não duplica passagens.
+        Falhas são propagadas, como em save_aula_completa: repetir a chamada é seguro.
         """
-        if not passagens:
+        # Um conteúdo repetido fica com a última ocorrência (o upsert não aceita a mesma chave duas vezes)
+        rows = list({r["content"]: {**r, "aula_id": aula_uuid} for r in self._passage_rows(passagens)}.values())
+        if not rows:
             return
 
-        print(f"💎 Minerando e salvando {len(passagens)} passagens no Supabase...")
-        
-        # Prepara os dados vinculando ao UUID da aula
-        for p in passagens:
-            p['aula_id'] = aula_uuid
-            # Remove campos que são apenas para o WP se necessário
-            if 'wp_post_id' in p: del p['wp_post_id']
-
+        print(f"💎 Minerando e salvando {len(rows)} passagens no Supabase...")
         try:
-            self.client.table("vana_passagens").insert(passagens).execute()
+            for i in range(0, len(rows), page_size):
+                self.client.table("vana_passagens").upsert(
+                    rows[i:i + page_size],
+                    on_conflict="aula_id,content_hash"
+                ).execute()
             print("✅ Passagens salvas com sucesso.")
         except Exception as e:
             print(f"❌ Erro ao salvar passagens: {e}")
+            raise
 
     # --- BUSCAS ESPECÍFICAS ---
     def get_reels_queue(self) -> List[Dict]:
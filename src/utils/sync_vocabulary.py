@@ -1,68 +1,179 @@
 # -*- coding: utf-8 -*-
 """
-Sincronizador de Vocabulário v6.3 Diamond
+Sincronizador de Vocabulário v6.4 Diamond
 - Planilha Google (CSV) -> Supabase
 - Garante a integridade dos termos IAST para o Editor.
 - Suporte a slugs únicos para evitar duplicidade.
+- Sincronização por diferença: uma leitura do banco, hash de cada payload normalizado e
+  apenas inserções/atualizações/remoções reais, em lotes (VANA_SYNC_PAGE_SIZE,
+  VANA_SYNC_DELETE_PAGE_SIZE para as remoções).
+- Sem mudanças na planilha: uma leitura e nenhuma escrita.
 """
 
+import json
 import os
 import pandas as pd
 from supabase import create_client, Client
-from typing import Optional
+from typing import Any, Dict, List, Optional
+
+from src.utils.io import sha256_text
+
+TABLE = "vana_conceitos"
+FIELDS = ("slug", "tag_iast", "category", "description")
+# Termos por requisição de escrita (upserts/deletes em lote)
+PAGE_SIZE = int(os.getenv("VANA_SYNC_PAGE_SIZE", "500"))
+# Deletes vão como filtro in.(...) na URL da requisição: lotes menores para não estourar
+# o limite de tamanho de URL do gateway (slugs longos e codificados)
+DELETE_PAGE_SIZE = int(os.getenv("VANA_SYNC_DELETE_PAGE_SIZE", "100"))
+# Leitura paginada no limite padrão de linhas da API do Supabase
+READ_PAGE_SIZE = 1000
+
+def _cell(row: Dict[str, Any], key: str, default: str = "") -> str:
+    """Valor da célula como texto limpo (células vazias do CSV chegam como NaN)."""
+    value = row.get(key, default)
+    return default if pd.isna(value) else str(value).strip()
+
+def normalize_row(row: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Payload canônico de um termo: o mesmo formato vindo da planilha ou do banco.
+    Colunas da planilha: slug, tag_iast, categoria, descricao
+    """
+    return {
+        "slug": _cell(row, "slug").lower(),
+        "tag_iast": _cell(row, "tag_iast"),
+        "category": (_cell(row, "categoria") or _cell(row, "category") or "geral").lower(),
+        "description": _cell(row, "descricao") or _cell(row, "description"),
+    }
+
+def payload_hash(payload: Dict[str, str]) -> str:
+    return sha256_text(json.dumps([payload[f] for f in FIELDS], ensure_ascii=False))
+
+def diff_payloads(desired: Dict[str, Dict[str, str]],
+                  current: Dict[str, Dict[str, str]]) -> Dict[str, List]:
+    """Compara planilha e banco por slug: o que inserir, atualizar e remover."""
+    current_hashes = {slug: payload_hash(p) for slug, p in current.items()}
+    inserts, updates = [], []
+    for slug, payload in desired.items():
+        if slug not in current_hashes:
+            inserts.append(payload)
+        elif current_hashes[slug] != payload_hash(payload):
+            updates.append(payload)
+    deletes = [slug for slug in current if slug not in desired]
+    return {"inserts": inserts, "updates": updates, "deletes": deletes}
+
+def _pages(items: List, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
 
 class VanaVocabularySync:
-    def __init__(self):
+    def __init__(self, page_size: int = PAGE_SIZE, delete_page_size: int = DELETE_PAGE_SIZE):
         # Configurações via Variáveis de Ambiente (Desacoplado)
         self.supabase_url = os.getenv("SUPABASE_URL")
         self.supabase_key = os.getenv("SUPABASE_KEY")
         self.sheet_csv_url = os.getenv("GOOGLE_SHEET_VOCABULARY_URL")
+        self.page_size = max(1, page_size)
+        self.delete_page_size = max(1, delete_page_size)
         
         if not all([self.supabase_url, self.supabase_key, self.sheet_csv_url]):
             raise EnvironmentError("❌ Variáveis de ambiente do Supabase ou Google Sheet não configuradas!")
 
         self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
 
-    def run_sync(self):
-        """Executa a sincronização completa."""
+    def _load_sheet(self) -> tuple[Dict[str, Dict[str, str]], List[Dict[str, str]]]:
+        """Termos da planilha por slug (o último vence em duplicatas) e as linhas inválidas."""
+        df = pd.read_csv(self.sheet_csv_url)
+        df.columns = [c.strip().lower() for c in df.columns]
+        print(f"📊 [Sync] {len(df)} termos encontrados na planilha.")
+
+        desired: Dict[str, Dict[str, str]] = {}
+        failures: List[Dict[str, str]] = []
+        for i, row in enumerate(df.to_dict("records"), start=2):  # linha 1 é o cabeçalho
+            payload = normalize_row(row)
+            if not payload["slug"] or not payload["tag_iast"]:
+                failures.append({"slug": payload["slug"] or f"linha {i}", "error": "slug ou tag_iast vazio"})
+                continue
+            desired[payload["slug"]] = payload
+        return desired, failures
+
+    def _load_current(self) -> Dict[str, Dict[str, str]]:
+        """Estado atual do banco numa leitura paginada (uma requisição a cada 1000 termos)."""
+        current: Dict[str, Dict[str, str]] = {}
+        start = 0
+        while True:
+            response = self.supabase.table(TABLE).select(", ".join(FIELDS))\
+                .order("slug").range(start, start + READ_PAGE_SIZE - 1).execute()
+            for row in response.data:
+                payload = normalize_row(row)
+                current[payload["slug"]] = payload
+            if len(response.data) < READ_PAGE_SIZE:
+                return current
+            start += READ_PAGE_SIZE
+
+    def _apply(self, changes: Dict[str, List], failures: List[Dict[str, str]]) -> Dict[str, int]:
+        """Escreve as mudanças em lotes; um lote que falha marca cada termo dele, sem repetir linha a linha."""
+        applied = {"inserted": 0, "updated": 0, "deleted": 0}
+
+        upserts = [(p, "inserted") for p in changes["inserts"]] + [(p, "updated") for p in changes["updates"]]
+        for batch in _pages(upserts, self.page_size):
+            try:
+                # UPSERT em lote (Insere se novo, atualiza se o slug já existir)
+                self.supabase.table(TABLE).upsert([p for p, _ in batch], on_conflict="slug").execute()
+                for _, kind in batch:
+                    applied[kind] += 1
+            except Exception as e:
+                failures.extend({"slug": p["slug"], "error": str(e)} for p, _ in batch)
+
+        for batch in _pages(changes["deletes"], self.delete_page_size):
+            try:
+                self.supabase.table(TABLE).delete().in_("slug", batch).execute()
+                applied["deleted"] += len(batch)
+            except Exception as e:
+                failures.extend({"slug": slug, "error": str(e)} for slug in batch)
+
+        return applied
+
+    def run_sync(self, prune: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Executa a sincronização completa por diferença.
+        :param prune: Remove do banco os slugs que saíram da planilha
+        Retorna o relatório (contagens e falhas por termo) ou None em erro fatal.
+        """
         print("🔄 [Sync] Iniciando sincronização da Planilha Mestra...")
         
         try:
-            # 1. Carrega os dados da Planilha (Publicada como CSV)
-            df = pd.read_csv(self.sheet_csv_url)
-            
-            # Limpeza básica de dados
-            df.columns = [c.strip().lower() for c in df.columns]
-            print(f"📊 [Sync] {len(df)} termos encontrados na planilha.")
-
-            # 2. Processamento e Upload
-            success_count = 0
-            for _, row in df.iterrows():
-                # Prepara o objeto para o Supabase
-                # Certifique-se que os nomes das colunas na planilha batem com estes:
-                # slug, tag_iast, categoria, descricao
-                payload = {
-                    "slug": str(row['slug']).strip().lower(),
-                    "tag_iast": str(row['tag_iast']).strip(),
-                    "category": str(row.get('categoria', 'geral')).strip().lower(),
-                    "description": str(row.get('descricao', '')).strip()
-                }
-
-                # 3. UPSERT no Supabase (Insere se novo, atualiza se o slug já existir)
-                try:
-                    self.supabase.table("vana_conceitos").upsert(
-                        payload, 
-                        on_conflict="slug"
-                    ).execute()
-                    success_count += 1
-                except Exception as e:
-                    print(f"⚠️ Erro ao sincronizar termo '{payload['slug']}': {e}")
-
-            print(f"✅ [Sync] Sincronização concluída! {success_count} termos processados.")
+            # 1. Planilha (publicada como CSV) e banco: uma leitura de cada
+            desired, failures = self._load_sheet()
+            current = self._load_current()
+
+            # 2. Diferença por hash do payload normalizado
+            changes = diff_payloads(desired, current)
+            if not prune or not desired:
+                # Planilha vazia ou ilegível: nunca apagar o vocabulário inteiro por engano
+                changes["deletes"] = []
+            else:
+                # Linha inválida na planilha não é remoção: o termo continua no banco até ser corrigido
+                invalid = {f["slug"] for f in failures}
+                changes["deletes"] = [slug for slug in changes["deletes"] if slug not in invalid]
+
+            # 3. Escrita em lotes (nenhuma requisição se nada mudou)
+            applied = self._apply(changes, failures)
+
+            report = {
+                **applied,
+                "unchanged": len(desired) - len(changes["inserts"]) - len(changes["updates"]),
+                "failed": failures,
+            }
+            for failure in failures:
+                print(f"⚠️ Erro ao sincronizar termo '{failure['slug']}': {failure['error']}")
+            print(f"✅ [Sync] Sincronização concluída! {applied['inserted']} novos, "
+                  f"{applied['updated']} atualizados, {applied['deleted']} removidos, "
+                  f"{report['unchanged']} inalterados, {len(failures)} falhas.")
+            return report
 
         except Exception as e:
             print(f"❌ Erro fatal na sincronização: {e}")
+            return None
 
 if __name__ == "__main__":
     sync = VanaVocabularySync()
-    sync.run_sync()
\ No newline at end of file
+    sync.run_sync()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Tokenizer v1.0 – O Leitor Único
+- Divide o texto, numa única varredura, em tokens: timestamp blindado ⟦H:MM:SS⟧,
+  timestamp [H:MM:SS], referência [[REF: ...]], cerca de código ```, shortcode e texto
+- Auditoria, reparo, resolução de REFs e mineração de passagens consomem o mesmo fluxo
+"""
+import re
+from typing import Iterator, Optional
+
+# Tipos de token
+TEXT = "text"
+TS_GUARDED = "ts_guarded"
+TS = "ts"
+REF = "ref"
+FENCE = "fence"
+SHORTCODE = "shortcode"
+
+# Uma alternância só: cada posição do texto é examinada uma vez
+TOKEN_REGEX = re.compile(
+    r"(?P<ref>\[\[(?i:REF):\s*(?P<ref_key>.+?)\s*\]\])"
+    r"|(?P<ts_guarded>⟦(?P<gts>\d{1,2}:\d{2}:\d{2})⟧)"
+    r"|(?P<ts>\[(?P<nts>\d{1,2}:\d{2}:\d{2})\])"
+    r"|(?P<fence>```[a-z]*)"
+    r"|(?P<shortcode>\[\s*(?P<close>/)?\s*(?P<name>note|hk_passage|original|explicacao)"
+    # Atributos não atravessam colchetes: um [[REF]] logo depois continua sendo REF
+    r"(?:(?P<attrs>\s+[^\[\]]+?)|\s*)\])"
+)
+
+class Token:
+    __slots__ = ("kind", "text", "value", "name", "closing", "attrs", "start")
+
+    def __init__(self, kind: str, text: str, start: int, value: Optional[str] = None,
+                 name: Optional[str] = None, closing: bool = False, attrs: Optional[str] = None):
+        """
+        :param text: Trecho original exatamente como aparece na fonte
+        :param value: Timestamp (H:MM:SS) ou chave da REF
+        :param name/closing/attrs: Detalhes do shortcode ([/name] fecha; attrs cru, sem o espaço inicial)
+        """
+        self.kind = kind
+        self.text = text
+        self.start = start
+        self.value = value
+        self.name = name
+        self.closing = closing
+        self.attrs = attrs
+
+    def __repr__(self) -> str:
+        return f"Token({self.kind}, {self.text!r})"
+
+def tokenize(text: str) -> Iterator[Token]:
+    """Gera os tokens em ordem; concatenar os .text devolve exatamente o texto original."""
+    pos = 0
+    for m in TOKEN_REGEX.finditer(text):
+        if m.start() > pos:
+            yield Token(TEXT, text[pos:m.start()], pos)
+        if m.group(REF):
+            yield Token(REF, m.group(0), m.start(), value=m.group("ref_key"))
+        elif m.group(TS_GUARDED):
+            yield Token(TS_GUARDED, m.group(0), m.start(), value=m.group("gts"))
+        elif m.group(TS):
+            yield Token(TS, m.group(0), m.start(), value=m.group("nts"))
+        elif m.group(FENCE):
+            yield Token(FENCE, m.group(0), m.start())
+        else:
+            attrs = m.group("attrs")
+            yield Token(SHORTCODE, m.group(0), m.start(), name=m.group("name"),
+                        closing=bool(m.group("close")), attrs=attrs.strip() if attrs else None)
+        pos = m.end()
+    if pos < len(text):
+        yield Token(TEXT, text[pos:], pos)
+
+class WordCounter:
+    """Conta palavras de um texto que chega em pedaços (palavras partidas entre pedaços contam uma vez)."""
+    __slots__ = ("count", "_open")
+
+    def __init__(self):
+        self.count = 0
+        self._open = False  # o último pedaço terminou no meio de uma palavra
+
+    def feed(self, piece: str):
+        if not piece:
+            return
+        words = len(piece.split())
+        if words and self._open and not piece[0].isspace():
+            words -= 1
+        self.count += words
+        self._open = not piece[-1].isspace()
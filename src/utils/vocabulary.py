@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+VocabularyStore v1.0 – O Glossário Único
+- Um snapshot local e versionado com os conceitos (Supabase) e o glossário de referências (Planilha)
+- Conceitos: sincronização incremental pela marca d'água de updated_at; a contagem remota
+  denuncia remoções e força uma recarga completa
+- Planilha: só é baixada quando o modifiedTime do arquivo no Drive muda
+- Dentro de VANA_VOCAB_MAX_AGE_S desde a última checagem, nenhuma chamada de rede é feita
+- Editor, Merger e Orquestrador leem do mesmo snapshot (dicionários em memória, busca O(1))
+"""
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from src.utils.cache import CACHE_DIR
+from src.utils.io import read_json, write_json
+from src.utils.matcher import vocabulary_version
+
+VOCAB_PATH = CACHE_DIR / "vocabulary.json"
+# Janela em que o snapshot é confiado sem nem perguntar à origem se algo mudou
+VOCAB_MAX_AGE_S = int(os.getenv("VANA_VOCAB_MAX_AGE_S", "900"))
+
+class VocabularyStore:
+    def __init__(self, db: Any = None, path: Path = VOCAB_PATH, max_age_s: int = VOCAB_MAX_AGE_S):
+        """
+        :param db: VanaSupabase já instanciado (criado sob demanda se for preciso sincronizar)
+        :param path: Arquivo do snapshot (fica em work/.cache, persistido pelo actions/cache)
+        :param max_age_s: Idade máxima da última checagem antes de consultar a origem
+        """
+        self._db = db
+        self.path = Path(path)
+        self.max_age_s = max_age_s
+        self._lock = threading.Lock()
+        self.data: Dict[str, Any] = read_json(self.path, {}) or {}
+        self.data.setdefault("concepts", {})
+        self.data.setdefault("glossary", {})
+        self._concepts_map: Optional[Dict[str, str]] = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            from src.utils.supabase_client import VanaSupabase
+            self._db = VanaSupabase()
+        return self._db
+
+    @property
+    def version(self) -> str:
+        """Versão do vocabulário de conceitos (a mesma usada pelo matcher e pelo memo de prompts)."""
+        return self.data.get("version") or vocabulary_version(self.concepts_map())
+
+    def _fresh(self, checked_key: str) -> bool:
+        return time.time() - self.data.get(checked_key, 0) < self.max_age_s
+
+    def _save(self):
+        self.data["version"] = vocabulary_version(self.concepts_map())
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        write_json(tmp, self.data)
+        os.replace(tmp, self.path)
+
+    # --- CONCEITOS (SUPABASE) ---
+    def concepts_map(self) -> Dict[str, str]:
+        """{slug: tag_iast} montado uma vez a partir do snapshot."""
+        if self._concepts_map is None:
+            self._concepts_map = {slug: c["tag_iast"] for slug, c in self.data["concepts"].items()}
+        return self._concepts_map
+
+    def _sync_concepts(self) -> int:
+        """Traz só o que mudou desde a marca d'água (updated_at, slug); remoções detectadas pela contagem."""
+        concepts = self.data["concepts"]
+        watermark = self.data.get("concepts_watermark")
+        if isinstance(watermark, str):
+            # Snapshot antigo guardava só o instante
+            watermark = [watermark, None]
+        since, after_slug = watermark or (None, None)
+        changed = 0
+        for row in self.db.get_concepts_since(since, after_slug):
+            entry = {"tag_iast": row["tag_iast"], "updated_at": row.get("updated_at")}
+            # Com marca d'água antiga (gte) a linha do próprio instante volta: só conta se mudou
+            changed += concepts.get(row["slug"]) != entry
+            concepts[row["slug"]] = entry
+            watermark = self._advance_watermark(watermark, row)
+
+        remote_total = self.db.count_concepts()
+        if remote_total is not None and remote_total != len(concepts):
+            # Algum conceito foi removido (ou renomeado): recarga completa
+            print(f"   🔄 [Vocabulário] {len(concepts)} locais vs {remote_total} remotos: recarga completa")
+            rows = self.db.get_concepts_since(None)
+            concepts = {r["slug"]: {"tag_iast": r["tag_iast"], "updated_at": r.get("updated_at")} for r in rows}
+            watermark = None
+            for r in rows:
+                watermark = self._advance_watermark(watermark, r)
+            changed = len(rows)
+
+        self.data["concepts"] = concepts
+        self.data["concepts_watermark"] = watermark
+        self.data["concepts_checked_at"] = time.time()
+        self._concepts_map = None
+        return changed
+
+    @staticmethod
+    def _advance_watermark(watermark: Optional[list], row: Dict[str, Any]) -> Optional[list]:
+        """Maior par [updated_at, slug] visto até aqui (mesma ordem da consulta)."""
+        if not row.get("updated_at"):
+            return watermark
+        pair = [row["updated_at"], row["slug"]]
+        if watermark is None or (pair[0], pair[1]) > (watermark[0], watermark[1] or ""):
+            return pair
+        return watermark
+
+    def concepts(self) -> Dict[str, str]:
+        """Conceitos {slug: tag_iast}; sincroniza antes apenas se a checagem anterior venceu."""
+        with self._lock:
+            if not self.data["concepts"] or not self._fresh("concepts_checked_at"):
+                try:
+                    changed = self._sync_concepts()
+                    self._save()
+                    print(f"🧠 Vocabulário sincronizado: {changed} conceito(s) novo(s)/alterado(s), "
+                          f"{len(self.data['concepts'])} no total")
+                except Exception as e:
+                    # Offline: o snapshot anterior continua valendo
+                    print(f"⚠️ Falha ao sincronizar vocabulário ({e}). Usando snapshot local.")
+            return self.concepts_map()
+
+    # --- GLOSSÁRIO DE REFERÊNCIAS (PLANILHA) ---
+    def glossary(self, revision: Callable[[], Optional[str]], fetch: Callable[[], Dict[str, str]]) -> Dict[str, str]:
+        """
+        Glossário {chave: conteúdo} da planilha.
+        :param revision: Devolve o modifiedTime atual da planilha (None se indisponível)
+        :param fetch: Baixa o mapeamento completo (só chamado quando a revisão mudou)
+        """
+        with self._lock:
+            cached = self.data["glossary"]
+            if cached and self._fresh("glossary_checked_at"):
+                return cached
+
+            try:
+                current = revision()
+            except Exception as e:
+                print(f"   ⚠️ Não foi possível ler a revisão da planilha ({e}).")
+                current = None
+
+            if cached and current and current == self.data.get("glossary_revision"):
+                self.data["glossary_checked_at"] = time.time()
+                self._save()
+                return cached
+
+            try:
+                mapping = fetch()
+            except Exception:
+                if cached:
+                    print(f"   ⚠️ Falha na API Google Sheets. Usando glossário local.")
+                    return cached
+                raise
+
+            self.data["glossary"] = mapping
+            self.data["glossary_revision"] = current
+            self.data["glossary_checked_at"] = time.time()
+            self._save()
+            return mapping
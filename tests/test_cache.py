@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""PersistentCache: purga das entradas vencidas e atime (LRU) com granularidade grossa."""
+import time
+
+import pytest
+
+from src.utils import cache
+from src.utils.cache import PersistentCache
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+def _rows(c):
+    return c._conn().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+def _age(c, key, seconds):
+    c._conn().execute("UPDATE entries SET ts = ts - ?, atime = atime - ? WHERE key = ?", (seconds, seconds, key))
+
+def test_expired_rows_are_purged_on_open_without_max_bytes(monkeypatch):
+    c = PersistentCache("stt_manifests", ttl_seconds=60)
+    c.set("velha", {"v": 1})
+    c.set("nova", {"v": 2})
+    _age(c, "velha", 120)
+    assert c.get("velha") is None and _rows(c) == 2
+
+    monkeypatch.setattr(cache, "PURGE_INTERVAL_S", 0)
+    reopened = PersistentCache("stt_manifests", ttl_seconds=60)
+    assert _rows(reopened) == 1
+    assert reopened.get("nova") == {"v": 2}
+    assert reopened.stats()["bytes"] == len('{"v": 2}')
+
+def test_purge_on_open_is_throttled():
+    c = PersistentCache("c", ttl_seconds=60)
+    c.set("velha", 1)
+    _age(c, "velha", 120)
+    # A purga da abertura anterior foi agora há pouco: reabrir não varre de novo
+    assert _rows(PersistentCache("c", ttl_seconds=60)) == 1
+
+def test_purge_every_n_writes(monkeypatch):
+    monkeypatch.setattr(cache, "PURGE_EVERY_WRITES", 3)
+    c = PersistentCache("c", ttl_seconds=60)
+    c.set("velha", 1)
+    _age(c, "velha", 120)
+    c.set("a", 1)
+    assert _rows(c) == 2
+    c.set("b", 1)  # terceira gravação: purga
+    keys = {k for (k,) in c._conn().execute("SELECT key FROM entries")}
+    assert keys == {"a", "b"}
+
+def test_get_refreshes_atime_only_when_stale():
+    c = PersistentCache("c", ttl_seconds=3600, max_bytes=1 << 20)
+    c.set("k", "v")
+    atime = lambda: c._conn().execute("SELECT atime FROM entries WHERE key = 'k'").fetchone()[0]
+    first = atime()
+    c.get("k")
+    assert atime() == first
+
+    c._conn().execute("UPDATE entries SET atime = atime - ?", (cache.ATIME_GRANULARITY_S + 1,))
+    c.get("k")
+    assert atime() == pytest.approx(time.time(), abs=5)
+
+def test_compact_removes_expired():
+    c = PersistentCache("c", ttl_seconds=60)
+    c.set("velha", 1)
+    c.set("nova", 2)
+    _age(c, "velha", 120)
+    assert c.compact() == 1
+    assert _rows(c) == 1
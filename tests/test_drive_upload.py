@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Upload resumível do Drive contra um servidor HTTP local que imita o protocolo
+(sessão via POST, PUTs com Content-Range, 308 + Range, 404 para sessão expirada).
+"""
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from src.utils import drive_upload
+from src.utils.drive_upload import CHUNK_GRANULARITY, ResumableUpload, UploadError
+
+class FakeDrive:
+    """Estado do servidor: bytes recebidos por sessão e sessões expiradas."""
+    def __init__(self):
+        self.sessions = {}
+        self.expired = set()
+        self.posts = []
+        self.puts = []  # (sessão, Content-Range)
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, headers=None, body=None):
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        drive = self.server.drive
+        length = int(self.headers.get("Content-Length", 0))
+        drive.posts.append({"path": self.path, "metadata": json.loads(self.rfile.read(length) or b"{}")})
+        sid = uuid.uuid4().hex
+        drive.sessions[sid] = bytearray()
+        self._reply(200, {"Location": f"http://{self.server.server_address[0]}:{self.server.server_port}/s/{sid}"})
+
+    def do_PUT(self):
+        drive = self.server.drive
+        sid = self.path.rsplit("/", 1)[-1]
+        length = int(self.headers.get("Content-Length", 0))
+        data = self.rfile.read(length)
+        content_range = self.headers["Content-Range"]
+        drive.puts.append((sid, content_range))
+        if sid in drive.expired or sid not in drive.sessions:
+            return self._reply(404)
+
+        received = drive.sessions[sid]
+        span, total = content_range.split(" ", 1)[1].split("/")
+        if span != "*":
+            start = int(span.split("-")[0])
+            del received[start:]
+            received.extend(data)
+        if len(received) == int(total):
+            return self._reply(200, body={"id": sid, "size": len(received)})
+        headers = {"Range": f"bytes=0-{len(received) - 1}"} if received else {}
+        self._reply(308, headers)
+
+@pytest.fixture
+def drive():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.drive = FakeDrive()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def media(tmp_path):
+    path = tmp_path / "master.mp4"
+    path.write_bytes(bytes(range(256)) * (CHUNK_GRANULARITY * 5 // 2 // 256))  # 2,5 chunks
+    return path
+
+def _uploader(server, media, state_dir, **kwargs):
+    url = f"http://127.0.0.1:{server.server_port}/upload"
+    return ResumableUpload(media, {"name": "x", "parents": ["pasta"]}, lambda: "token",
+                           chunk_size=CHUNK_GRANULARITY, base_url=url, state_dir=state_dir, **kwargs)
+
+def test_upload_in_chunks(drive, media, tmp_path):
+    progress = []
+    result = _uploader(drive, media, tmp_path / "state", on_progress=lambda s, t: progress.append(s)).upload()
+
+    assert bytes(drive.drive.sessions[result["id"]]) == media.read_bytes()
+    assert progress == [CHUNK_GRANULARITY, 2 * CHUNK_GRANULARITY, media.stat().st_size]
+    assert "supportsAllDrives=true" in drive.drive.posts[0]["path"]
+    assert not list((tmp_path / "state").glob("*.json"))
+
+def test_resume_continues_from_server_offset(drive, media, tmp_path):
+    class Crash(Exception): pass
+
+    def crash_after_first_chunk(sent, total):
+        raise Crash()
+
+    with pytest.raises(Crash):
+        _uploader(drive, media, tmp_path / "state", on_progress=crash_after_first_chunk).upload()
+
+    # Novo processo: reencontra a sessão, consulta o offset (308 + Range) e segue dali
+    result = _uploader(drive, media, tmp_path / "state").upload()
+    ranges = [r for _, r in drive.drive.puts]
+    total = media.stat().st_size
+    assert len(drive.drive.posts) == 1
+    assert ranges[1] == f"bytes */{total}"
+    assert ranges[2] == f"bytes {CHUNK_GRANULARITY}-{2 * CHUNK_GRANULARITY - 1}/{total}"
+    assert bytes(drive.drive.sessions[result["id"]]) == media.read_bytes()
+
+def test_expired_session_restarts_once(drive, media, tmp_path):
+    def expire(sent, total):
+        if not drive.drive.expired:
+            drive.drive.expired.update(drive.drive.sessions)
+
+    result = _uploader(drive, media, tmp_path / "state", on_progress=expire).upload()
+    assert len(drive.drive.posts) == 2
+    assert bytes(drive.drive.sessions[result["id"]]) == media.read_bytes()
+
+def test_expired_session_found_after_network_blip(drive, media, tmp_path, monkeypatch):
+    monkeypatch.setattr(drive_upload.time, "sleep", lambda s: None)
+
+    class FlakySession(requests.Session):
+        """Primeiro PUT com dados cai; enquanto isso o servidor expira a sessão."""
+        failed = False
+
+        def put(self, url, **kwargs):
+            if kwargs.get("data") and not self.failed:
+                self.failed = True
+                drive.drive.expired.update(drive.drive.sessions)
+                raise requests.ConnectionError("blip")
+            return super().put(url, **kwargs)
+
+    result = _uploader(drive, media, tmp_path / "state", session=FlakySession()).upload()
+    assert len(drive.drive.posts) == 2
+    assert bytes(drive.drive.sessions[result["id"]]) == media.read_bytes()
+
+def test_second_expiry_raises(drive, media, tmp_path):
+    def expire(sent, total):
+        drive.drive.expired.update(drive.drive.sessions)
+
+    with pytest.raises(UploadError):
+        _uploader(drive, media, tmp_path / "state", on_progress=expire).upload()
+    assert not list((tmp_path / "state").glob("*.json"))
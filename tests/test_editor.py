@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Editor em janelas: fatiamento e costura sem o modelo (geração substituída pela identidade)."""
+import pytest
+
+pytest.importorskip("anthropic")
+
+from src import editor
+from src.editor import VanaEditor
+
+@pytest.fixture
+def vana(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # ledger e work/ ficam no diretório temporário
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    ed = VanaEditor(dicionario={"narasimha": "Narasiṁha"})
+    # Janela "sem edições": o modelo devolve exatamente o trecho recebido
+    monkeypatch.setattr(ed, "_generate", lambda system_blocks, user_input, source, label: source)
+    return ed
+
+def _long_paragraph(ts: str, lines: int) -> str:
+    body = "\n".join(f"Linha {i} do verso, dita por Gurudeva sem pausa longa. E segue a explicação {i}!"
+                     for i in range(lines))
+    return f"{ts} {body}"
+
+def test_split_oversized_keeps_separators():
+    paragraph = _long_paragraph("⟦0:00:01⟧", 400)
+    pieces = VanaEditor._split_oversized(paragraph)
+    assert len(pieces) > 1
+    assert "".join(text + sep for text, sep in pieces) == paragraph
+    assert all(len(text) <= editor.WINDOW_TOKENS * 3 for text, _ in pieces)
+
+def test_split_oversized_without_punctuation_cuts_between_words():
+    paragraph = " ".join(["palavra"] * 3000)
+    pieces = VanaEditor._split_oversized(paragraph)
+    assert len(pieces) > 1
+    assert "".join(text + sep for text, sep in pieces) == paragraph
+
+def test_windowed_round_trip_without_edits(vana):
+    text = "\n\n".join([
+        "⟦0:00:01⟧ Abertura curta com Narasimha.",
+        _long_paragraph("⟦0:01:00⟧", 500),
+        "⟦0:20:00⟧ Parágrafo do meio.\nCom uma quebra de linha interna.",
+        _long_paragraph("⟦0:21:00⟧", 300),
+        "⟦0:40:00⟧ Encerramento.",
+    ])
+    windows = vana._build_windows(vana._split_paragraphs(text))
+    assert len(windows) > 2
+    assert vana._refine_windowed(text, "pt", "#") == text
+
+def test_static_prefix_below_provider_minimum_is_not_marked_for_cache(vana):
+    prefix = vana._build_system_prompt("pt")
+    blocks = vana._system_blocks("pt", "⟦0:00:01⟧ Narasimha")
+    # Prefixo atual (~350 tokens) não atinge o mínimo do provedor: sem marcador e sem aquecimento
+    assert vana._estimate_tokens(prefix) < editor.PROMPT_CACHE_MIN_TOKENS
+    assert not vana._prefix_cacheable("pt")
+    assert "cache_control" not in blocks[0]
+    assert "Narasiṁha" in blocks[1]["text"] and "Narasiṁha" not in prefix
+
+def test_static_prefix_above_minimum_is_marked_for_cache(vana, monkeypatch):
+    monkeypatch.setattr(editor, "PROMPT_CACHE_MIN_TOKENS", vana._estimate_tokens(vana._build_system_prompt("pt")))
+    assert vana._system_blocks("pt", "texto")[0]["cache_control"] == {"type": "ephemeral"}
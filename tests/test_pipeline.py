@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Cadeia fundida: mesma saída que reparo e merger rodando como etapas isoladas."""
+import pytest
+
+from src import auditor_reparador, merger, pipeline
+from src.utils.io import read_json
+
+EDITED = (
+    "```text\n"
+    "⟦00:00:05⟧ Abertura com [[REF: Bhakti]] e [ note ]nota[ /note ].\n\n"
+    "⟦0:01:10⟧ [hk_passage type=\"lila\" reel=\"true\" hook=\"Gancho\"]"
+    "[original]verso[/original] [explicacao]Kṛṣṇa brinca.[/explicacao][/hk_passage]\n\n"
+    "[0:02:00] Fim com [[REF: desconhecida]].\n```"
+)
+GLOSSARY = {"bhakti": "Serviço devocional <puro>"}
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(merger, "load_glossary", lambda: (GLOSSARY, True))
+    monkeypatch.setattr(pipeline, "load_glossary", lambda: (GLOSSARY, True))
+
+def test_fused_chain_matches_separate_passes():
+    auditor_reparador.INP_PATH.parent.mkdir(parents=True, exist_ok=True)
+    auditor_reparador.INP_PATH.write_text(EDITED, encoding="utf-8")
+    repair = auditor_reparador.run_repair()
+    separate = merger.run_merger()
+    expected = merger.OUT_PATH.read_text(encoding="utf-8")
+
+    fused = pipeline.run_chain(7, content=EDITED)
+
+    assert merger.OUT_PATH.read_text(encoding="utf-8") == expected
+    # Sem arquivo intermediário: o relatório do reparo aponta para o post final
+    assert {**fused["repair"], "output_file": repair["output_file"]} == repair
+    assert fused["merger"] == separate
+    assert "[note]Serviço devocional &lt;puro&gt;[/note]" in expected
+    assert "⟦" not in expected
+
+def test_fused_chain_mines_passages_from_final_text():
+    result = pipeline.run_chain(7, content=EDITED)
+    passages = read_json(result["passages_file"], [])
+    final = merger.OUT_PATH.read_text(encoding="utf-8")
+
+    assert result["passages"] == 1
+    (p,) = passages
+    assert p["wp_post_id"] == 7 and p["type"] == "lila" and p["is_reel"] and p["hook"] == "Gancho"
+    assert p["timestamp_start"] == "0:01:10"
+    assert p["clean_content"] == "verso Kṛṣṇa brinca."
+    assert p["content_raw"] in final
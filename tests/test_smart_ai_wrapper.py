@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Streaming do SmartAIWrapper: gerações abortadas também chegam ao ledger."""
+from types import SimpleNamespace
+
+import pytest
+
+from src import smart_ai_wrapper
+from src.smart_ai_wrapper import SmartAIWrapper
+from src.utils.stream_guard import TimestampIntegrityError
+
+SOURCE = "[0:00:01] Primeiro parágrafo.\n\n[0:00:09] Segundo parágrafo."
+
+class FakeStream:
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.current_message_snapshot = SimpleNamespace(usage=SimpleNamespace(
+            input_tokens=500, output_tokens=1, cache_read_input_tokens=0, cache_creation_input_tokens=0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        yield from self.pieces
+
+    def get_final_message(self):
+        return SimpleNamespace(usage=SimpleNamespace(input_tokens=500, output_tokens=40))
+
+class FakeClaude:
+    """Devolve, a cada messages.stream, a próxima geração do roteiro."""
+    def __init__(self, script):
+        self.script = list(script)
+        self.messages = self
+
+    def stream(self, **kwargs):
+        return FakeStream(self.script.pop(0))
+
+@pytest.fixture
+def wrapper(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # ledger, cache e work/edited no diretório temporário
+    return SmartAIWrapper()
+
+def _calls(w):
+    return w.ledger.breakdown()["by_stage"].get("test", {}).get("calls", 0)
+
+def test_integrity_aborts_are_charged_and_retried_with_new_reservations(wrapper):
+    out_of_order = ["⟦0:00:09⟧ Segundo" + "x" * 300]
+    good = ["⟦0:00:01⟧ Primeiro. ", "⟦0:00:09⟧ Segundo."]
+    wrapper._clients["claude"] = FakeClaude([out_of_order, out_of_order, good])
+
+    result = wrapper._attempt("claude", "Edite.", SOURCE, stream=True, stage="test")
+
+    assert result.text == "⟦0:00:01⟧ Primeiro. ⟦0:00:09⟧ Segundo."
+    assert _calls(wrapper) == 3
+    assert wrapper.ledger.spent()["in_flight_usd"] == 0
+    # A saída cobrada no aborto vem do texto recebido (~3 chars/token), não do snapshot
+    assert wrapper._usage["output_tokens"] >= 2 * (len(out_of_order[0]) // 3)
+
+def test_rejected_finish_is_charged(wrapper, monkeypatch):
+    monkeypatch.setattr(smart_ai_wrapper, "INTEGRITY_ATTEMPTS", 1)
+    missing_last = ["⟦0:00:01⟧ Primeiro, e o resto sumiu."]
+    wrapper._clients["claude"] = FakeClaude([missing_last])
+
+    with pytest.raises(TimestampIntegrityError):
+        wrapper._attempt("claude", "Edite.", SOURCE, stream=True, stage="test")
+
+    assert _calls(wrapper) == 1
+    assert wrapper.ledger.breakdown()["by_stage"]["test"]["output_tokens"] == 40
+    assert wrapper.ledger.spent()["in_flight_usd"] == 0
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""VanaSupabase: falhas de gravação chegam a quem chama (o --resume depende disso)."""
+import pytest
+
+pytest.importorskip("supabase")
+
+from src.utils.supabase_client import VanaSupabase
+
+class FailingClient:
+    """Qualquer table(...).upsert(...).execute() ou rpc(...).execute() falha."""
+    def table(self, name):
+        return self
+
+    def rpc(self, name, params):
+        return self
+
+    def upsert(self, rows, on_conflict=None):
+        return self
+
+    def execute(self):
+        raise ConnectionError("supabase fora do ar")
+
+@pytest.fixture
+def db():
+    db = VanaSupabase.__new__(VanaSupabase)
+    db.client = FailingClient()
+    return db
+
+PASSAGEM = {"type": "lila", "content_raw": "x", "clean_content": "x", "timestamp_start": "00:00:01"}
+
+def test_save_passagens_raises(db):
+    with pytest.raises(ConnectionError):
+        db.save_passagens("uuid-aula", [PASSAGEM])
+
+def test_save_aula_completa_raises(db):
+    with pytest.raises(ConnectionError):
+        db.save_aula_completa({"wp_post_id": 1}, [PASSAGEM])
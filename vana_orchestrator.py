@@ -3,13 +3,26 @@ import argparse
 import subprocess
 import json
 from datetime import datetime
-from src.transcriber import VanaTranscriber
+from pathlib import Path
+from src.transcriber import transcribe_files, STT_CODEC_ARGS, STT_CHUNK_EXT, CHUNK_LENGTH
 from src.editor import VanaEditor
+from src.pipeline import run_chain
 from src.utils.wp_rest_client import VanaWPClient
 from src.utils.supabase_client import VanaSupabase
+from src.utils.dag import Stage, StageGraph
+from src.utils.checkpoint import JobManifest
+from src.utils.io import merge_stats, read_json
+from src.utils.ledger import BudgetLedger
+from src.utils.vocabulary import VocabularyStore
+from src.utils.drive_upload import ResumableUpload, service_account_token_provider
 from internetarchive import upload as ia_upload
-from googleapiclient.discovery import build
-from google.oauth2 import service_account
+
+# Intervalo entre Golden Frames (1 a cada 5 min)
+FRAME_INTERVAL = 300
+# Estágios independentes rodando ao mesmo tempo (uploads, vocabulário, STT...)
+STAGE_WORKERS = int(os.getenv("VANA_STAGE_WORKERS", "4"))
+# Tamanho de cada PUT do upload resumível para o Drive
+DRIVE_CHUNK_MB = int(os.getenv("GDRIVE_CHUNK_MB", "32"))
 
 class VanaOrchestrator:
     def __init__(self):
@@ -19,97 +32,233 @@ class VanaOrchestrator:
         os.makedirs(f"{self.output_dir}/frames", exist_ok=True)
         os.makedirs(f"{self.output_dir}/audio", exist_ok=True)
 
+    def _probe_duration(self, media_path):
+        """Lê a duração do container sem decodificar nada."""
+        out = subprocess.check_output([
+            'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+            '-of', 'default=nw=1:nk=1', media_path
+        ])
+        return float(out.decode().strip() or 0)
+
     def stage_0_preservation(self, video_url, folder_name):
-        """Baixa o vídeo, extrai áudio HQ e gera Golden Frames."""
+        """
+        Baixa o vídeo e, a partir desse único master, gera o áudio HQ, os chunks
+        STT e os Golden Frames. O custo de CPU escala com o número de frames,
+        não com a duração do vídeo (o vídeo nunca é decodificado por inteiro).
+        """
         print(f"📥 [STAGE 0] Iniciando preservação de: {video_url}")
         
         video_path = f"{self.output_dir}/video_master.mp4"
         audio_hq = f"{self.output_dir}/audio/audio_hq.mp3"
+        chunks_dir = Path(self.output_dir) / "audio" / "chunks"
+        chunks_dir.mkdir(parents=True, exist_ok=True)
+        for f in chunks_dir.glob("chunk_*.*"): f.unlink()
 
-        # 1. Download Master via yt-dlp
+        # 1. Download Master via yt-dlp (sem pós-processamento de áudio)
         cmd_dl = [
             'yt-dlp', '-o', video_path,
-            '--extract-audio', '--audio-format', 'mp3', '--audio-quality', '0',
-            '--keep-video', video_url
+            '-f', 'bestvideo*+bestaudio/best', '--merge-output-format', 'mp4',
+            video_url
         ]
         subprocess.run(cmd_dl, check=True)
 
-        # 2. Extração de Golden Frames via ffmpeg (1 a cada 5 min)
-        print("📸 Extraindo Golden Frames para a Batalha de Capas...")
-        cmd_frames = [
-            'ffmpeg', '-i', video_path, '-vf', 'fps=1/300', 
-            f'{self.output_dir}/frames/frame_%03d.jpg'
+        # 2. Fan-out de áudio: uma decodificação alimenta o MP3 HQ e os chunks STT
+        print("🎧 Gerando Áudio HQ e chunks STT em uma única passagem...")
+        cmd_audio = [
+            'ffmpeg', '-y', '-i', video_path,
+            '-map', '0:a:0', '-vn', '-c:a', 'libmp3lame', '-q:a', '0', audio_hq,
+            '-map', '0:a:0', *STT_CODEC_ARGS,
+            '-f', 'segment', '-segment_time', str(CHUNK_LENGTH), '-reset_timestamps', '1',
+            str(chunks_dir / f"chunk_%03d.{STT_CHUNK_EXT}")
         ]
+        subprocess.run(cmd_audio, check=True)
+
+        # 3. Golden Frames via seeks em keyframes (1 a cada 5 min)
+        print("📸 Extraindo Golden Frames para a Batalha de Capas...")
+        duration = self._probe_duration(video_path)
+        instants = list(range(0, max(1, int(duration)), FRAME_INTERVAL))
+        cmd_frames = ['ffmpeg', '-y']
+        for t in instants:
+            # Cada instante é uma entrada com seek próprio: só keyframes são decodificados
+            cmd_frames += ['-skip_frame', 'nokey', '-noaccurate_seek', '-ss', str(t), '-i', video_path]
+        for i, _ in enumerate(instants):
+            cmd_frames += [
+                '-map', f'{i}:v:0', '-frames:v', '1', '-q:v', '2',
+                f'{self.output_dir}/frames/frame_{i + 1:03d}.jpg'
+            ]
         subprocess.run(cmd_frames, check=True)
-        
-        return video_path, audio_hq
 
-    def stage_1_archive_org(self, audio_path, title):
+        chunks = sorted(chunks_dir.glob(f"chunk_*.{STT_CHUNK_EXT}"))
+        return video_path, audio_hq, chunks
+
+    def _archive_identifier(self):
+        """Identificador do item no Archive.org (conhecido antes do upload terminar)."""
+        return f"vana-forja-{datetime.now().strftime('%Y%m%d-%H%M')}"
+
+    def stage_1_archive_org(self, audio_path, title, identifier=None):
         """Envia o áudio HQ para o Archive.org (Preservação Eterna)."""
         print("🏛️ [STAGE 1] Fazendo upload para Archive.org...")
-        identifier = f"vana-forja-{datetime.now().strftime('%Y%m%d-%H%M')}"
+        identifier = identifier or self._archive_identifier()
         meta = {'title': title, 'mediatype': 'audio', 'collection': 'opensource_audio'}
         
         # Requer IA_ACCESS_KEY e IA_SECRET_KEY configurados no ambiente
         ia_upload(identifier, files=[audio_path], metadata=meta)
         return f"https://archive.org/details/{identifier}"
 
-    def stage_2_google_drive(self, video_path, folder_name):
-        """Envia o Master para o Google Drive da Tour."""
+    def stage_2_google_drive(self, video_path, folder_name, job_key=None):
+        """
+        Envia o Master para o Google Drive da Tour (upload resumível e checkpointado).
+        :param job_key: Identidade do job; a sessão resumível é reencontrada por ela, não pelo mtime
+        """
         print("🚀 [STAGE 2] Enviando Vídeo Master para o Google Drive...")
         # Lógica de Service Account
         creds_json = os.getenv('GDRIVE_SERVICE_ACCOUNT_JSON')
         info = json.loads(creds_json)
-        creds = service_account.Credentials.from_service_account_info(info)
-        service = build('drive', 'v3', credentials=creds)
 
         file_metadata = {
             'name': f"{folder_name}_MASTER.mp4",
             'parents': [os.getenv('GDRIVE_FOLDER_ID')]
         }
-        service.files().create(body=file_metadata, media_body=video_path).execute()
-
-    def run(self, video_url, post_id=None):
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M")
-        folder_name = f"aula_{timestamp}"
+        last_pct = [-1]
 
-        # --- PRESERVAÇÃO ---
-        video_master, audio_hq = self.stage_0_preservation(video_url, folder_name)
-        archive_url = self.stage_1_archive_org(audio_hq, folder_name)
-        self.stage_2_google_drive(video_master, folder_name)
+        def progress(sent, total):
+            pct = int(sent * 100 / max(1, total))
+            if pct // 10 != last_pct[0] // 10:
+                print(f"   ⬆️  Drive: {pct}% ({sent / 1e6:.0f}/{total / 1e6:.0f} MB)")
+            last_pct[0] = pct
 
-        # --- INTELIGÊNCIA TEOLÓGICA ---
-        # Busca conceitos dinâmicos da Planilha/Supabase para injetar no Editor
-        print("🧠 Buscando vocabulário canônico no Supabase...")
-        conceitos = self.db.client.table("vana_conceitos").select("*").execute()
-        dicionario_sangha = {c['slug']: c['tag_iast'] for c in conceitos.data}
+        upload = ResumableUpload(
+            video_path, file_metadata,
+            token_provider=service_account_token_provider(info),
+            chunk_size=DRIVE_CHUNK_MB * 1024 * 1024,
+            on_progress=progress,
+            mime_type="video/mp4",
+            content_id=job_key,
+        )
+        return upload.upload().get("id")
 
-        # --- TRANSCRIÇÃO & EDIÇÃO ---
-        print("✍️ Iniciando Transcrição e Refino Editorial V19...")
-        transcription = VanaTranscriber().process(audio_hq)
-        
-        # O Editor agora recebe o dicionário para não 'inventar' tags
-        editor = VanaEditor(dicionario=dicionario_sangha)
-        content_v19 = editor.refine(transcription, metadata={"archive_url": archive_url})
+    def fetch_vocabulary(self):
+        """Conceitos do snapshot local (sincronizado de forma incremental com o Supabase)."""
+        print("🧠 Carregando vocabulário canônico...")
+        return VocabularyStore(db=self.db).concepts()
 
-        # --- FINALIZAÇÃO ---
+    def publish(self, content_v19, post_id=None):
+        """Cria ou atualiza o post no WordPress."""
         if post_id:
             print(f"🆙 Atualizando post existente {post_id} no WordPress...")
             self.wp.update_post(post_id, content_v19)
         else:
             print("🆕 Criando novo rascunho Diamond no WordPress...")
             post_id = self.wp.create_post(content_v19, status="draft")
+        return post_id
 
-        # Salva o rastro no Supabase para a Fábrica de Reels
-        self.db.save_aula_processada(post_id, archive_url, transcription)
-        
+    def build_stages(self, video_url, post_id, folder_name, identifier, job_key=None):
+        """
+        Declara a Forja como grafo. Só o Editor depende da transcrição; uploads,
+        vocabulário e STT correm em paralelo assim que suas entradas existem.
+        """
+        # A URL é determinística: o Editor não precisa esperar o upload terminar
+        # (mas a publicação espera, para nunca expor um link de preservação morto)
+        archive_url = f"https://archive.org/details/{identifier}"
+
+        def transcription(d):
+            print("✍️ Iniciando Transcrição...")
+            _, _, stt_chunks = d["preservation"]
+            # Path() garante o tipo também quando a saída vem do manifesto (resume)
+            return transcribe_files([Path(c) for c in stt_chunks])["content"]
+
+        def editing(d):
+            print("✍️ Iniciando Refino Editorial V19...")
+            # O Editor agora recebe o dicionário para não 'inventar' tags
+            editor = VanaEditor(dicionario=d["vocabulary"])
+            return editor.refine(d["transcription"], metadata={"archive_url": archive_url})
+
+        def finishing(d):
+            # Reparo, REFs e mineração de passagens numa única varredura do texto editado
+            edited = d["editing"]
+            text = edited.get("text", "") if isinstance(edited, dict) else edited
+            return run_chain(post_id, content=text)
+
+        def publish(d):
+            final_text = Path(d["finishing"]["output_file"]).read_text(encoding="utf-8")
+            return self.publish(final_text, post_id)
+
+        def register(d):
+            # Salva o rastro no Supabase para a Fábrica de Reels: aula + passagens numa só transação.
+            # As passagens já saíram da cadeia fundida; o post_id só é conhecido após a publicação
+            passagens = [{**p, "wp_post_id": d["publish"]}
+                         for p in read_json(Path(d["finishing"]["passages_file"]), [])]
+            return self.db.save_aula_processada(d["publish"], d["archive"], d["transcription"], passagens)
+
+        return [
+            # --- PRESERVAÇÃO ---
+            Stage("preservation", lambda d: self.stage_0_preservation(video_url, folder_name)),
+            Stage("archive", lambda d: self.stage_1_archive_org(d["preservation"][1], folder_name, identifier),
+                  deps=["preservation"]),
+            Stage("drive", lambda d: self.stage_2_google_drive(d["preservation"][0], folder_name, job_key),
+                  deps=["preservation"], critical=False),
+            # --- INTELIGÊNCIA TEOLÓGICA ---
+            Stage("vocabulary", lambda d: self.fetch_vocabulary()),
+            # --- TRANSCRIÇÃO & EDIÇÃO ---
+            Stage("transcription", transcription, deps=["preservation"]),
+            Stage("editing", editing, deps=["transcription", "vocabulary"]),
+            # --- FINALIZAÇÃO ---
+            Stage("finishing", finishing, deps=["editing"]),
+            # O post embute o link do Archive: só publica depois que o upload deu certo
+            Stage("publish", publish, deps=["finishing", "archive"]),
+            Stage("register", register, deps=["publish", "archive", "transcription", "finishing"]),
+        ]
+
+    def _checkpointed(self, stage, manifest):
+        """Envolve o estágio: pula se já verificado no manifesto, registra ao concluir."""
+        def fn(d):
+            if manifest.resume and manifest.verified(stage.name):
+                print(f"⏭️  [RESUME] Estágio '{stage.name}' já concluído e verificado.")
+                return manifest.get(stage.name)
+            value = stage.fn(d)
+            manifest.record(stage.name, value)
+            return value
+        return Stage(stage.name, fn, stage.deps, stage.critical)
+
+    def run(self, video_url, post_id=None, resume=False):
+        manifest = JobManifest(video_url, {"post_id": post_id}, resume=resume)
+        print(f"📒 Manifesto do job: {manifest.path}{' (resume)' if resume else ''}")
+
+        # Nomes fixados na primeira execução para que o resume aponte para os mesmos destinos
+        timestamp = manifest.context("timestamp", datetime.now().strftime("%Y%m%d_%H%M"))
+        folder_name = f"aula_{timestamp}"
+        identifier = manifest.context("archive_identifier", self._archive_identifier())
+
+        stages = [
+            self._checkpointed(s, manifest)
+            for s in self.build_stages(video_url, post_id, folder_name, identifier, manifest.key)
+        ]
+        graph = StageGraph(stages, max_workers=STAGE_WORKERS)
+        results = graph.run()
+
+        report = graph.report()
+        merge_stats("stages", report)
+        # Gasto de IA desta execução, por estágio e por modelo
+        costs = BudgetLedger().breakdown()
+        merge_stats("costs", costs)
+        print(f"💰 Custo de IA da execução: ${costs['total_usd']:.4f}")
+        print(f"⏱️  Caminho crítico: {' → '.join(report['critical_path'])} "
+              f"({report['critical_path_s']}s de {report['wall_clock_s']}s totais; "
+              f"soma serial seria {report['sum_of_stages_s']}s)")
+
+        if graph.failed:
+            raise RuntimeError(f"Estágios não concluídos: {', '.join(graph.failed)}")
+
+        post_id = results["publish"].value
         print(f"✅ PROCESSO CONCLUÍDO! Post ID: {post_id}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--url", required=True)
     parser.add_argument("--post_id", required=False)
+    parser.add_argument("--resume", action="store_true",
+                        help="Pula estágios já concluídos e verificados no manifesto do job")
     args = parser.parse_args()
 
     orchestrator = VanaOrchestrator()
-    orchestrator.run(args.url, args.post_id)
\ No newline at end of file
+    orchestrator.run(args.url, args.post_id, resume=args.resume)
\ No newline at end of file